@@ -0,0 +1,158 @@
+"""
+SQLite storage backend for uagents' ``ctx.storage``.
+
+The stock KeyValueStore rewrites the agent's whole ``<address>_data.json`` on
+every ``set``. SQLiteStorage implements the same StorageAPI but writes one row
+per key. Writes land in an in-memory cache right away and are group-committed
+by a flusher thread, so a burst of ``set`` calls costs one transaction and one
+fsync, and agent handlers never wait for the disk. Existing JSON stores are
+imported on first open.
+
+    AGENT_STORAGE=json                  # keep the stock whole-file JSON store
+    AGENT_STORAGE_FLUSH_INTERVAL=0.05   # max seconds a write waits to be committed
+    AGENT_STORAGE_BATCH_SIZE=256        # commit early once this many keys are dirty
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from uagents.storage import StorageAPI
+
+AGENT_STORAGE = os.getenv("AGENT_STORAGE", "sqlite")
+AGENT_STORAGE_DIR = os.getenv("AGENT_STORAGE_DIR", os.path.dirname(os.path.abspath(__file__)))
+AGENT_STORAGE_FLUSH_INTERVAL = float(os.getenv("AGENT_STORAGE_FLUSH_INTERVAL", "0.05"))
+AGENT_STORAGE_BATCH_SIZE = int(os.getenv("AGENT_STORAGE_BATCH_SIZE", "256"))
+
+_DELETED = object()
+
+logger = logging.getLogger("agent_storage")
+
+
+class SQLiteStorage(StorageAPI):
+    """Key-value agent storage with O(1) writes and batched commits"""
+
+    def __init__(self, name: str, cwd: Optional[str] = None,
+                 flush_interval: float = AGENT_STORAGE_FLUSH_INTERVAL,
+                 batch_size: int = AGENT_STORAGE_BATCH_SIZE):
+        cwd = cwd or AGENT_STORAGE_DIR
+        self.path = os.path.join(cwd, f"{name}_data.db")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.commits = 0
+
+        # _lock guards the in-memory state and is never held across disk I/O;
+        # _write_lock keeps batches reaching SQLite in the order they were taken
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._full = threading.Event()
+        self._pending: Dict[str, Any] = {}
+        self._cleared = False
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        self._data = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM kv")}
+        if not self._data:
+            self._import_json(os.path.join(cwd, f"{name}_data.json"))
+
+        threading.Thread(target=self._flush_loop, name=f"storage-{name}", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _import_json(self, json_path: str):
+        """One-off migration from the stock KeyValueStore file"""
+        if not os.path.isfile(json_path):
+            return
+        with open(json_path, encoding="utf-8") as f:
+            data = json.load(f)
+        for key, value in data.items():
+            self.set(key, value)
+        self.flush()
+
+    # StorageAPI
+
+    def get(self, key: str) -> Any | None:
+        return self._data.get(key)
+
+    def has(self, key: str) -> bool:
+        return key in self._data
+
+    def set(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)  # fail fast on values the JSON store could not hold either
+        with self._lock:
+            self._data[key] = value
+            self._pending[key] = encoded
+            pending = len(self._pending)
+        self._dirty.set()
+        if pending >= self.batch_size:
+            # Commit early, but on the flusher thread: set() never waits for the disk
+            self._full.set()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._pending[key] = _DELETED
+        self._dirty.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._pending.clear()
+            self._cleared = True
+        self._dirty.set()
+        self._full.set()
+
+    # Group commit
+
+    def flush(self):
+        """Commit every pending write in one transaction"""
+        with self._write_lock:
+            # Only the swap happens under _lock; writers keep going during the commit
+            with self._lock:
+                if not self._pending and not self._cleared:
+                    return
+                pending, self._pending = self._pending, {}
+                cleared, self._cleared = self._cleared, False
+            with self._conn:
+                if cleared:
+                    self._conn.execute("DELETE FROM kv")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                    [(key, value) for key, value in pending.items() if value is not _DELETED],
+                )
+                self._conn.executemany(
+                    "DELETE FROM kv WHERE key = ?",
+                    [(key,) for key, value in pending.items() if value is _DELETED],
+                )
+            self.commits += 1
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            # Let concurrent writers join the batch before committing, unless it is already full
+            self._dirty.clear()
+            self._full.wait(self.flush_interval)
+            self._full.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Agent storage flush error")
+
+
+def use_agent_storage(agent) -> StorageAPI:
+    """Swap the agent's JSON KeyValueStore for SQLiteStorage (unless AGENT_STORAGE=json)"""
+    if AGENT_STORAGE == "json":
+        return agent.storage
+    storage = SQLiteStorage(agent.address[0:16])
+    agent._storage = storage
+    # The envelope history keeps its own reference when message history is stored
+    history = getattr(agent, "_message_history", None)
+    if history is not None and getattr(history, "_storage", None) is not None:
+        history._storage = storage
+    return storage
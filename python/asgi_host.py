@@ -0,0 +1,91 @@
+"""
+Single-process hosting for uagents agents and a FastAPI app.
+
+The agent envelope endpoint (``/submit`` and the other uagents endpoints, plus
+any REST handlers registered on the agent) and the FastAPI routes are served by
+one ASGI app on one uvicorn server. Agent handlers and HTTP handlers run on the
+same asyncio loop, so they can call each other directly.
+"""
+
+import asyncio
+from typing import Any, List
+
+import uvicorn
+
+from loop_watchdog import watch_loop
+from structured_logging import UVICORN_LOGGERS, adopt_loggers
+
+try:
+    from uagents.asgi import RESERVED_ENDPOINTS
+except ImportError:  # older uagents releases only expose /submit
+    RESERVED_ENDPOINTS = ["/submit"]
+
+
+# Private Bureau attributes serve_bureau_async depends on (uagents 0.22)
+_BUREAU_INTERNALS = ("_agents", "_server", "_registration_policy", "_schedule_registration")
+
+
+class AgentASGIApp:
+    """Routes agent traffic to the uagents server and everything else to the API"""
+
+    def __init__(self, agent_server: Any, api: Any):
+        self.agent_server = agent_server
+        self.api = api
+        self.agent_paths = set(RESERVED_ENDPOINTS)
+        # REST handlers registered with @agent.on_rest_get/on_rest_post
+        self.agent_paths.update(
+            endpoint for _, _, endpoint in getattr(agent_server, "_rest_handler_map", {})
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.agent_paths:
+            await self.agent_server(scope, receive, send)
+        else:
+            await self.api(scope, receive, send)
+
+
+async def serve_async(agents: List[Any], agent_server: Any, api: Any,
+                      host: str = "127.0.0.1", port: int = 8000,
+                      log_level: str = "info"):
+    """Start the agents on the running loop and serve them together with ``api``"""
+    loop = asyncio.get_running_loop()
+    for agent in agents:
+        agent.update_loop(loop)
+        agent.setup()
+    watch_loop(agents[0].name if len(agents) == 1 else "bureau", loop)
+
+    config = uvicorn.Config(
+        AgentASGIApp(agent_server, api), host=host, port=port, log_level=log_level
+    )
+    # uvicorn.Config installs its own handlers; route them and ctx.logger through the queue
+    adopt_loggers(*UVICORN_LOGGERS, *(agent._logger for agent in agents))
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        for agent in agents:
+            await agent.run_shutdown_tasks()
+
+
+async def serve_bureau_async(bureau, api: Any, host: str = "127.0.0.1", port: int = 8000,
+                             log_level: str = "info"):
+    """Serve every agent of a uagents Bureau plus ``api`` behind one port"""
+    # Mirrors Bureau.run_async, minus the bureau's own uvicorn server. Bureau has no
+    # public hook for that, so this relies on its internals as of uagents 0.22
+    # (the release that ships uagents_core's chat protocol); re-check on upgrade.
+    missing = [name for name in _BUREAU_INTERNALS if not hasattr(bureau, name)]
+    if missing:
+        raise RuntimeError(f"Bureau internals changed ({', '.join(missing)} missing); "
+                           "run without --front-door or update serve_bureau_async")
+    for agent in bureau._agents:
+        bureau._registration_policy.add_agent(agent.info, agent._identity)
+    registration = asyncio.get_running_loop().create_task(bureau._schedule_registration())
+    try:
+        await serve_async(bureau._agents, bureau._server, api, host, port, log_level)
+    finally:
+        registration.cancel()
+
+
+def serve_agent_with_api(agent, api, host: str = "127.0.0.1", port: int = 8000,
+                         log_level: str = "info"):
+    """Blocking: serve one agent and its FastAPI app on a single port and loop"""
+    asyncio.run(serve_async([agent], agent._server, api, host, port, log_level))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: payment-channel micropayments against the local chain.
+
+Opens --channels channels from the buyer (one on-chain deposit each), then
+pushes --payments updates through the merchant's ChannelBook, the code the
+chat handler runs for every channel message. Reports the cost of an update
+and the throughput next to on-chain purchases, closes every channel and runs
+one batch settlement, then checks that each buyer refund equals the deposit
+minus what was spent.
+
+    python bench_channels.py --payments 20000
+    python bench_channels.py --channels 50 --deposit 20 --onchain 0
+"""
+
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_payment_flow import percentile, run_purchases, start_merchant_api  # noqa: E402
+from local_chain import LocalChain, LocalChainServer  # noqa: E402
+
+_tmp = tempfile.mkdtemp(prefix="bench_channels_")
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ["MERCHANT_DB"] = os.path.join(_tmp, "merchant_state.db")
+os.environ["AGENT_STORAGE_DIR"] = _tmp
+
+
+async def open_channels(count: int, deposit: int, unit: int, merchant_address: str, token: str):
+    import buyer
+
+    async with buyer.AsyncBuyerClient() as client:
+        return [await client.open_channel(token, merchant_address, deposit, unit) for _ in range(count)]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--payments", type=int, default=5000, help="updates in total, spread over the channels")
+    parser.add_argument("--deposit", type=int, default=1000, help="rUSDT per channel")
+    parser.add_argument("--unit", type=float, default=1.0, help="channel unit in rUSDT")
+    parser.add_argument("--item", default="2", help="item ID paid per update (must be priced in tokens)")
+    parser.add_argument("--onchain", type=int, default=200, help="on-chain purchases to compare against")
+    args = parser.parse_args(argv)
+
+    with LocalChainServer(LocalChain()) as server:
+        os.environ.update(server.env())
+        os.environ["MERCHANT_URL"] = start_merchant_api()
+
+        import merchant
+        from payment_channels import ChannelSettler
+
+        config = merchant.settings()
+        item_id = int(args.item) if args.item.isdigit() else args.item
+        price, _ = merchant.price_cart([item_id])
+        deposit, unit = args.deposit * 10**18, int(args.unit * 10**18)
+        book = merchant.get_channel_book()
+        chain = server.chain
+
+        wallets = asyncio.run(open_channels(args.channels, deposit, unit, config.merchant_address,
+                                            config.rusdt_contract))
+        for wallet in wallets:
+            reply = book.handle(wallet.open_metadata())
+            assert reply["channel"] == "opened", reply
+
+        per_channel = min(args.payments // len(wallets), deposit // price)
+        latencies = []
+        rejected = 0
+        rpc_before = chain.calls
+        start = time.perf_counter()
+        for _ in range(per_channel):
+            for wallet in wallets:
+                update = wallet.pay_metadata(price, [item_id])
+                began = time.perf_counter()
+                reply = book.handle(update)
+                latencies.append(time.perf_counter() - began)
+                if reply["channel"] != "accepted":
+                    rejected += 1
+                    wallet.sync(reply)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        accepted = len(latencies) - rejected
+        print(f"✅ {accepted}/{len(latencies)} channel payments over {len(wallets)} channels in {elapsed:.2f}s "
+              f"({accepted / elapsed:.0f} payments/s), {chain.calls - rpc_before} RPC calls")
+        print(f"update µs: p50 {percentile(latencies, 0.5) * 1e6:.0f}  p95 {percentile(latencies, 0.95) * 1e6:.0f}"
+              f"  p99 {percentile(latencies, 0.99) * 1e6:.0f}")
+
+        if args.onchain:
+            results, onchain_elapsed, _ = asyncio.run(run_purchases(args.onchain, 16, item_id))
+            ok = sum(1 for r in results if r.get("success"))
+            print(f"⛓️ on-chain: {ok / onchain_elapsed:.1f} purchases/s, "
+                  f"{accepted / elapsed / (ok / onchain_elapsed):.0f}x fewer than through channels")
+
+        refunds_before = chain.token_balance(wallets[0].commitment["buyer"])
+        for wallet in wallets:
+            book.handle(wallet.close_metadata())
+        settler = ChannelSettler(merchant.get_web3(), merchant.get_token(), merchant.get_store(), config.wallet_key)
+        start = time.perf_counter()
+        settler.settle_once()
+        chain.mine()
+        settled = settler.settle_once()
+        print(f"💸 {settled}/{len(wallets)} channels settled in one batch ({time.perf_counter() - start:.2f}s)")
+
+        expected = sum(wallet.remaining for wallet in wallets)
+        refunded = chain.token_balance(wallets[0].commitment["buyer"]) - refunds_before
+        print(f"🔁 buyer refunded {refunded / 10**18:g} rUSDT, expected {expected / 10**18:g} rUSDT")
+        if refunded != expected:
+            print("⚠️ refunds do not match the unspent deposits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chat-protocol throughput and latency between N clients and the merchant.
+
+The merchant agent and N synthetic client agents run locally with no Almanac
+registration and no Agentverse calls: only each agent's message queue and
+envelope dispenser are started. Each client keeps one ChatMessage in flight.
+It records the time to the merchant's ChatAcknowledgement and to its reply,
+acknowledges the reply (as a real client would), then sends the next message.
+
+    python bench_chat_protocol.py                       # 8 clients x 50 messages, both transports
+    python bench_chat_protocol.py --clients 32 --messages 200 --transport local
+    python bench_chat_protocol.py --text "buy item 1"   # route a different merchant intent
+
+Transports:
+    local  all agents in one process; messages go through the uagents dispatcher
+    http   the merchant in a child process on its own port; every message is a
+           signed envelope POSTed to /submit and verified on arrival
+"""
+
+import argparse
+import asyncio
+import atexit
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Child processes share the parent's scratch directory; the parent removes it
+_tmp = os.environ.get("BENCH_CHAT_TMP")
+if _tmp is None:
+    _tmp = os.environ["BENCH_CHAT_TMP"] = tempfile.mkdtemp(prefix="bench_chat_")
+    atexit.register(shutil.rmtree, _tmp, True)
+os.environ.setdefault("MERCHANT_PRIVATE_KEY", "bench-merchant-seed")
+os.environ.setdefault("MERCHANT_DB", os.path.join(_tmp, "merchant_state.db"))
+os.environ.setdefault("AGENT_STORAGE_DIR", _tmp)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from uagents import Agent, Protocol  # noqa: E402
+from uagents.resolver import RulesBasedResolver  # noqa: E402
+from uagents_core.contrib.protocols.chat import (  # noqa: E402
+    ChatAcknowledgement,
+    ChatMessage,
+    TextContent,
+    chat_protocol_spec,
+)
+from uagents_core.identity import Identity  # noqa: E402
+
+CLIENT_SEED = "bench-chat-client"
+DEFAULT_TEXT = "show me your products"
+
+
+def client_address(index: int) -> str:
+    return Identity.from_seed(f"{CLIENT_SEED}-{index}", 0).address
+
+
+def start_offline(agent: Agent, loop: asyncio.AbstractEventLoop, log_level: int):
+    """Start an agent's message queue and dispenser without registration or startup tasks"""
+    agent.update_loop(loop)
+    agent._logger.setLevel(log_level)
+    agent.start_message_dispenser()
+    agent.start_message_receivers()
+
+
+class ChatClient:
+    """Synthetic chat client with one message in flight at a time"""
+
+    def __init__(self, index: int, merchant_address: str, text: str,
+                 endpoint: Optional[str] = None, resolver=None):
+        self.merchant_address = merchant_address
+        self.text = text
+        self.agent = Agent(
+            name=f"bench-client-{index}",
+            seed=f"{CLIENT_SEED}-{index}",
+            endpoint=[endpoint] if endpoint else None,
+            resolve=resolver,
+            enable_agent_inspector=False,
+            publish_agent_details=False,
+            report_events=False,
+        )
+        proto = Protocol(spec=chat_protocol_spec)
+        proto.on_message(ChatMessage)(self.handle_reply)
+        proto.on_message(ChatAcknowledgement)(self.handle_ack)
+        self.agent.include(proto)
+        self.reset(0)
+
+    def reset(self, messages: int):
+        self.remaining = messages
+        self.ack_latencies: List[float] = []
+        self.reply_latencies: List[float] = []
+        self.sent_at = 0.0
+        self.done = asyncio.Event()
+
+    async def send_next(self, ctx):
+        if self.remaining == 0:
+            self.done.set()
+            return
+        self.remaining -= 1
+        self.sent_at = time.perf_counter()
+        await ctx.send(self.merchant_address, ChatMessage(content=[TextContent(type="text", text=self.text)]))
+
+    async def handle_ack(self, ctx, sender: str, msg: ChatAcknowledgement):
+        self.ack_latencies.append(time.perf_counter() - self.sent_at)
+
+    async def handle_reply(self, ctx, sender: str, msg: ChatMessage):
+        self.reply_latencies.append(time.perf_counter() - self.sent_at)
+        await ctx.send(sender, ChatAcknowledgement(acknowledged_msg_id=msg.msg_id))
+        await self.send_next(ctx)
+
+    async def start(self):
+        await self.send_next(self.agent._build_context())
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+
+def _latency(values: List[float]) -> str:
+    ordered = sorted(values)
+    return " / ".join(f"{percentile(ordered, q) * 1000:.2f}" for q in (0.5, 0.95, 0.99))
+
+
+async def drive(clients: List[ChatClient], messages: int, timeout: float) -> Optional[float]:
+    """Run ``messages`` round trips per client; returns the elapsed time or None on timeout"""
+    for client in clients:
+        client.reset(messages)
+    start = time.perf_counter()
+    await asyncio.gather(*(client.start() for client in clients))
+    try:
+        await asyncio.wait_for(asyncio.gather(*(client.done.wait() for client in clients)), timeout)
+    except asyncio.TimeoutError:
+        return None
+    return time.perf_counter() - start
+
+
+async def measure(transport: str, clients: List[ChatClient], messages: int, timeout: float):
+    # One warm-up round trip per client (first-use imports, connections, caches)
+    if await drive(clients, 1, timeout) is None:
+        print(f"❌ {transport}: no reply from the merchant within {timeout:g}s")
+        return
+    elapsed = await drive(clients, messages, timeout)
+    replies = sum(len(client.reply_latencies) for client in clients)
+    if elapsed is None:
+        print(f"⚠️ {transport}: only {replies} of {messages * len(clients)} replies within {timeout:g}s")
+        return
+    acks = [latency for client in clients for latency in client.ack_latencies]
+    reply_latencies = [latency for client in clients for latency in client.reply_latencies]
+    print(f"{transport:6} {len(clients):4} clients  {replies / elapsed:9.1f} msg/s   "
+          f"ack p50/p95/p99 {_latency(acks)} ms   reply p50/p95/p99 {_latency(reply_latencies)} ms")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout:g}s")
+
+
+def run_local(args, log_level: int):
+    import merchant
+
+    merchant_agent = merchant.get_merchant_agent()
+    clients = [ChatClient(i, merchant_agent.address, args.text) for i in range(args.clients)]
+    # A fresh loop: tasks the agents queued at construction (manifest publishing) never run
+    loop = asyncio.new_event_loop()
+    for agent in [merchant_agent] + [client.agent for client in clients]:
+        start_offline(agent, loop, log_level)
+    loop.run_until_complete(measure("local", clients, args.messages, args.timeout))
+    loop.close()
+
+
+def run_http(args, log_level: int):
+    import merchant
+    from uagents.asgi import ASGIServer
+
+    merchant_port, client_port = _free_port(), _free_port()
+    client_endpoint = f"http://127.0.0.1:{client_port}/submit"
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve-merchant", str(merchant_port),
+         "--client-endpoint", client_endpoint, "--clients", str(args.clients)]
+        + (["--agent-logs"] if args.agent_logs else []),
+        env={**os.environ, "MERCHANT_AGENT_PORT": str(merchant_port)},
+    )
+    try:
+        _wait_for_port(merchant_port)
+        merchant_address = merchant.merchant_agent_address()
+        resolver = RulesBasedResolver({merchant_address: f"http://127.0.0.1:{merchant_port}/submit"})
+        clients = [ChatClient(i, merchant_address, args.text, client_endpoint, resolver)
+                   for i in range(args.clients)]
+
+        loop = asyncio.new_event_loop()
+        for client in clients:
+            start_offline(client.agent, loop, log_level)
+        # One envelope server for every client, as a Bureau would run
+        server = ASGIServer(port=client_port, loop=loop, queries={})
+        serve_task = loop.create_task(server.serve())
+        loop.run_until_complete(asyncio.to_thread(_wait_for_port, client_port))
+        loop.run_until_complete(measure("http", clients, args.messages, args.timeout))
+        server.server.should_exit = True
+        loop.run_until_complete(serve_task)
+        loop.close()
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def serve_merchant(port: int, client_endpoint: str, clients: int, log_level: int):
+    """Child process for --transport http: the merchant agent alone on ``port``"""
+    import merchant
+
+    merchant_agent = merchant.get_merchant_agent()
+    merchant_agent._resolver = RulesBasedResolver({client_address(i): client_endpoint for i in range(clients)})
+    loop = asyncio.new_event_loop()
+    start_offline(merchant_agent, loop, log_level)
+    try:
+        loop.run_until_complete(merchant_agent._server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=50, help="round trips per client")
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="message the clients send")
+    parser.add_argument("--transport", choices=("local", "http", "both"), default="both")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--agent-logs", action="store_true",
+                        help="keep the agents' per-message INFO logs (off: they would dominate the timings)")
+    parser.add_argument("--serve-merchant", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--client-endpoint", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    log_level = logging.INFO if args.agent_logs else logging.WARNING
+    if args.serve_merchant:
+        serve_merchant(args.serve_merchant, args.client_endpoint, args.clients, log_level)
+        return
+
+    if args.transport == "both":
+        # The uagents dispatcher is process-wide, so each transport gets a fresh process
+        for transport in ("local", "http"):
+            subprocess.run([sys.executable, os.path.abspath(__file__),
+                            *(sys.argv[1:] if argv is None else argv), "--transport", transport])
+        return
+
+    print(f"{args.clients} clients x {args.messages} messages: {args.text!r}")
+    if args.transport == "local":
+        run_local(args, log_level)
+    else:
+        run_http(args, log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Benchmark: throughput and latency of the merchant and alice HTTP APIs.
+
+Each scenario is driven in-process, either straight into the FastAPI app over
+httpx's ASGI transport (handler cost only) or through a real uvicorn server on
+localhost (adds sockets and HTTP parsing). Chain RPC is replaced by
+MockRPCProvider, which answers every receipt lookup with a matching rUSDT
+transfer after --rpc-latency-ms.
+
+    python bench_http.py                          # both transports, every scenario
+    python bench_http.py --transport asgi goods purchase
+    python bench_http.py --save-baseline          # record bench_baselines/bench_http.json
+    python bench_http.py --tolerance 0.3          # fail on >30% p95 / throughput regressions
+
+Runs are compared with the saved baseline when one exists; the exit status is
+1 when any scenario regressed. Baselines are machine-specific.
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmp = tempfile.mkdtemp(prefix="bench_http_")
+# Registered first, so it runs after the stores have flushed at exit
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ.setdefault("MERCHANT_PRIVATE_KEY", "bench-merchant-seed")
+os.environ.setdefault("MERCHANT_ADDRESS", "0x" + "33" * 20)
+os.environ.setdefault("RUSDT_CONTRACT", "0x" + "22" * 20)
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:1")
+os.environ["MERCHANT_DB"] = os.path.join(_tmp, "merchant_state.db")
+os.environ["AGENT_STORAGE_DIR"] = _tmp
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx  # noqa: E402
+from web3.providers.base import BaseProvider  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines", "bench_http.json")
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+ITEM_AMOUNT = 5 * 10**18  # item 1, the Crypto Hoodie
+
+
+def _word(value: int) -> str:
+    return "0x" + f"{value:064x}"
+
+
+class MockRPCProvider(BaseProvider):
+    """Answers chain calls locally: every transaction pays ITEM_AMOUNT to the merchant"""
+
+    def __init__(self, token: str, merchant: str, latency: float = 0.0):
+        super().__init__()
+        self.token = token
+        self.merchant = merchant
+        self.latency = latency
+        self.calls = 0
+
+    def _receipt(self, tx_hash: str) -> Dict[str, Any]:
+        block_hash = "0x" + "ab" * 32
+        return {
+            "transactionHash": tx_hash, "transactionIndex": "0x0",
+            "blockHash": block_hash, "blockNumber": "0x1",
+            "from": "0x" + "11" * 20, "to": self.token,
+            "cumulativeGasUsed": "0xc350", "gasUsed": "0xc350", "effectiveGasPrice": "0x1",
+            "contractAddress": None, "logsBloom": "0x" + "00" * 256, "status": "0x1", "type": "0x0",
+            "logs": [{
+                "address": self.token,
+                "topics": [TRANSFER_TOPIC, _word(0x11), _word(int(self.merchant, 16))],
+                "data": _word(ITEM_AMOUNT),
+                "blockNumber": "0x1", "blockHash": block_hash,
+                "transactionHash": tx_hash, "transactionIndex": "0x0",
+                "logIndex": "0x0", "removed": False,
+            }],
+        }
+
+    def make_request(self, method, params):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "eth_getTransactionReceipt":
+            result = self._receipt(params[0])
+        elif method == "eth_chainId":
+            result = "0x1f"
+        else:
+            return {"jsonrpc": "2.0", "id": self.calls, "error": {"code": -32601, "message": f"{method} not mocked"}}
+        return {"jsonrpc": "2.0", "id": self.calls, "result": result}
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+class Scenario(NamedTuple):
+    name: str
+    app: str
+    method: str
+    path: str
+    body: Optional[Callable[[int], Dict[str, Any]]]
+
+
+SCENARIOS = [
+    Scenario("goods", "merchant", "GET", "/goods", None),
+    Scenario("merchant_chat", "merchant", "POST", "/api/chat",
+             lambda i: {"message": "show me your products", "user_id": "bench"}),
+    Scenario("alice_chat", "alice", "POST", "/api/chat",
+             lambda i: {"message": "what is defi?", "user_id": "bench"}),
+    Scenario("purchase", "merchant", "POST", "/purchase", lambda i: {"item_id": 1}),
+    # A fresh tx hash per request, so each one is verified against the (mocked) chain
+    Scenario("retry_purchase", "merchant", "POST", "/retry_purchase",
+             lambda i: {"tx_hash": "0x" + os.urandom(32).hex(), "amount": ITEM_AMOUNT}),
+]
+
+
+def load_apps(rpc_latency: float) -> Dict[str, Any]:
+    from web3 import Web3
+
+    import merchant
+    import my_first_agent
+
+    config = merchant.settings()
+    w3 = Web3(MockRPCProvider(config.rusdt_contract, config.merchant_address, rpc_latency))
+    merchant.get_web3 = lambda: w3
+    return {"merchant": merchant.app, "alice": my_first_agent.app}
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario,
+                       requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    issued = 0
+
+    async def worker():
+        nonlocal errors, issued
+        while issued < requests:
+            i = issued
+            issued += 1
+            body = scenario.body(i) if scenario.body else None
+            start = time.perf_counter()
+            resp = await client.request(scenario.method, scenario.path, json=body)
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                errors += 1
+
+    # Warm-up: first-call imports and caches are not what we measure
+    for i in range(min(20, requests)):
+        await client.request(scenario.method, scenario.path,
+                             json=scenario.body(i) if scenario.body else None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "errors": errors,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """A real uvicorn server for ``app`` on a free localhost port, in a thread"""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.port = _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False, lifespan="off",
+        ))
+        self.thread = threading.Thread(target=self.server.run, name="bench-uvicorn", daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def _client(base_url: str, concurrency: int, transport=None) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30.0)
+
+
+async def run_transport(transport: str, apps: Dict[str, Any], scenarios: List[Scenario],
+                        requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for scenario in scenarios:
+        app = apps[scenario.app]
+        if transport == "asgi":
+            async with _client("http://bench", concurrency, httpx.ASGITransport(app=app)) as client:
+                results[scenario.name] = await run_scenario(client, scenario, requests, concurrency)
+        else:
+            with LocalServer(app) as base_url:
+                async with _client(base_url, concurrency) as client:
+                    results[scenario.name] = await run_scenario(client, scenario, requests, concurrency)
+        _print_row(transport, scenario.name, results[scenario.name])
+    return results
+
+
+def _print_row(transport: str, name: str, result: Dict[str, float], note: str = ""):
+    print(f"{transport:8} {name:15} {result['rps']:9.1f} req/s   p50 {result['p50_ms']:8.2f}ms   "
+          f"p95 {result['p95_ms']:8.2f}ms   p99 {result['p99_ms']:8.2f}ms   errors {result['errors']}{note}")
+
+
+def compare(results: Dict[str, Dict[str, Dict[str, float]]], baseline: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    """Scenarios whose p95 rose or throughput fell by more than ``tolerance``"""
+    regressions = []
+    for transport, scenarios in results.items():
+        for name, result in scenarios.items():
+            base = baseline.get(transport, {}).get(name)
+            if base is None:
+                continue
+            if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{transport}/{name}: p95 {base['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+            if result["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"{transport}/{name}: {base['rps']:.1f} -> {result['rps']:.1f} req/s")
+            if result["errors"] > base.get("errors", 0):
+                regressions.append(f"{transport}/{name}: {result['errors']} errors")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"subset of: {', '.join(s.name for s in SCENARIOS)}")
+    parser.add_argument("--transport", choices=("asgi", "uvicorn", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rpc-latency-ms", type=float, default=5.0)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - {s.name for s in SCENARIOS}
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    transports = ("asgi", "uvicorn") if args.transport == "both" else (args.transport,)
+
+    apps = load_apps(args.rpc_latency_ms / 1000)
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, "
+          f"mocked RPC latency {args.rpc_latency_ms:g}ms")
+    results = {
+        transport: asyncio.run(run_transport(transport, apps, scenarios, args.requests, args.concurrency))
+        for transport in transports
+    }
+
+    if args.save_baseline:
+        baseline: Dict[str, Any] = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        for transport, scenario_results in results.items():
+            baseline.setdefault(transport, {}).update(scenario_results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print("ℹ️ No baseline to compare with; record one with --save-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"⚠️ Regression: {regression}")
+    if not regressions:
+        print(f"✅ Within {args.tolerance:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the full purchase -> pay -> verify loop against the local chain.
+
+Starts a LocalChain JSON-RPC server and the merchant API (uvicorn, in a
+thread) in this process, points the buyer and merchant at them, and runs
+purchases concurrently through AsyncBuyerClient. Reports throughput, latency
+per stage and RPC calls per purchase. It then checks that every payment the
+merchant accepted is still on the chain: with --reorg-drop, transfers the
+merchant verified can vanish.
+
+    python bench_payment_flow.py --purchases 2000 --concurrency 32
+    python bench_payment_flow.py --latency-ms 20 --error-rate 0.02 --reorg-every 10
+"""
+
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_chain import Faults, LocalChain, LocalChainServer  # noqa: E402
+
+_tmp = tempfile.mkdtemp(prefix="bench_payment_")
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ.setdefault("MERCHANT_PRIVATE_KEY", "bench-merchant-seed")
+os.environ["MERCHANT_DB"] = os.path.join(_tmp, "merchant_state.db")
+os.environ["AGENT_STORAGE_DIR"] = _tmp
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("RECEIPT_POLL_INITIAL", "0.05")
+os.environ.setdefault("RECEIPT_POLL_MAX", "0.5")
+
+STAGES = ("quote", "send", "receipt", "verify", "total")
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+
+def _verified(result: Dict[str, Any]) -> bool:
+    return bool(result.get("success")) and result["verification"].get("status") == "success"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_merchant_api() -> str:
+    import uvicorn
+
+    import merchant
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        merchant.app, host="127.0.0.1", port=port, log_level="warning", access_log=False, lifespan="off",
+    ))
+    threading.Thread(target=server.run, name="bench-merchant", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def run_purchases(purchases: int, concurrency: int,
+                        item_id) -> Tuple[List[Dict[str, Any]], float, Dict[str, Any]]:
+    import buyer
+
+    results: List[Dict[str, Any]] = []
+    slots = asyncio.Semaphore(concurrency)
+    async with buyer.AsyncBuyerClient(max_connections=concurrency) as client:
+        # Warm-up: connection pool, chain ID, gas price and gas estimate caches
+        warm_up = await client.buy_item(item_id)
+
+        async def one():
+            async with slots:
+                results.append(await client.buy_item(item_id))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(purchases)))
+        return results, time.perf_counter() - start, warm_up
+
+
+def report(results: List[Dict[str, Any]], elapsed: float, warm_up: Dict[str, Any], chain: LocalChain,
+           rpc_calls: int):
+    import merchant
+
+    succeeded = [r for r in results if _verified(r)]
+    failures = Counter((r.get("error") or r.get("verification", {}).get("message", "?"))[:60]
+                       for r in results if not _verified(r))
+    print(f"✅ {len(succeeded)}/{len(results)} purchases verified in {elapsed:.2f}s "
+          f"({len(succeeded) / elapsed:.1f} purchases/s), {rpc_calls / (len(results) + 1):.1f} RPC calls each")
+    for reason, count in failures.most_common(5):
+        print(f"❌ {count} x {reason}")
+
+    print("stage        p50 ms    p95 ms    p99 ms")
+    for stage in STAGES:
+        values = sorted(r["timings"][stage] for r in succeeded if stage in r.get("timings", {}))
+        if values:
+            print(f"{stage:9} {percentile(values, 0.5) * 1000:9.2f} {percentile(values, 0.95) * 1000:9.2f} "
+                  f"{percentile(values, 0.99) * 1000:9.2f}")
+
+    # Every payment the merchant accepted should still be a transfer on the canonical chain
+    config = merchant.settings()
+    paid_on_chain = chain.token_balance(config.merchant_address)
+    accepted = sum(r["amount"] for r in succeeded + [warm_up] if _verified(r))
+    print(f"⛓️ {chain.head.number} blocks, {chain.reorgs} reorgs; merchant holds "
+          f"{paid_on_chain / 10**18:g} rUSDT for {accepted / 10**18:g} rUSDT of verified purchases")
+    if paid_on_chain < accepted:
+        print(f"⚠️ {(accepted - paid_on_chain) / 10**18:g} rUSDT of verified payments are no longer on chain")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--item", default="1", help="item ID to buy (must be priced in tokens)")
+    parser.add_argument("--block-time", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--reorg-every", type=int, default=0)
+    parser.add_argument("--reorg-depth", type=int, default=1)
+    parser.add_argument("--reorg-drop", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    faults = Faults(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                    reorg_every=args.reorg_every, reorg_depth=args.reorg_depth,
+                    reorg_drop=args.reorg_drop, seed=args.seed)
+    chain = LocalChain(faults, block_time=args.block_time)
+    with LocalChainServer(chain) as server:
+        os.environ.update(server.env())
+        os.environ["MERCHANT_URL"] = start_merchant_api()
+        item_id = int(args.item) if args.item.isdigit() else args.item
+
+        print(f"{args.purchases} purchases, concurrency {args.concurrency}, chain {server.url} "
+              f"(latency {args.latency_ms:g}ms, error rate {args.error_rate:g}, reorg every {args.reorg_every})")
+        results, elapsed, warm_up = asyncio.run(run_purchases(args.purchases, args.concurrency, item_id))
+        report(results, elapsed, warm_up, chain, chain.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: critical-path cost of a buyer payment with and without the
+pre-signed transaction pool.
+
+Runs fully offline: chain parameters are pre-seeded so no RPC is made, and
+``send_raw_transaction`` is left out because it costs the same either way.
+
+    python bench_presign.py [iterations]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+# buyer.py needs a key to sign with; any dev key works for an offline benchmark
+os.environ.setdefault("BUYER_PRIVATE_KEY", "0x" + "11" * 32)
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:8545")
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import buyer  # noqa: E402
+
+TOKEN = "0x" + "22" * 20
+RECIPIENT = "0x" + "33" * 20
+AMOUNT = 5 * 10**18
+
+
+def make_chain() -> buyer.ChainParams:
+    chain = buyer.ChainParams(buyer.get_web3(), buyer.buyer_address())
+    chain._chain_id = 31
+    chain._gas_price = 60_000_000
+    chain._nonce = 0
+    chain._transfer_gas[TOKEN.lower()] = 60_000
+    return chain
+
+
+def sign_inline(chain: buyer.ChainParams) -> bytes:
+    """What buy_item does on a pool miss"""
+    tx = chain.token(TOKEN).functions.transfer(RECIPIENT, AMOUNT).build_transaction({
+        "chainId": chain.chain_id,
+        "gas": chain.transfer_gas(TOKEN, RECIPIENT, AMOUNT),
+        "gasPrice": chain.gas_price,
+        "nonce": chain.next_nonce(),
+    })
+    return buyer._raw_bytes(chain.w3.eth.account.sign_transaction(tx, buyer.settings().private_key))
+
+
+def summarize(name: str, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"{name:<12} p50 {p50:9.1f} us   p99 {p99:9.1f} us   n={len(samples)}")
+    return p50
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    chain = make_chain()
+    inline = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sign_inline(chain)
+        inline.append(time.perf_counter() - start)
+
+    chain = make_chain()
+    pool = buyer.PresignedPool(chain, buyer.settings().private_key, depth=2)
+    pool._payments.append((TOKEN, RECIPIENT, AMOUNT))
+    pool._signed[(TOKEN, RECIPIENT, AMOUNT)] = {}
+    pooled = []
+    for _ in range(iterations):
+        pool.refill()  # done by the background thread in production
+        start = time.perf_counter()
+        raw = pool.take(TOKEN, RECIPIENT, AMOUNT)
+        pooled.append(time.perf_counter() - start)
+        assert raw is not None
+
+    print(f"Buyer payment critical path (build + sign), {iterations} iterations")
+    base = summarize("inline", inline)
+    fast = summarize("presigned", pooled)
+    print(f"speed-up     {base / fast:.0f}x (pool hits {pool.hits}, misses {pool.misses})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: response serialization for the agent HTTP endpoints.
+
+For each payload, compares what FastAPI did with a returned dict
+(``jsonable_encoder`` + ``JSONResponse``) against ``FastJSONResponse`` and,
+for payloads that never change, the pre-rendered bytes from ``StaticJSON``.
+The chat-protocol case also includes building the ChatMessage model that
+/api/chat-protocol used to construct just to read back its timestamp and ID.
+
+    python bench_serialization.py
+    python bench_serialization.py --iterations 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from uagents_core.contrib.protocols.chat import ChatMessage, TextContent  # noqa: E402
+
+import fast_json  # noqa: E402
+from fast_json import FastJSONResponse, StaticJSON  # noqa: E402
+
+AGENT_ID = "agent1q" + "x" * 58
+REPLY = "🛍️ Here are our available products:\n\n" + "• Item - 5 rUSDT\n" * 12
+
+
+def status_payload() -> Dict[str, Any]:
+    return {
+        "status": "online",
+        "agent_id": AGENT_ID,
+        "agent_name": "merchant",
+        "port": 8003,
+        "protocols": ["chat_protocol_v1", "http_api"],
+        "capabilities": ["e-commerce_operations", "blockchain_payments", "chat_protocol_messaging",
+                         "payment_verification"],
+        "message": "Merchant agent merchant is ready for e-commerce and chat operations",
+    }
+
+
+def chat_protocol_before() -> JSONResponse:
+    message = ChatMessage(timestamp=datetime.utcnow(), msg_id=uuid4(), content=[TextContent(type="text", text=REPLY)])
+    return JSONResponse(jsonable_encoder({
+        "chat_message": {"timestamp": message.timestamp.isoformat(), "msg_id": str(message.msg_id),
+                         "content": [{"type": "text", "text": REPLY}]},
+        "agent_id": AGENT_ID, "agent_name": "merchant", "protocol_version": "chat_protocol_v1",
+    }))
+
+
+def chat_protocol_after() -> FastJSONResponse:
+    return FastJSONResponse({
+        "chat_message": {"timestamp": datetime.utcnow(), "msg_id": uuid4(),
+                         "content": [{"type": "text", "text": REPLY}]},
+        "agent_id": AGENT_ID, "agent_name": "merchant", "protocol_version": "chat_protocol_v1",
+    })
+
+
+def goods_payload() -> Dict[str, Any]:
+    return {"items": [{"id": i, "name": f"Item {i}", "price": 5, "currency": "rUSDT", "stock": 100}
+                      for i in range(1, 21)]}
+
+
+def time_per_call(fn: Callable[[], Any], iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    static_status = StaticJSON(status_payload)
+    goods = goods_payload()
+    cases = [
+        ("status", {
+            "dict": lambda: JSONResponse(jsonable_encoder(status_payload())),
+            "fast": lambda: FastJSONResponse(status_payload()),
+            "static": static_status,
+        }),
+        ("goods", {
+            "dict": lambda: JSONResponse(jsonable_encoder(goods)),
+            "fast": lambda: FastJSONResponse(goods),
+        }),
+        ("chat-protocol", {
+            "dict": chat_protocol_before,
+            "fast": chat_protocol_after,
+        }),
+    ]
+
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+    print(f"{args.iterations} iterations per case, FastJSONResponse using {encoder}")
+    print(f"{'payload':14} {'dict µs':>9} {'fast µs':>9} {'static µs':>10}  speedup")
+    for name, variants in cases:
+        timings = {variant: time_per_call(fn, args.iterations) * 1e6 for variant, fn in variants.items()}
+        best = min(timings["fast"], timings.get("static", float("inf")))
+        static = f"{timings['static']:10.2f}" if "static" in timings else f"{'-':>10}"
+        print(f"{name:14} {timings['dict']:9.2f} {timings['fast']:9.2f} {static}  {timings['dict'] / best:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-of-day settlement of many verified orders against the local chain.
+
+Preloads --orders paid transfers into a LocalChain (unsigned, see
+``LocalChain.preload_transfers``) with matching orders and verified payments in
+the merchant store, plus a few exceptions: payments whose transfer was never
+mined, transfers for the wrong amount, transfers nobody claimed and payments
+still waiting for confirmations. Runs one settlement with a payout, checks every
+count and the payout against what was planted, then compares the time with
+looking up one receipt per order.
+
+    python bench_settlement.py --orders 100000
+"""
+
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_chain import LocalChain, LocalChainServer, dev_address  # noqa: E402
+
+_tmp = tempfile.mkdtemp(prefix="bench_settlement_")
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ["MERCHANT_DB"] = os.path.join(_tmp, "merchant_state.db")
+os.environ["AGENT_STORAGE_DIR"] = _tmp
+
+CONFIRMATIONS = 12
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--per-block", type=int, default=100, help="transfers per block")
+    parser.add_argument("--exception-every", type=int, default=1000,
+                        help="one missing, one mismatched and one unclaimed transfer per this many orders")
+    parser.add_argument("--pending", type=int, default=100, help="paid orders mined after the confirmed head")
+    parser.add_argument("--sample", type=int, default=300, help="receipts fetched for the per-order comparison")
+    args = parser.parse_args(argv)
+
+    chain = LocalChain()
+    with LocalChainServer(chain) as server:
+        os.environ.update(server.env())
+        import merchant
+        from settlement import Settlement, print_report
+
+        config = merchant.settings()
+        buyer, stranger, treasury = dev_address("buyer"), dev_address("stranger"), dev_address("treasury")
+        chain.fund(stranger, 10**24)
+        unit = 10**18
+
+        # Planted: every order paid, except the exceptions
+        start = time.perf_counter()
+        amounts = [(3 if i % 2 else 5) * unit for i in range(args.orders)]
+        missing = set(range(0, args.orders, args.exception_every))
+        mismatch = set(range(args.exception_every // 2, args.orders, args.exception_every))
+        paid = [i for i in range(args.orders) if i not in missing]
+        transfers = [(buyer, config.merchant_address, amounts[i] - (unit if i in mismatch else 0)) for i in paid]
+        hashes = dict(zip(paid, chain.preload_transfers(transfers, args.per_block)))
+        unclaimed = [(stranger, config.merchant_address, 2 * unit) for _ in range(len(missing))]
+        chain.preload_transfers(unclaimed, args.per_block)
+        chain.mine(CONFIRMATIONS)
+        pending = chain.preload_transfers([(buyer, config.merchant_address, 5 * unit)] * args.pending)
+        for i in missing:
+            hashes[i] = "0x" + os.urandom(32).hex()
+
+        store = merchant.get_store()
+        verified_at = time.time() - 60
+        order_rows = [(f"order-{i}", str(amounts[i]), "[]", "paid", hashes[i], verified_at, verified_at)
+                      for i in range(args.orders)]
+        order_rows += [(f"pending-{n}", str(5 * unit), "[]", "paid", tx_hash, verified_at, verified_at)
+                       for n, tx_hash in enumerate(pending)]
+        with store._conn() as conn:
+            conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)", order_rows)
+            conn.executemany("INSERT INTO payments VALUES (?, ?, ?, ?)",
+                             [(tx_hash, amount, order_id, verified_at)
+                              for order_id, amount, _, _, tx_hash, _, _ in order_rows])
+            conn.executemany("INSERT INTO claimed_txs VALUES (?, 'payment')",
+                             [(tx_hash,) for _, _, _, _, tx_hash, _, _ in order_rows])
+        print(f"📦 {args.orders + args.pending} paid orders over {chain.head.number} blocks "
+              f"planted in {time.perf_counter() - start:.1f}s")
+
+        settlement = Settlement(merchant.get_web3(), merchant.get_token(), store, config.merchant_address,
+                                config.wallet_key, payout_address=treasury, confirmations=CONFIRMATIONS,
+                                start_block=1)
+        calls = chain.calls
+        report = settlement.settle()
+        rpc_calls = chain.calls - calls
+        print_report(report)
+        print(f"⚡ {report['seconds']}s, {rpc_calls} RPC calls for {args.orders + args.pending} orders")
+
+        expected = {"matched": len(paid) - len(mismatch), "mismatch": len(mismatch),
+                    "pending": args.pending, "missing": len(missing)}
+        payable = sum(amounts[i] for i in paid if i not in mismatch)
+        problems = [f"{status}: {report['counts'][status]} != {count}"
+                    for status, count in expected.items() if report["counts"][status] != count]
+        if report["unclaimed"]["count"] != len(unclaimed):
+            problems.append(f"unclaimed: {report['unclaimed']['count']} != {len(unclaimed)}")
+        if report["payable"] != payable or chain.token_balance(treasury) != payable:
+            problems.append(f"payout: {chain.token_balance(treasury)} != {payable}")
+        for problem in problems:
+            print(f"⚠️ {problem}")
+        if not problems:
+            print("✅ counts, exceptions and payout match what was planted")
+
+        chain.mine(CONFIRMATIONS)
+        report = settlement.settle(payout=False)
+        print(f"🔁 next run: {report['counts']['matched']} newly confirmed, "
+              f"{report['counts']['missing']} still missing, {report['seconds']}s")
+
+        w3 = merchant.get_web3()
+        sample = list(hashes.values())[:args.sample]
+        start = time.perf_counter()
+        for tx_hash in sample:
+            try:
+                w3.eth.get_transaction_receipt(tx_hash)
+            except Exception:
+                pass
+        per_order = (time.perf_counter() - start) / len(sample)
+        print(f"🐢 one receipt per order: {per_order * 1000:.2f} ms each, "
+              f"~{per_order * (args.orders + args.pending):.0f}s for every order")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fast-checkout authorization verification.
+
+Signs --signatures EIP-712 transferWithAuthorization messages and measures
+how many the merchant can verify per second on one core, and on --processes
+cores at once. It reports the digest on its own, computed directly and through
+eth_account's generic typed-data encoder, and then the digest plus key
+recovery. The signer of every message is checked.
+
+With --checkout N it also runs N fast checkouts end to end against the local
+chain and the merchant API. It relays the authorizations and checks that
+every one of them settled into the payment ledger.
+
+    python bench_signatures.py --signatures 500 --processes 4
+    python bench_signatures.py --checkout 200
+"""
+
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmp = tempfile.mkdtemp(prefix="bench_signatures_")
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ["MERCHANT_DB"] = os.path.join(_tmp, "merchant_state.db")
+os.environ["AGENT_STORAGE_DIR"] = _tmp
+os.environ["FAST_CHECKOUT"] = "1"
+# The end-to-end run checks throughput and settlement, not the risk limits
+os.environ.setdefault("FAST_CHECKOUT_BUYER_LIMIT", "1000000")
+os.environ.setdefault("FAST_CHECKOUT_MAX_EXPOSURE", "1000000")
+
+from eth_account.messages import encode_typed_data  # noqa: E402
+from eth_keys.backends import get_backend  # noqa: E402
+from eth_utils import keccak  # noqa: E402
+
+from fast_checkout import (  # noqa: E402
+    AUTHORIZATION_TYPES, authorization_digest, domain_data, recover_authorizer, sign_authorization,
+)
+from local_chain import CHAIN_ID, TOKEN_ADDRESS, dev_address, dev_key  # noqa: E402
+
+MERCHANT = dev_address("merchant")
+
+
+def make_authorizations(count: int) -> List[Dict[str, Any]]:
+    keys = [dev_key(f"bench-buyer-{i}") for i in range(8)]
+    return [sign_authorization(keys[i % len(keys)], TOKEN_ADDRESS, CHAIN_ID, MERCHANT, 5 * 10**18)
+            for i in range(count)]
+
+
+def generic_digest(authorization: Dict[str, Any]) -> bytes:
+    message = encode_typed_data(domain_data(CHAIN_ID, TOKEN_ADDRESS), AUTHORIZATION_TYPES, {
+        **{k: authorization[k] for k in ("from", "to", "value", "validAfter", "validBefore")},
+        "nonce": bytes.fromhex(authorization["nonce"][2:]),
+    })
+    return keccak(b"\x19" + message.version + message.header + message.body)
+
+
+def verify_all(authorizations: List[Dict[str, Any]]) -> int:
+    """Number of authorizations whose recovered signer is the payer"""
+    return sum(recover_authorizer(a, CHAIN_ID, TOKEN_ADDRESS) == a["from"] for a in authorizations)
+
+
+def per_second(fn, authorizations: List[Dict[str, Any]]) -> float:
+    start = time.perf_counter()
+    for authorization in authorizations:
+        fn(authorization)
+    return len(authorizations) / (time.perf_counter() - start)
+
+
+def bench_verification(signatures: int, processes: int):
+    authorizations = make_authorizations(signatures)
+    for authorization in authorizations[:20]:
+        assert authorization_digest(authorization, CHAIN_ID, TOKEN_ADDRESS) == generic_digest(authorization)
+
+    print(f"🔑 {signatures} signatures, eth_keys backend: {type(get_backend()).__name__}")
+    generic = per_second(generic_digest, authorizations)
+    direct = per_second(lambda a: authorization_digest(a, CHAIN_ID, TOKEN_ADDRESS), authorizations)
+    print(f"   digest, eth_account encoder   {generic:10.0f}/s  ({1e6 / generic:7.1f} µs)")
+    print(f"   digest, direct                {direct:10.0f}/s  ({1e6 / direct:7.1f} µs)")
+
+    start = time.perf_counter()
+    valid = verify_all(authorizations)
+    one_core = signatures / (time.perf_counter() - start)
+    print(f"   digest + recovery, 1 core     {one_core:10.0f}/s  ({1e6 / one_core:7.1f} µs), {valid} valid")
+
+    if processes > 1:
+        chunks = [authorizations[i::processes] for i in range(processes)]
+        with ProcessPoolExecutor(processes) as pool:
+            list(pool.map(verify_all, [chunk[:1] for chunk in chunks]))  # start the workers
+            start = time.perf_counter()
+            valid = sum(pool.map(verify_all, chunks))
+            elapsed = time.perf_counter() - start
+        print(f"   digest + recovery, {processes} cores    {signatures / elapsed:10.0f}/s  "
+              f"({signatures / elapsed / processes:.0f}/s per core), {valid} valid")
+    if valid != signatures:
+        print(f"⚠️ {signatures - valid} signatures did not recover to their payer")
+
+
+def bench_checkout(checkouts: int, item_id):
+    from bench_payment_flow import percentile, start_merchant_api
+    from local_chain import LocalChain, LocalChainServer
+
+    with LocalChainServer(LocalChain()) as server:
+        os.environ.update(server.env())
+        os.environ["MERCHANT_URL"] = start_merchant_api()
+
+        import buyer
+        import merchant
+        from fast_checkout import AuthorizationRelayer
+
+        config = merchant.settings()
+
+        async def run() -> List[Dict[str, Any]]:
+            async with buyer.AsyncBuyerClient() as client:
+                await client.fast_buy(item_id)  # warm-up: connections and chain ID
+                return [await client.fast_buy(item_id) for _ in range(checkouts)]
+
+        paid_before = server.chain.token_balance(config.merchant_address)
+        results = asyncio.run(run())
+        accepted = [r for r in results if r.get("success") and r["verification"].get("status") == "success"]
+        totals = sorted(r["timings"]["total"] for r in accepted)
+        verify = sorted(r["timings"]["verify"] for r in accepted)
+        print(f"⚡ {len(accepted)}/{checkouts} fast checkouts released: total p50 {percentile(totals, 0.5) * 1000:.1f} ms, "
+              f"p95 {percentile(totals, 0.95) * 1000:.1f} ms (merchant verify p50 {percentile(verify, 0.5) * 1000:.1f} ms)")
+        for result in results:
+            if result not in accepted:
+                print(f"❌ {result.get('error') or result['verification'].get('message')}")
+                break
+
+        store = merchant.get_store()
+        relayer = AuthorizationRelayer(merchant.get_web3(), config.rusdt_contract, config.merchant_address,
+                                       store, config.wallet_key)
+        start = time.perf_counter()
+        relayer.submit_once()
+        settled = relayer.submit_once()
+        elapsed = time.perf_counter() - start
+        expected = sum(r["amount"] for r in accepted) + accepted[0]["amount"] if accepted else 0
+        received = server.chain.token_balance(config.merchant_address) - paid_before
+        print(f"📤 {settled} authorizations settled on-chain in {elapsed:.2f}s; merchant received "
+              f"{received / 10**18:g} rUSDT for {expected / 10**18:g} rUSDT released")
+        if received != expected or store.authorization_exposure():
+            print(f"⚠️ {store.authorization_exposure() / 10**18:g} rUSDT still unsettled")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signatures", type=int, default=300)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkout", type=int, default=0, help="fast checkouts to run end to end")
+    parser.add_argument("--item", default="1", help="item ID to buy (must be priced in tokens)")
+    args = parser.parse_args(argv)
+
+    bench_verification(args.signatures, args.processes)
+    if args.checkout:
+        bench_checkout(args.checkout, int(args.item) if args.item.isdigit() else args.item)
+
+
+if __name__ == "__main__":
+    main()
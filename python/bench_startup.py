@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold-start cost of the buyer and merchant modules.
+
+For each module, in a fresh interpreter:
+  * import time, from ``python -X importtime`` (cumulative, self included)
+  * time to first request: import + the first call that does real work
+    (GET /goods through the ASGI app for the merchant, a purchase-intent parse
+    plus settings load for the buyer)
+
+Runs offline; RPC and merchant URLs point at unused ports and are never hit.
+
+    python bench_startup.py [runs]
+"""
+
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENV = {
+    "BUYER_PRIVATE_KEY": "0x" + "11" * 32,
+    "MERCHANT_PRIVATE_KEY": "bench_startup_merchant_seed",
+    "RPC_URL": "http://127.0.0.1:1",
+    "RUSDT_CONTRACT": "0x" + "22" * 20,
+    "MERCHANT_ADDRESS": "0x" + "33" * 20,
+    "MERCHANT_DB": os.path.join(HERE, "bench_startup.db"),
+}
+
+FIRST_REQUEST = {
+    "merchant": (
+        "import time; t = time.perf_counter(); import merchant; "
+        "from fastapi.testclient import TestClient; "
+        "r = TestClient(merchant.app).get('/goods'); assert r.status_code == 200; "
+        "print(time.perf_counter() - t)"
+    ),
+    "buyer": (
+        "import time; t = time.perf_counter(); import buyer; "
+        "buyer.settings(); assert buyer.parse_purchase_intent('buy item 1') == [1]; "
+        "print(time.perf_counter() - t)"
+    ),
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)\s*$")
+
+
+def run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=HERE, env={**os.environ, **ENV},
+        capture_output=True, text=True, check=True,
+    )
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of ``module`` in seconds"""
+    stderr = run(f"import {module}", "-X", "importtime").stderr
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1e6
+    raise RuntimeError(f"no importtime entry for {module}")
+
+
+def first_request(module: str) -> float:
+    return float(run(FIRST_REQUEST[module]).stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Cold start, median of {runs} fresh interpreters")
+    try:
+        for module in ("buyer", "merchant"):
+            imports = statistics.median(import_time(module) for _ in range(runs))
+            first = statistics.median(first_request(module) for _ in range(runs))
+            print(f"{module:<9} import {imports * 1e3:8.1f} ms   first request {first * 1e3:8.1f} ms")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(ENV["MERCHANT_DB"] + suffix):
+                os.remove(ENV["MERCHANT_DB"] + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ctx.storage.set cost with the stock JSON KeyValueStore versus
+SQLiteStorage, as the amount of stored state grows.
+
+    python bench_storage.py [writes]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from uagents.storage import KeyValueStore  # noqa: E402
+
+from agent_storage import SQLiteStorage  # noqa: E402
+
+VALUE = {"status": "online", "message": "Agent alice is ready to help with blockchain questions!"}
+
+
+def seed(cwd: str, existing: int):
+    """Both stores load (or import) an existing bench_data.json"""
+    with open(os.path.join(cwd, "bench_data.json"), "w", encoding="utf-8") as f:
+        json.dump({f"seed-{i}": VALUE for i in range(existing)}, f)
+
+
+def time_writes(storage, writes: int) -> float:
+    start = time.perf_counter()
+    for i in range(writes):
+        storage.set(f"key-{i % 16}", {**VALUE, "n": i})
+    if hasattr(storage, "flush"):
+        storage.flush()
+    return (time.perf_counter() - start) / writes
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"Mean ctx.storage.set latency over {writes} writes")
+    for existing in (10, 1_000, 10_000):
+        with tempfile.TemporaryDirectory() as cwd:
+            seed(cwd, existing)
+            sqlite_store = SQLiteStorage("bench", cwd)
+            sqlite = time_writes(sqlite_store, writes)
+            json_store = time_writes(KeyValueStore("bench", cwd), writes)
+            print(f"{existing:>6} keys   json {json_store * 1e6:10.1f} us   "
+                  f"sqlite {sqlite * 1e6:8.1f} us   ({sqlite_store.commits} commits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,121 @@
+from __future__ import annotations
+
 import os
+import re
+import time
+import asyncio
+import contextvars
+import logging
 import threading
-import requests
+import weakref
 from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
 from uuid import uuid4
-from web3 import Web3
-from eth_account import Account
-from dotenv import load_dotenv
-from uagents import Agent, Context, Protocol
-from typing import Dict, Any
-
-# Import Agent Chat Protocol components
-from uagents_core.contrib.protocols.chat import (
-    ChatMessage,
-    ChatAcknowledgement,
-    TextContent,
-    ResourceContent,
-    Resource,
-    MetadataContent,
-    StartSessionContent,
-    EndSessionContent,
-    chat_protocol_spec
-)
-
-load_dotenv()
-
-RPC_URL = os.getenv("RPC_URL")
-PRIVATE_KEY = os.getenv("BUYER_PRIVATE_KEY")
-
-# Create uagents buyer agent using private key
-buyer_agent = Agent(
-    name="buyer",
-    seed=PRIVATE_KEY,
-    port=8000,
-    endpoint=["http://localhost:8000/submit"],
-    publish_agent_details=True
-)
-
-# Initialize the chat protocol
-chat_proto = Protocol(spec=chat_protocol_spec)
+from typing import Dict, Any, List, Awaitable, Callable, Optional, Tuple, TYPE_CHECKING
+
+from loop_watchdog import watch_loop
+from metrics import CHAT_ROUTING_SECONDS, send_chat, start_metrics_server
+from response_cache import ResponseCache
+from structured_logging import adopt_loggers, configure_logging, correlation_id
+from tracing import chat_parent, inject_headers, is_trace_metadata, span
+
+logger = logging.getLogger("buyer.checkout")
+
+# web3, eth_account, uagents and the HTTP clients are imported on first use so
+# that importing this module (e.g. for buy_item) stays cheap
+if TYPE_CHECKING:
+    from payment_channels import ChannelWallet
+    from uagents import Agent, Context
+    from uagents_core.contrib.protocols.chat import ChatMessage, ChatAcknowledgement
+    from web3 import Web3
+
+
+@lru_cache(maxsize=None)
+def settings() -> SimpleNamespace:
+    """Buyer configuration, read from the environment (and .env) on first use"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    return SimpleNamespace(
+        rpc_url=os.getenv("RPC_URL"),
+        private_key=os.getenv("BUYER_PRIVATE_KEY"),
+        merchant_url=os.getenv("MERCHANT_URL", "http://127.0.0.1:8003"),
+        merchant_timeout=float(os.getenv("MERCHANT_TIMEOUT", "10")),
+        rpc_timeout=float(os.getenv("RPC_TIMEOUT", "15")),
+        receipt_timeout=float(os.getenv("RECEIPT_TIMEOUT", "120")),
+        receipt_poll_initial=float(os.getenv("RECEIPT_POLL_INITIAL", "1")),
+        receipt_poll_max=float(os.getenv("RECEIPT_POLL_MAX", "8")),
+        gas_price_ttl=float(os.getenv("GAS_PRICE_TTL", "15")),
+        gas_safety_margin=float(os.getenv("GAS_SAFETY_MARGIN", "1.2")),
+        presign_depth=int(os.getenv("PRESIGN_DEPTH", "2")),
+        presign_max_payments=int(os.getenv("PRESIGN_MAX_PAYMENTS", "8")),
+        max_concurrent_purchases=int(os.getenv("MAX_CONCURRENT_PURCHASES", "4")),
+        # Agent addresses allowed to start purchases over chat (comma-separated; none by default)
+        trusted_senders=frozenset(
+            address.strip() for address in os.getenv("BUYER_TRUSTED_SENDERS", "").split(",") if address.strip()),
+        # Port of the standalone /metrics server (0 disables it)
+        metrics_port=int(os.getenv("BUYER_METRICS_PORT", "8010")),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_buyer_agent() -> Agent:
+    """Create the uagents buyer agent (using the private key) with the chat protocol"""
+    from uagents import Agent, Protocol
+    from uagents_core.contrib.protocols.chat import (
+        ChatMessage,
+        ChatAcknowledgement,
+        chat_protocol_spec
+    )
+    from agent_storage import use_agent_storage
+
+    buyer_agent = Agent(
+        name="buyer",
+        seed=settings().private_key,
+        port=8000,
+        endpoint=["http://localhost:8000/submit"],
+        publish_agent_details=True
+    )
+    adopt_loggers(buyer_agent._logger)
+    use_agent_storage(buyer_agent)
+    buyer_agent.on_event("startup")(startup_function)
+
+    # Initialize the chat protocol and include it in the buyer agent
+    chat_proto = Protocol(spec=chat_protocol_spec)
+    chat_proto.on_message(ChatMessage)(handle_chat_message)
+    chat_proto.on_message(ChatAcknowledgement)(handle_acknowledgement)
+    buyer_agent.include(chat_proto, publish_manifest=True)
+    return buyer_agent
+
 
 # startup handler
-@buyer_agent.on_event("startup")
 async def startup_function(ctx: Context):
+    buyer_agent = get_buyer_agent()
     ctx.logger.info(f"Hello, I'm buyer agent {buyer_agent.name} and my address is {buyer_agent.address}.")
     ctx.logger.info("Buyer agent is ready to handle chat protocol messages and purchase operations.")
 
 # Chat Protocol Message Handler
-@chat_proto.on_message(ChatMessage)
 async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     """Handle incoming chat messages using the standardized chat protocol"""
-    ctx.logger.info(f"Received chat message from {sender} with msg_id: {msg.msg_id}")
-    
+    token = correlation_id.set(str(msg.msg_id))
+    try:
+        ctx.logger.info(f"Received chat message from {sender} with msg_id: {msg.msg_id}")
+
+        with span("chat.receive", service="buyer", parent=chat_parent(msg), sender=sender):
+            await _handle_chat_content(ctx, sender, msg)
+    finally:
+        correlation_id.reset(token)
+
+
+async def _handle_chat_content(ctx: Context, sender: str, msg: ChatMessage):
+    from uagents_core.contrib.protocols.chat import (
+        ChatAcknowledgement,
+        TextContent,
+        ResourceContent,
+        MetadataContent,
+    )
+
     # Process each content item in the message
     for item in msg.content:
         if isinstance(item, TextContent):
@@ -61,39 +126,181 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
                 timestamp=datetime.utcnow(),
                 acknowledged_msg_id=msg.msg_id
             )
-            await ctx.send(sender, ack)
+            await send_chat(ctx, "buyer", sender, ack)
             
+            # Purchases run in the background so the handler returns right away
+            start = time.perf_counter()
+            items = parse_purchase_intent(item.text)
+            if items and sender not in settings().trusted_senders:
+                ctx.logger.warning(f"Purchase request from untrusted sender {sender} refused")
+                await send_text(ctx, sender, "🔒 I only make purchases for trusted senders (BUYER_TRUSTED_SENDERS).")
+                continue
+            if items:
+                await start_chat_purchase(ctx, sender, items)
+                CHAT_ROUTING_SECONDS.observe(time.perf_counter() - start, "buyer", "checkout")
+                continue
+
             # Process the message and generate response
             response_text = await process_buyer_message(item.text)
             
             # Send response message
-            response = ChatMessage(
-                timestamp=datetime.utcnow(),
-                msg_id=uuid4(),
-                content=[TextContent(type="text", text=response_text)]
-            )
-            await ctx.send(sender, response)
+            await send_text(ctx, sender, response_text)
             
         elif isinstance(item, ResourceContent):
             ctx.logger.info(f"Resource content from {sender}: {item.resource_id}")
             # Handle resource content if needed
             
-        elif isinstance(item, MetadataContent):
+        elif isinstance(item, MetadataContent) and item.metadata.get("channel_id") in open_channels:
+            # A merchant reply on a payment channel: follow its accepted total
+            reply = item.metadata
+            open_channels[reply["channel_id"]].sync(reply)
+            if reply.get("channel") == "rejected":
+                ctx.logger.warning(f"Channel update rejected: {reply.get('reason')}")
+
+        elif isinstance(item, MetadataContent) and not is_trace_metadata(item):
             ctx.logger.info(f"Metadata content from {sender}: {item.metadata}")
             # Handle metadata content if needed
 
 # Chat Protocol Acknowledgement Handler
-@chat_proto.on_message(ChatAcknowledgement)
 async def handle_acknowledgement(ctx: Context, sender: str, msg: ChatAcknowledgement):
     """Handle chat acknowledgements"""
     ctx.logger.info(f"Received acknowledgement from {sender} for message: {msg.acknowledged_msg_id}")
 
+async def send_channel_message(ctx: Context, destination: str, metadata: Dict[str, str]):
+    """Send a payment-channel message (see payment_channels) to the merchant agent"""
+    from uagents_core.contrib.protocols.chat import ChatMessage, MetadataContent
+
+    await send_chat(ctx, "buyer", destination, ChatMessage(
+        timestamp=datetime.utcnow(),
+        msg_id=uuid4(),
+        content=[MetadataContent(type="metadata", metadata=metadata)]
+    ))
+
+async def send_text(ctx: Context, destination: str, text: str):
+    """Send a plain text ChatMessage"""
+    from uagents_core.contrib.protocols.chat import ChatMessage, TextContent
+
+    await send_chat(ctx, "buyer", destination, ChatMessage(
+        timestamp=datetime.utcnow(),
+        msg_id=uuid4(),
+        content=[TextContent(type="text", text=text)]
+    ))
+
+
+# Item names the chat parser understands, mapped to merchant item IDs
+ITEM_ALIASES = {
+    "crypto hoodie": 1,
+    "hoodie": 1,
+    "nft poster": 2,
+    "poster": 2,
+}
+# Whole words only: "buyer" or "purchased" is not a request to pay
+_PURCHASE_PATTERN = re.compile(r"\b(?:buy|purchase)\b")
+_NEGATION_PATTERN = re.compile(r"\b(?:don'?t|don’t|do not|never|not|no)\b")
+# A number is an item ID only next to "item": "order #3" is not
+_ITEM_ID_PATTERN = re.compile(r"\bitem\s*#?\s*(\d+)\b")
+_purchase_slots = None
+_purchases_in_flight: Dict[str, asyncio.Task] = {}
+# Payment channels this buyer opened, by channel ID
+open_channels: Dict[str, ChannelWallet] = {}
+
+
+def parse_purchase_intent(message: str) -> Optional[List[int]]:
+    """Extract item IDs from messages like "buy item 1" or "buy a hoodie and a poster".
+
+    Returns None when the message is not a purchase request, is negated ("don't
+    buy a poster") or names no item. Every match starts a real payment.
+    """
+    message_lower = message.lower()
+    keyword = _PURCHASE_PATTERN.search(message_lower)
+    if keyword is None or _NEGATION_PATTERN.search(message_lower, 0, keyword.start()):
+        return None
+
+    items = [int(match) for match in _ITEM_ID_PATTERN.findall(message_lower)]
+    remaining = message_lower
+    for alias, item_id in ITEM_ALIASES.items():
+        if alias in remaining:
+            items.append(item_id)
+            remaining = remaining.replace(alias, " ")
+    return items or None
+
+
+async def start_chat_purchase(ctx: Context, sender: str, items: List[int]):
+    """Run a chat-requested purchase as a supervised background task"""
+    global _purchase_slots
+    if sender in _purchases_in_flight:
+        await send_text(ctx, sender, "⏳ Your previous purchase is still in progress. I'll update you when it completes.")
+        return
+    if _purchase_slots is None:
+        _purchase_slots = asyncio.Semaphore(settings().max_concurrent_purchases)
+
+    if _purchase_slots.locked():
+        await send_text(ctx, sender, "🕒 Other payments are in flight, your purchase is queued.")
+    task = asyncio.create_task(_run_chat_purchase(ctx, sender, items))
+    _purchases_in_flight[sender] = task
+
+    def _done(finished: asyncio.Task):
+        _purchases_in_flight.pop(sender, None)
+        if not finished.cancelled() and finished.exception() is not None:
+            ctx.logger.error(f"Purchase task for {sender} failed: {finished.exception()!r}")
+
+    task.add_done_callback(_done)
+
+
+async def _run_chat_purchase(ctx: Context, sender: str, items: List[int]):
+    async with _purchase_slots:
+        async def progress(text: str):
+            await send_text(ctx, sender, text)
+
+        ctx.logger.info(f"Starting purchase of items {items} for {sender}")
+        client = get_async_client()
+        if len(items) == 1:
+            result = await client.checkout({"item_id": items[0]}, progress=progress)
+        else:
+            result = await client.checkout({"items": items}, progress=progress)
+
+        if result.get("success"):
+            verification = result.get("verification", {})
+            await send_text(ctx, sender, f"""✅ **Purchase complete!**
+
+• Transaction: `{result["tx_hash"]}`
+• Amount: {result["amount"] / 10**18:g} rUSDT
+• Merchant: {verification.get("message", verification.get("status", "unknown"))}
+• Time taken: {result["timings"]["total"]:.1f}s""")
+        else:
+            await send_text(ctx, sender, f"❌ **Purchase failed:** {result.get('error')}")
+
+
+# Chat intents in match order, each with its trigger keywords
+BUYER_INTENTS = [
+    ("greeting", ["hello", "hi", "greetings"]),
+    ("purchase", ["buy", "purchase", "order", "item"]),
+    ("catalog", ["products", "catalog", "inventory", "goods"]),
+    ("payment", ["payment", "transaction", "status"]),
+    ("wallet", ["balance", "wallet", "tokens"]),
+    ("help", ["help", "support", "assistance"]),
+]
+
+
+def buyer_intent(message: str) -> str:
+    message_lower = message.lower()
+    for intent, keywords in BUYER_INTENTS:
+        if any(keyword in message_lower for keyword in keywords):
+            return intent
+    return "unknown"
+
+
 async def process_buyer_message(message: str) -> str:
     """Process incoming chat messages and generate buyer-specific responses"""
-    message_lower = message.lower()
-    
+    start = time.perf_counter()
+    intent, response = BUYER_REPLIES.lookup(message)
+    CHAT_ROUTING_SECONDS.observe(time.perf_counter() - start, "buyer", intent)
+    return response
+
+
+def buyer_reply(intent: str) -> str:
     # Handle different types of buyer inquiries
-    if any(keyword in message_lower for keyword in ["hello", "hi", "greetings"]):
+    if intent == "greeting":
         return """🛒 **Welcome! I'm the Buyer Agent!**
 
 I can help you with:
@@ -105,7 +312,7 @@ I can help you with:
 
 What would you like to buy today?"""
 
-    elif any(keyword in message_lower for keyword in ["buy", "purchase", "order", "item"]):
+    elif intent == "purchase":
         return """💳 **Ready to Make a Purchase!**
 
 I can help you buy items from the merchant. To get started:
@@ -116,12 +323,12 @@ I can help you buy items from the merchant. To get started:
 
 Which item would you like to purchase? (Available: Crypto Hoodie, NFT Poster, etc.)"""
 
-    elif any(keyword in message_lower for keyword in ["products", "catalog", "inventory", "goods"]):
+    elif intent == "catalog":
         return """📦 **Let me check the available products...**
 
 I'll contact the merchant to get the latest product catalog for you. One moment please!"""
 
-    elif any(keyword in message_lower for keyword in ["payment", "transaction", "status"]):
+    elif intent == "payment":
         return """🔍 **Payment Information**
 
 I can help you with:
@@ -132,16 +339,16 @@ I can help you with:
 
 What payment would you like me to check?"""
 
-    elif any(keyword in message_lower for keyword in ["balance", "wallet", "tokens"]):
+    elif intent == "wallet":
         return f"""💰 **Wallet Information**
 
-Your buyer wallet address: `{buyer_addr}`
+Your buyer wallet address: `{buyer_address()}`
 Network: Rootstock Testnet
-RPC: {RPC_URL}
+RPC: {settings().rpc_url}
 
 I can help you check balances and manage payments. What would you like to know?"""
 
-    elif any(keyword in message_lower for keyword in ["help", "support", "assistance"]):
+    elif intent == "help":
         return """❓ **Buyer Agent Help**
 
 I'm a blockchain-enabled buyer agent that can:
@@ -178,11 +385,26 @@ I specialize in blockchain purchases and payments. You can ask me about:
 
 What would you like to do?"""
 
-MERCHANT_URL = "http://127.0.0.1:8003"
 
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-acct = Account.from_key(PRIVATE_KEY)
-buyer_addr = acct.address
+BUYER_REPLIES = ResponseCache("buyer", buyer_intent, buyer_reply)
+
+
+@lru_cache(maxsize=None)
+def get_web3() -> Web3:
+    from web3 import Web3
+    from rpc import InstrumentedHTTPProvider
+    return Web3(InstrumentedHTTPProvider(settings().rpc_url))
+
+
+@lru_cache(maxsize=None)
+def get_account():
+    from eth_account import Account
+    return Account.from_key(settings().private_key)
+
+
+def buyer_address() -> str:
+    return get_account().address
+
 
 ERC20_ABI = [
     {
@@ -198,85 +420,799 @@ ERC20_ABI = [
 ]
 
 
+class ChainParams:
+    """Caches chain parameters so a purchase only has to sign and send.
+
+    chain_id is fetched once, gas price is refreshed on a TTL by a background
+    thread, transfer gas estimates are cached per token contract (with a safety
+    margin) and the nonce is tracked locally after the first lookup.
+    """
+
+    def __init__(self, web3: Web3, address: str,
+                 gas_price_ttl: Optional[float] = None,
+                 gas_margin: Optional[float] = None):
+        self.w3 = web3
+        self.address = address
+        self.gas_price_ttl = gas_price_ttl or settings().gas_price_ttl
+        self.gas_margin = gas_margin or settings().gas_safety_margin
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._chain_id = None
+        self._gas_price = None
+        self._nonce = None
+        self._contracts: Dict[str, Any] = {}
+        self._transfer_gas: Dict[str, int] = {}
+        self._listeners: List[Callable[[], None]] = []
+
+    def on_change(self, callback: Callable[[], None]):
+        """Register a callback fired when the gas price or nonce state changes"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback()
+
+    @property
+    def chain_id(self) -> int:
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    @property
+    def gas_price(self) -> int:
+        if self._gas_price is None:
+            self.refresh_gas_price()
+            self.start()
+        return self._gas_price
+
+    def refresh_gas_price(self) -> int:
+        previous, self._gas_price = self._gas_price, self.w3.eth.gas_price
+        if previous is not None and previous != self._gas_price:
+            self._notify()
+        return self._gas_price
+
+    def start(self):
+        """Start the background gas price refresher (idempotent)"""
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="gas-price-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._refresher = None
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.gas_price_ttl):
+            try:
+                self.refresh_gas_price()
+            except Exception as e:
+                # Keep serving the last known price until the RPC recovers
+                logger.warning("Gas price refresh failed", extra={"error": str(e)})
+
+    def token(self, token_addr: str):
+        key = token_addr.lower()
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = self.w3.eth.contract(address=token_addr, abi=ERC20_ABI)
+            self._contracts[key] = contract
+        return contract
+
+    def transfer_gas(self, token_addr: str, recipient: str, amount: int) -> int:
+        """Gas limit for an ERC-20 transfer, estimated once per token contract"""
+        key = token_addr.lower()
+        gas = self._transfer_gas.get(key)
+        if gas is None:
+            estimate = self.token(token_addr).functions.transfer(recipient, amount).estimate_gas(
+                {"from": self.address}
+            )
+            gas = int(estimate * self.gas_margin)
+            self._transfer_gas[key] = gas
+        return gas
+
+    def next_nonce(self) -> int:
+        with self._lock:
+            if self._nonce is None:
+                self._nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+
+    def peek_nonce(self) -> int:
+        """The nonce the next purchase will use, without reserving it"""
+        with self._lock:
+            if self._nonce is None:
+                self._nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+            return self._nonce
+
+    def claim_nonce(self, nonce: int) -> bool:
+        """Reserve ``nonce`` if it is still the next one; False if another purchase took it"""
+        with self._lock:
+            if self._nonce != nonce:
+                return False
+            self._nonce += 1
+            return True
+
+    def reset_nonce(self):
+        """Forget the local nonce so the next purchase re-reads it from the chain"""
+        with self._lock:
+            self._nonce = None
+        self._notify()
+
+
+def _raw_bytes(signed) -> bytes:
+    # eth-account renamed rawTransaction to raw_transaction in 0.13
+    raw = getattr(signed, "raw_transaction", None)
+    return raw if raw is not None else signed.rawTransaction
+
+
+class PresignedPool:
+    """Pre-built, pre-signed transfers for common (token, recipient, amount) payments.
+
+    For every known payment the pool holds signed transactions for the next
+    ``depth`` nonces at the current gas price, so a purchase only has to call
+    ``send_raw_transaction``. Taking a transaction advances the nonce and wakes
+    the background refiller; a gas price change or nonce reset drops everything.
+    """
+
+    def __init__(self, chain: ChainParams, private_key: str,
+                 depth: Optional[int] = None,
+                 max_payments: Optional[int] = None):
+        self.chain = chain
+        self.private_key = private_key
+        self.depth = depth or settings().presign_depth
+        self.max_payments = max_payments or settings().presign_max_payments
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._payments: List[Tuple[str, str, int]] = []
+        # payment -> nonce -> (gas price, raw signed tx)
+        self._signed: Dict[Tuple[str, str, int], Dict[int, Tuple[int, bytes]]] = {}
+        chain.on_change(self.invalidate)
+
+    def register(self, token_addr: str, recipient: str, amount: int):
+        """Keep transfers for this payment pre-signed from now on"""
+        key = (token_addr, recipient, amount)
+        with self._lock:
+            if key in self._payments:
+                return
+            if len(self._payments) >= self.max_payments:
+                evicted = self._payments.pop(0)
+                self._signed.pop(evicted, None)
+            self._payments.append(key)
+            self._signed[key] = {}
+        self.start()
+        self._wakeup.set()
+
+    def invalidate(self):
+        with self._lock:
+            for signed in self._signed.values():
+                signed.clear()
+        self._wakeup.set()
+
+    def take(self, token_addr: str, recipient: str, amount: int) -> Optional[bytes]:
+        """Return a ready-to-send raw transaction, or None if none is usable"""
+        key = (token_addr, recipient, amount)
+        nonce = self.chain.peek_nonce()
+        with self._lock:
+            entry = self._signed.get(key, {}).pop(nonce, None)
+        if (entry is None
+                or entry[0] != self.chain.gas_price
+                or not self.chain.claim_nonce(nonce)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._wakeup.set()
+        return entry[1]
+
+    def refill(self):
+        """Sign whatever is missing for the next ``depth`` nonces of every payment"""
+        nonce = self.chain.peek_nonce()
+        gas_price = self.chain.gas_price
+        with self._lock:
+            payments = list(self._payments)
+            for signed in self._signed.values():
+                for stale in [n for n, (price, _) in signed.items()
+                              if n < nonce or price != gas_price]:
+                    del signed[stale]
+        for key in payments:
+            token_addr, recipient, amount = key
+            for n in range(nonce, nonce + self.depth):
+                if n in self._signed.get(key, {}):
+                    continue
+                raw = self._sign(token_addr, recipient, amount, n, gas_price)
+                with self._lock:
+                    if key in self._signed:
+                        self._signed[key][n] = (gas_price, raw)
+
+    def _sign(self, token_addr: str, recipient: str, amount: int,
+              nonce: int, gas_price: int) -> bytes:
+        tx = self.chain.token(token_addr).functions.transfer(recipient, amount).build_transaction({
+            "chainId": self.chain.chain_id,
+            "gas": self.chain.transfer_gas(token_addr, recipient, amount),
+            "gasPrice": gas_price,
+            "nonce": nonce,
+        })
+        return _raw_bytes(self.chain.w3.eth.account.sign_transaction(tx, self.private_key))
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._refill_loop, name="presigned-pool", daemon=True
+            )
+            self._thread.start()
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait(timeout=self.chain.gas_price_ttl)
+            self._wakeup.clear()
+            try:
+                self.refill()
+            except Exception as e:
+                logger.warning("Pre-signing failed", extra={"error": str(e)})
+
+
+@lru_cache(maxsize=None)
+def get_chain_params() -> ChainParams:
+    return ChainParams(get_web3(), buyer_address())
+
+
+@lru_cache(maxsize=None)
+def get_presigned_pool() -> Optional[PresignedPool]:
+    """The buyer's pre-signed transfer pool, or None when PRESIGN_DEPTH is 0"""
+    if settings().presign_depth <= 0:
+        return None
+    return PresignedPool(get_chain_params(), settings().private_key)
+
+
 def buy_item(item_id: int):
     """
     Simple token transfer from buyer to merchant
     """
+    logger.info("Buying item", extra={"item_id": item_id})
+    return _checkout({"item_id": item_id})
+
+
+def buy_cart(items: List[Any]):
+    """
+    Buy several items with one aggregated quote, one transfer and one verification.
+
+    ``items`` holds item IDs or ``{"item_id": ..., "quantity": ...}`` dicts.
+    """
+    logger.info("Buying cart", extra={"items": len(items)})
+    return _checkout({"items": items})
+
+
+class ReceiptTimeout(Exception):
+    """Raised when a transaction is not mined before the receipt deadline"""
+
+
+class TransactionReverted(Exception):
+    """Raised when a payment transaction was mined but failed"""
+
+
+class StageTimer:
+    """Records how long each stage of a purchase took, in seconds"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = round(now - self._last, 4)
+        self._last = now
+
+    def result(self) -> Dict[str, float]:
+        timings = dict(self.timings)
+        timings["total"] = round(time.perf_counter() - self._start, 4)
+        return timings
+
+
+def _backoff_delays(initial: float, maximum: float, factor: float):
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def _check_receipt(receipt, tx_hash: str):
+    if receipt.get("status", 1) == 0:
+        raise TransactionReverted(f"Transaction {tx_hash} reverted")
+    return receipt
+
+
+def wait_for_receipt(tx_hash: str, timeout: Optional[float] = None,
+                     initial_delay: Optional[float] = None,
+                     max_delay: Optional[float] = None,
+                     factor: float = 2.0):
+    """Poll for a transaction receipt with exponential backoff, bounded by ``timeout``"""
+    from web3.exceptions import TransactionNotFound
+
+    config = settings()
+    timeout = timeout or config.receipt_timeout
+    w3 = get_web3()
+    deadline = time.monotonic() + timeout
+    for delay in _backoff_delays(initial_delay or config.receipt_poll_initial,
+                                 max_delay or config.receipt_poll_max, factor):
+        try:
+            return _check_receipt(w3.eth.get_transaction_receipt(tx_hash), tx_hash)
+        except TransactionNotFound:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ReceiptTimeout(f"Transaction {tx_hash} not mined after {timeout}s")
+        time.sleep(min(delay, remaining))
+
+
+def _checkout(order: Dict[str, Any]):
+    """Quote an order with the merchant, pay it in one transfer and notify the merchant"""
+    with span("purchase", service="buyer", order=order) as purchase_span:
+        result = _run_checkout(order)
+        _finish_purchase_span(purchase_span, result)
+    return result
+
+
+def _finish_purchase_span(purchase_span, result: Dict[str, Any]):
+    purchase_span.set(tx_hash=result.get("tx_hash"), timings=result.get("timings"))
+    if not result.get("success"):
+        purchase_span.status = "error"
+        purchase_span.set(error=result.get("error"))
+    if purchase_span.trace_id:
+        result["trace_id"] = purchase_span.trace_id
+
+
+def _run_checkout(order: Dict[str, Any]):
+    import requests
+
+    config = settings()
+    w3 = get_web3()
+    chain_params = get_chain_params()
+    presigned_pool = get_presigned_pool()
+    timer = StageTimer()
     try:
-        print(f"🛒 Buying item {item_id}...")
-        print(f"👤 Buyer Address: {buyer_addr}")
-        
         # Step 1: Get payment details from merchant
-        resp = requests.post(f"{MERCHANT_URL}/purchase", json={"item_id": item_id})
-        payment_info = resp.json()
-        print("📋 Payment Info:", payment_info)
+        with span("merchant.quote", kind="client"):
+            resp = requests.post(f"{config.merchant_url}/purchase", json=order, headers=inject_headers(),
+                                 timeout=config.merchant_timeout)
+            payment_info = resp.json()
+        timer.mark("quote")
+        logger.info("Quote received", extra={"payment_info": payment_info, "buyer": buyer_address()})
 
         if payment_info.get("status") != "402 Payment Required":
-            print("❌ No payment required, aborting")
+            logger.warning("No payment required, aborting")
             return {"error": "No payment required"}
 
         token_addr = payment_info["token_address"]
         amount = int(payment_info["amount"])
         recipient = payment_info["recipient_address"]
-        
-        print(f"💰 Amount: {amount}")
-        print(f"🏪 Recipient: {recipient}")
-
-        # Step 2: Simple token transfer
-        token = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
-        nonce = w3.eth.get_transaction_count(buyer_addr)
-
-        # Build transaction
-        tx = token.functions.transfer(recipient, amount).build_transaction({
-            "chainId": w3.eth.chain_id,
-            "gas": 100000,
-            "gasPrice": w3.eth.gas_price,
-            "nonce": nonce,
-        })
 
-        # Sign and send transaction
-        signed = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed.rawTransaction)
+        # Step 2: Simple token transfer, pre-signed if the pool has one ready
+        with span("sign") as sign_span:
+            raw_tx = None
+            if presigned_pool is not None:
+                raw_tx = presigned_pool.take(token_addr, recipient, amount)
+                presigned_pool.register(token_addr, recipient, amount)
+            sign_span.set(presigned=raw_tx is not None)
+            if raw_tx is None:
+                token = chain_params.token(token_addr)
+                tx = token.functions.transfer(recipient, amount).build_transaction({
+                    "chainId": chain_params.chain_id,
+                    "gas": chain_params.transfer_gas(token_addr, recipient, amount),
+                    "gasPrice": chain_params.gas_price,
+                    "nonce": chain_params.next_nonce(),
+                })
+                raw_tx = _raw_bytes(w3.eth.account.sign_transaction(tx, config.private_key))
+        timer.mark("sign")
+
+        # Send transaction
+        try:
+            tx_hash = w3.eth.send_raw_transaction(raw_tx)
+        except Exception:
+            # The locally tracked nonce may be stale (e.g. a tx sent elsewhere)
+            chain_params.reset_nonce()
+            raise
         tx_hash_hex = w3.to_hex(tx_hash)
+        timer.mark("send")
         
-        print(f"✅ Payment sent! Transaction: {tx_hash_hex}")
-        print(f"🔗 Explorer: https://explorer.testnet.rsk.co/tx/{tx_hash_hex}")
+        logger.info("Payment sent", extra={
+            "tx_hash": tx_hash_hex,
+            "amount": amount,
+            "recipient": recipient,
+            "explorer": f"https://explorer.testnet.rsk.co/tx/{tx_hash_hex}",
+        })
 
-        # Step 3: Notify merchant of payment
-        retry = requests.post(
-            f"{MERCHANT_URL}/retry_purchase", 
-            json={"tx_hash": tx_hash_hex, "amount": amount}
-        )
-        verification = retry.json()
-        print("✅ Merchant verification:", verification)
+        # Step 3: Wait until the transfer is mined, otherwise verification fails
+        try:
+            with span("receipt.wait", tx_hash=tx_hash_hex):
+                wait_for_receipt(tx_hash_hex)
+        except (ReceiptTimeout, TransactionReverted) as e:
+            timer.mark("receipt")
+            logger.warning("Payment not confirmed", extra={"tx_hash": tx_hash_hex, "error": str(e)})
+            return {"error": str(e), "tx_hash": tx_hash_hex, "timings": timer.result()}
+        timer.mark("receipt")
+
+        # Step 4: Notify merchant of payment
+        with span("merchant.verify", kind="client"):
+            retry = requests.post(
+                f"{config.merchant_url}/retry_purchase",
+                json={"tx_hash": tx_hash_hex, "amount": amount, "order_id": payment_info.get("order_id")},
+                headers=inject_headers(),
+                timeout=config.merchant_timeout,
+            )
+            verification = retry.json()
+        timer.mark("verify")
+        logger.info("Merchant verification", extra={"verification": verification, "timings": timer.result()})
         
         return {
             "success": True,
             "tx_hash": tx_hash_hex,
             "amount": amount,
-            "recipient": recipient
+            "recipient": recipient,
+            "verification": verification,
+            "timings": timer.result(),
         }
         
     except Exception as e:
-        print(f"❌ Error during purchase: {str(e)}")
-        return {"error": str(e)}
+        logger.exception("Error during purchase")
+        return {"error": str(e), "timings": timer.result()}
+
+
+class AsyncBuyerClient:
+    """Awaitable purchase flow for use inside an event loop.
+
+    Merchant calls go through one pooled keep-alive ``httpx.AsyncClient`` and
+    chain calls through async Web3, each bounded by its own timeout. Nonces are
+    handed out under an ``asyncio.Lock`` so many purchases can run concurrently.
+    """
+
+    def __init__(self, merchant_url: Optional[str] = None, rpc_url: Optional[str] = None,
+                 private_key: Optional[str] = None,
+                 merchant_timeout: Optional[float] = None,
+                 rpc_timeout: Optional[float] = None,
+                 max_connections: int = 20,
+                 gas_price_ttl: Optional[float] = None,
+                 gas_margin: Optional[float] = None):
+        import httpx
+        from eth_account import Account
+        from web3 import AsyncWeb3
+        from rpc import InstrumentedAsyncHTTPProvider
+
+        config = settings()
+        self.account = Account.from_key(private_key or config.private_key)
+        self.address = self.account.address
+        self.rpc_timeout = rpc_timeout or config.rpc_timeout
+        self.gas_price_ttl = gas_price_ttl or config.gas_price_ttl
+        self.gas_margin = gas_margin or config.gas_safety_margin
+        self.http = httpx.AsyncClient(
+            base_url=merchant_url or config.merchant_url,
+            timeout=merchant_timeout or config.merchant_timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.w3 = AsyncWeb3(InstrumentedAsyncHTTPProvider(rpc_url or config.rpc_url))
+        self._nonce_lock = asyncio.Lock()
+        self._nonce = None
+        self._chain_id = None
+        self._gas_price = None
+        self._gas_price_task = None
+        self._contracts: Dict[str, Any] = {}
+        self._transfer_gas: Dict[str, int] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._gas_price_task is not None:
+            self._gas_price_task.cancel()
+            self._gas_price_task = None
+        await self.http.aclose()
+        disconnect = getattr(self.w3.provider, "disconnect", None)
+        if disconnect is not None:
+            await disconnect()
+
+    async def _rpc(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.rpc_timeout)
+
+    async def chain_id(self) -> int:
+        if self._chain_id is None:
+            self._chain_id = await self._rpc(self.w3.eth.chain_id)
+        return self._chain_id
+
+    async def gas_price(self) -> int:
+        if self._gas_price is None:
+            self._gas_price = await self._rpc(self.w3.eth.gas_price)
+            # Concurrent first purchases all get here after the await; only one starts the refresher
+            if self._gas_price_task is None:
+                # A fresh context keeps the refresher's RPC spans out of this purchase's trace
+                self._gas_price_task = asyncio.create_task(self._refresh_gas_price(), context=contextvars.Context())
+        return self._gas_price
+
+    async def _refresh_gas_price(self):
+        while True:
+            await asyncio.sleep(self.gas_price_ttl)
+            try:
+                self._gas_price = await self._rpc(self.w3.eth.gas_price)
+            except Exception as e:
+                logger.warning("Gas price refresh failed", extra={"error": str(e)})
+
+    def token(self, token_addr: str):
+        key = token_addr.lower()
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = self.w3.eth.contract(address=token_addr, abi=ERC20_ABI)
+            self._contracts[key] = contract
+        return contract
+
+    async def transfer_gas(self, token_addr: str, recipient: str, amount: int) -> int:
+        key = token_addr.lower()
+        gas = self._transfer_gas.get(key)
+        if gas is None:
+            estimate = await self._rpc(
+                self.token(token_addr).functions.transfer(recipient, amount).estimate_gas(
+                    {"from": self.address}
+                )
+            )
+            gas = int(estimate * self.gas_margin)
+            self._transfer_gas[key] = gas
+        return gas
+
+    async def next_nonce(self) -> int:
+        async with self._nonce_lock:
+            if self._nonce is None:
+                self._nonce = await self._rpc(
+                    self.w3.eth.get_transaction_count(self.address, "pending")
+                )
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+
+    async def reset_nonce(self):
+        async with self._nonce_lock:
+            self._nonce = None
+
+    async def get_quote(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        with span("merchant.quote", kind="client"):
+            resp = await self.http.post("/purchase", json=order, headers=inject_headers())
+            return resp.json()
+
+    async def pay(self, token_addr: str, recipient: str, amount: int) -> str:
+        """Send the rUSDT transfer and return the transaction hash"""
+        tx = {
+            "chainId": await self.chain_id(),
+            "gas": await self.transfer_gas(token_addr, recipient, amount),
+            "gasPrice": await self.gas_price(),
+            "nonce": await self.next_nonce(),
+        }
+        tx = await self.token(token_addr).functions.transfer(recipient, amount).build_transaction(tx)
+        signed = self.account.sign_transaction(tx)
+        try:
+            tx_hash = await self._rpc(self.w3.eth.send_raw_transaction(_raw_bytes(signed)))
+        except Exception:
+            await self.reset_nonce()
+            raise
+        return self.w3.to_hex(tx_hash)
+
+    async def open_channel(self, token_addr: str, recipient: str, deposit: int,
+                           unit: Optional[int] = None) -> ChannelWallet:
+        """Pay a channel deposit on-chain and return the wallet for its off-chain updates"""
+        from payment_channels import CHANNEL_UNIT, ChannelWallet
+
+        tx_hash = await self.pay(token_addr, recipient, deposit)
+        await self.wait_for_receipt(tx_hash)
+        wallet = ChannelWallet(self.account.key, tx_hash, recipient, token_addr,
+                               await self.chain_id(), deposit, unit or CHANNEL_UNIT)
+        open_channels[wallet.channel_id] = wallet
+        return wallet
+
+    async def wait_for_receipt(self, tx_hash: str, timeout: Optional[float] = None,
+                               initial_delay: Optional[float] = None,
+                               max_delay: Optional[float] = None,
+                               factor: float = 2.0):
+        """Async ``wait_for_receipt``: backoff polling bounded by ``timeout``"""
+        from web3.exceptions import TransactionNotFound
+
+        config = settings()
+        timeout = timeout or config.receipt_timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for delay in _backoff_delays(initial_delay or config.receipt_poll_initial,
+                                     max_delay or config.receipt_poll_max, factor):
+            try:
+                receipt = await self._rpc(self.w3.eth.get_transaction_receipt(tx_hash))
+                return _check_receipt(receipt, tx_hash)
+            except TransactionNotFound:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise ReceiptTimeout(f"Transaction {tx_hash} not mined after {timeout}s")
+            await asyncio.sleep(min(delay, remaining))
+
+    async def notify_payment(self, tx_hash: str, amount: int,
+                             order_id: Optional[str] = None) -> Dict[str, Any]:
+        with span("merchant.verify", kind="client"):
+            resp = await self.http.post(
+                "/retry_purchase", json={"tx_hash": tx_hash, "amount": amount, "order_id": order_id},
+                headers=inject_headers(),
+            )
+            return resp.json()
+
+    async def buy_item(self, item_id) -> Dict[str, Any]:
+        """Async equivalent of ``buy_item``; returns the same result shape"""
+        return await self.checkout({"item_id": item_id})
+
+    async def buy_cart(self, items: List[Any]) -> Dict[str, Any]:
+        """Async equivalent of ``buy_cart``"""
+        return await self.checkout({"items": items})
+
+    async def checkout(self, order: Dict[str, Any],
+                       progress: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """Quote, pay, wait for the receipt and notify the merchant.
+
+        ``progress`` is awaited with a short status line after each stage.
+        """
+        with span("purchase", service="buyer", order=order) as purchase_span:
+            result = await self._checkout(order, progress)
+            _finish_purchase_span(purchase_span, result)
+        return result
+
+    async def _checkout(self, order: Dict[str, Any],
+                        progress: Optional[Callable[[str], Awaitable[None]]]) -> Dict[str, Any]:
+        async def report(text: str):
+            if progress is not None:
+                await progress(text)
+
+        timer = StageTimer()
+        try:
+            payment_info = await self.get_quote(order)
+            timer.mark("quote")
+            if payment_info.get("status") != "402 Payment Required":
+                return {"error": "No payment required"}
+
+            amount = int(payment_info["amount"])
+            recipient = payment_info["recipient_address"]
+            await report(f"📋 Quote received: {amount / 10**18:g} rUSDT. Sending payment...")
+            tx_hash_hex = await self.pay(payment_info["token_address"], recipient, amount)
+            timer.mark("send")
+            await report(f"📤 Payment sent: `{tx_hash_hex}`. Waiting for confirmation...")
+
+            try:
+                with span("receipt.wait", tx_hash=tx_hash_hex):
+                    await self.wait_for_receipt(tx_hash_hex)
+            except (ReceiptTimeout, TransactionReverted) as e:
+                timer.mark("receipt")
+                return {"error": str(e), "tx_hash": tx_hash_hex, "timings": timer.result()}
+            timer.mark("receipt")
+            await report("⛓️ Payment confirmed on-chain. Asking the merchant to verify...")
+
+            verification = await self.notify_payment(tx_hash_hex, amount, payment_info.get("order_id"))
+            timer.mark("verify")
+
+            return {
+                "success": True,
+                "tx_hash": tx_hash_hex,
+                "amount": amount,
+                "recipient": recipient,
+                "verification": verification,
+                "timings": timer.result(),
+            }
+        except Exception as e:
+            logger.exception("Error during async purchase")
+            return {"error": str(e) or repr(e), "timings": timer.result()}
+
+    async def fast_buy(self, item_id) -> Dict[str, Any]:
+        """``buy_item`` paid with a signed authorization instead of a mined transfer"""
+        return await self.fast_checkout({"item_id": item_id})
+
+    async def fast_checkout(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Quote, sign a transferWithAuthorization and have the merchant release the order.
+
+        The merchant submits the authorization on-chain later. Returns an error
+        when the merchant does not offer fast checkout; use ``checkout`` then.
+        """
+        with span("purchase", service="buyer", order=order, mode="fast") as purchase_span:
+            result = await self._fast_checkout(order)
+            _finish_purchase_span(purchase_span, result)
+        return result
+
+    async def _fast_checkout(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        from fast_checkout import sign_authorization
+
+        timer = StageTimer()
+        try:
+            payment_info = await self.get_quote(order)
+            timer.mark("quote")
+            if payment_info.get("status") != "402 Payment Required":
+                return {"error": "No payment required"}
+            if not payment_info.get("fast_checkout"):
+                return {"error": "Merchant does not offer fast checkout", "timings": timer.result()}
+
+            amount = int(payment_info["amount"])
+            recipient = payment_info["recipient_address"]
+            authorization = sign_authorization(self.account.key, payment_info["token_address"],
+                                               await self.chain_id(), recipient, amount)
+            timer.mark("sign")
+            with span("merchant.verify", kind="client"):
+                resp = await self.http.post(
+                    "/fast_purchase",
+                    json={"order_id": payment_info["order_id"], "authorization": authorization},
+                    headers=inject_headers(),
+                )
+                verification = resp.json()
+            timer.mark("verify")
+
+            return {
+                "success": True,
+                "authorization_nonce": authorization["nonce"],
+                "amount": amount,
+                "recipient": recipient,
+                "verification": verification,
+                "timings": timer.result(),
+            }
+        except Exception as e:
+            logger.exception("Error during fast checkout")
+            return {"error": str(e) or repr(e), "timings": timer.result()}
+
+
+# One client per event loop: its HTTP and RPC sessions are bound to the loop that opened them
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncBuyerClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncBuyerClient:
+    """Shared AsyncBuyerClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncBuyerClient()
+    return client
+
+
+async def buy_item_async(item_id) -> Dict[str, Any]:
+    return await get_async_client().buy_item(item_id)
+
 
+async def buy_cart_async(items: List[Any]) -> Dict[str, Any]:
+    return await get_async_client().buy_cart(items)
 
-# Include the chat protocol in the buyer agent
-buyer_agent.include(chat_proto, publish_manifest=True)
 
 def run_buyer_agent():
     """Run the buyer agent"""
+    # The buyer has no HTTP API of its own; under run_bureau.py the merchant's
+    # /metrics already covers every agent in the process
+    configure_logging()
+    start_metrics_server(settings().metrics_port)
+    buyer_agent = get_buyer_agent()
+    # The agent may have been built before logging was configured
+    adopt_loggers(buyer_agent._logger)
+    # Agent.run drives the agent's own loop; the heartbeat is queued on it first
+    watch_loop("buyer", buyer_agent._loop)
     # Start the buyer agent
     buyer_agent.run()
 
 if __name__ == "__main__":
+    buyer_agent = get_buyer_agent()
     print("🚀 Starting Buyer Agent with uagents and Chat Protocol...")
     print(f"📍 Agent Name: {buyer_agent.name}")
     print(f"🔗 Agent Address: {buyer_agent.address}")
     print(f"⚡ Agent Port: 8000")
-    print(f"👤 Buyer Address: {buyer_addr}")
-    print(f"🌐 RPC URL: {RPC_URL}")
+    print(f"👤 Buyer Address: {buyer_address()}")
+    print(f"🌐 RPC URL: {settings().rpc_url}")
+    print(f"📈 Metrics: http://127.0.0.1:{settings().metrics_port}/metrics")
     print(f"💬 Chat Protocol: Enabled")
     print(f"🛒 E-commerce: Ready")
     print(f"🔗 Blockchain: Rootstock integration")
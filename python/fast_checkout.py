@@ -0,0 +1,422 @@
+"""
+Fast checkout with signed payment authorizations (EIP-3009 style).
+
+``/retry_purchase`` only trusts mined transfers, so a checkout takes at least a
+block. With FAST_CHECKOUT=1 the buyer can instead sign an EIP-712
+``TransferWithAuthorization`` for the quoted amount and post it to
+``/fast_purchase``. The merchant recovers the signer locally (no RPC), applies
+the risk policy below, releases the goods and marks the order paid. The
+``AuthorizationRelayer`` then submits the authorizations to the token's
+``transferWithAuthorization`` in batches, paying the gas from
+MERCHANT_WALLET_KEY, and records each mined transfer in the payment ledger
+like any other payment.
+
+Until it is mined an authorization is credit, so the exposure is bounded:
+
+    FAST_CHECKOUT_MAX_AMOUNT=20      rUSDT per order; larger orders pay on-chain
+    FAST_CHECKOUT_BUYER_LIMIT=50     rUSDT released but not yet settled, per buyer
+    FAST_CHECKOUT_MAX_EXPOSURE=1000  rUSDT released but not yet settled, in total
+    FAST_CHECKOUT_MIN_VALIDITY=600   seconds an authorization must stay valid
+
+Fast checkout needs MERCHANT_WALLET_KEY: without a relayer nobody would submit
+the authorizations, so the merchant does not offer it.
+
+Anyone may relay a signed authorization. When a submission reverts because
+the nonce is already used, the relayer looks for that use on-chain: if it paid
+the merchant the value, the authorization settles with that transaction. A
+buyer whose authorization fails because of the buyer (funds moved away, nonce
+spent on something else) is refused from then on, and the loss shows in
+``fast_checkout_authorizations_total{outcome="failed"}``. A submission that
+reverts for any other reason (wrong token or domain, for instance) is retried
+with a new nonce, up to FAST_CHECKOUT_MAX_REVERTS reverts in all, and then
+dropped as ``outcome="relay_reverted"``. One the relayer did not land before
+``validBefore`` shows as ``outcome="expired"``. Neither is held against the
+buyer.
+
+The token must implement ``transferWithAuthorization``; its EIP-712 domain
+name and version are FAST_CHECKOUT_TOKEN_NAME and FAST_CHECKOUT_TOKEN_VERSION.
+Recovery uses eth_keys, which switches from pure Python (~5 ms a signature) to
+libsecp256k1 when ``coincurve`` is installed. Measure with
+``python bench_signatures.py``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from eth_abi import encode
+from eth_account import Account
+from eth_keys import keys
+from eth_utils import keccak, to_bytes, to_checksum_address, to_hex
+
+from merchant_store import MerchantStore
+from merchant_wallet import NonceAllocator, replacement_gas_price, tx_state
+from metrics import FAST_CHECKOUT_AUTHORIZATIONS, FAST_CHECKOUT_EXPOSURE
+from token_events import TRANSFER_TOPIC, address_topic
+
+
+def _tokens(name: str, default: str) -> int:
+    return int(float(os.getenv(name, default)) * 10**18)
+
+
+FAST_CHECKOUT_TOKEN_NAME = os.getenv("FAST_CHECKOUT_TOKEN_NAME", "Rootstock USDT")
+FAST_CHECKOUT_TOKEN_VERSION = os.getenv("FAST_CHECKOUT_TOKEN_VERSION", "1")
+FAST_CHECKOUT_MAX_AMOUNT = _tokens("FAST_CHECKOUT_MAX_AMOUNT", "20")
+FAST_CHECKOUT_BUYER_LIMIT = _tokens("FAST_CHECKOUT_BUYER_LIMIT", "50")
+FAST_CHECKOUT_MAX_EXPOSURE = _tokens("FAST_CHECKOUT_MAX_EXPOSURE", "1000")
+FAST_CHECKOUT_MIN_VALIDITY = float(os.getenv("FAST_CHECKOUT_MIN_VALIDITY", "600"))
+# How long the buyer's authorizations stay valid
+FAST_CHECKOUT_VALIDITY = float(os.getenv("FAST_CHECKOUT_VALIDITY", "3600"))
+FAST_CHECKOUT_SUBMIT_INTERVAL = float(os.getenv("FAST_CHECKOUT_SUBMIT_INTERVAL", "2"))
+# A submission not mined after this long is re-signed with the same nonce and a higher gas price
+FAST_CHECKOUT_SUBMIT_TIMEOUT = float(os.getenv("FAST_CHECKOUT_SUBMIT_TIMEOUT", "120"))
+FAST_CHECKOUT_GAS = int(os.getenv("FAST_CHECKOUT_GAS", "150000"))
+# Reverts not caused by the buyer before the relayer gives up on an authorization
+FAST_CHECKOUT_MAX_REVERTS = int(os.getenv("FAST_CHECKOUT_MAX_REVERTS", "2"))
+# Blocks searched for someone else's relay of an authorization whose nonce is used
+FAST_CHECKOUT_RELAY_LOOKBACK = int(os.getenv("FAST_CHECKOUT_RELAY_LOOKBACK", "10000"))
+
+logger = logging.getLogger("merchant.fast_checkout")
+
+AUTHORIZATION_TYPES = {
+    "TransferWithAuthorization": [
+        {"name": "from", "type": "address"},
+        {"name": "to", "type": "address"},
+        {"name": "value", "type": "uint256"},
+        {"name": "validAfter", "type": "uint256"},
+        {"name": "validBefore", "type": "uint256"},
+        {"name": "nonce", "type": "bytes32"},
+    ],
+}
+AUTHORIZATION_USED_TOPIC = to_hex(keccak(text="AuthorizationUsed(address,bytes32)"))
+_DOMAIN_TYPEHASH = keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+_AUTHORIZATION_TYPEHASH = keccak(
+    text="TransferWithAuthorization(address from,address to,uint256 value,uint256 validAfter,"
+         "uint256 validBefore,bytes32 nonce)")
+# EIP-2: signatures with a high s are the malleated twin of a valid one
+_SECP256K1_HALF_N = 0x7FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF5D576E7357A4501DDFE92F46681B20A0
+
+TRANSFER_WITH_AUTHORIZATION_ABI = [
+    {
+        "constant": True,
+        "inputs": [{"name": "authorizer", "type": "address"}, {"name": "nonce", "type": "bytes32"}],
+        "name": "authorizationState",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function",
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "account", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+    },
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "from", "type": "address"},
+            {"name": "to", "type": "address"},
+            {"name": "value", "type": "uint256"},
+            {"name": "validAfter", "type": "uint256"},
+            {"name": "validBefore", "type": "uint256"},
+            {"name": "nonce", "type": "bytes32"},
+            {"name": "v", "type": "uint8"},
+            {"name": "r", "type": "bytes32"},
+            {"name": "s", "type": "bytes32"},
+        ],
+        "name": "transferWithAuthorization",
+        "outputs": [],
+        "type": "function",
+    }
+]
+
+
+class AuthorizationError(Exception):
+    """An authorization the merchant refuses; the message is sent back as the reason"""
+
+
+def domain_data(chain_id: int, token: str) -> Dict[str, Any]:
+    return {"name": FAST_CHECKOUT_TOKEN_NAME, "version": FAST_CHECKOUT_TOKEN_VERSION,
+            "chainId": chain_id, "verifyingContract": to_checksum_address(token)}
+
+
+@lru_cache(maxsize=None)
+def domain_separator(chain_id: int, token: str) -> bytes:
+    return keccak(encode(["bytes32", "bytes32", "bytes32", "uint256", "address"], [
+        _DOMAIN_TYPEHASH,
+        keccak(text=FAST_CHECKOUT_TOKEN_NAME),
+        keccak(text=FAST_CHECKOUT_TOKEN_VERSION),
+        chain_id,
+        to_checksum_address(token),
+    ]))
+
+
+def authorization_digest(authorization: Dict[str, Any], chain_id: int, token: str) -> bytes:
+    """The EIP-712 hash the buyer signed, computed directly instead of through the generic encoder"""
+    struct = keccak(encode(["bytes32", "address", "address", "uint256", "uint256", "uint256", "bytes32"], [
+        _AUTHORIZATION_TYPEHASH,
+        authorization["from"],
+        authorization["to"],
+        int(authorization["value"]),
+        int(authorization["validAfter"]),
+        int(authorization["validBefore"]),
+        to_bytes(hexstr=authorization["nonce"]),
+    ]))
+    return keccak(b"\x19\x01" + domain_separator(chain_id, token.lower()) + struct)
+
+
+def split_signature(signature: str):
+    """(v, r, s) of a 65-byte signature; rejects malleable and malformed ones"""
+    raw = to_bytes(hexstr=signature)
+    if len(raw) != 65:
+        raise AuthorizationError("Signature must be 65 bytes")
+    r, s, v = int.from_bytes(raw[:32], "big"), int.from_bytes(raw[32:64], "big"), raw[64]
+    v = v + 27 if v < 27 else v
+    if v not in (27, 28) or not 0 < s <= _SECP256K1_HALF_N or r == 0:
+        raise AuthorizationError("Malformed signature")
+    return v, r, s
+
+
+def recover_authorizer(authorization: Dict[str, Any], chain_id: int, token: str) -> str:
+    """Address that signed the authorization; pure CPU, no RPC"""
+    v, r, s = split_signature(authorization["signature"])
+    digest = authorization_digest(authorization, chain_id, token)
+    public_key = keys.Signature(vrs=(v - 27, r, s)).recover_public_key_from_msg_hash(digest)
+    return public_key.to_checksum_address()
+
+
+def sign_authorization(private_key, token: str, chain_id: int, to: str, value: int,
+                       valid_before: Optional[int] = None, valid_after: int = 0,
+                       nonce: Optional[bytes] = None) -> Dict[str, Any]:
+    """Buyer side: a transferWithAuthorization signed as standard EIP-712 typed data"""
+    account = Account.from_key(private_key)
+    message = {
+        "from": account.address,
+        "to": to_checksum_address(to),
+        "value": value,
+        "validAfter": valid_after,
+        "validBefore": valid_before or int(time.time() + FAST_CHECKOUT_VALIDITY),
+        "nonce": nonce or os.urandom(32),
+    }
+    signed = Account.sign_typed_data(private_key, domain_data(chain_id, token), AUTHORIZATION_TYPES, message)
+    return {**message, "nonce": to_hex(message["nonce"]), "signature": to_hex(signed.signature)}
+
+
+class FastCheckout:
+    """Merchant side: verifies authorizations locally and applies the risk policy"""
+
+    def __init__(self, store: MerchantStore, merchant: str, token: str, chain_id: int):
+        self.store = store
+        self.merchant = merchant.lower()
+        self.token = token.lower()
+        self.chain_id = chain_id
+
+    def accept(self, order_id: str, authorization: Dict[str, Any]) -> Dict[str, Any]:
+        """Release an order against a signed authorization; raises AuthorizationError"""
+        try:
+            return self._accept(order_id, authorization)
+        except AuthorizationError:
+            FAST_CHECKOUT_AUTHORIZATIONS.inc("rejected")
+            raise
+        except (KeyError, ValueError, TypeError) as e:
+            FAST_CHECKOUT_AUTHORIZATIONS.inc("rejected")
+            raise AuthorizationError(f"Malformed authorization: {e}")
+
+    def _accept(self, order_id: str, authorization: Dict[str, Any]) -> Dict[str, Any]:
+        order = self.store.get_order(order_id)
+        if order is None:
+            raise AuthorizationError("Order not found")
+        value = int(authorization["value"])
+        now = time.time()
+        if value != order["amount"]:
+            raise AuthorizationError("Amount does not match the order")
+        if authorization["to"].lower() != self.merchant:
+            raise AuthorizationError("Authorization is for another recipient")
+        if value > FAST_CHECKOUT_MAX_AMOUNT:
+            raise AuthorizationError("Order is above the fast-checkout limit; pay on-chain")
+        if int(authorization["validAfter"]) > now or int(authorization["validBefore"]) < now + FAST_CHECKOUT_MIN_VALIDITY:
+            raise AuthorizationError("Authorization validity window too short")
+        # The cheap checks above come first: recovery is the expensive part
+        buyer = recover_authorizer(authorization, self.chain_id, self.token)
+        if buyer.lower() != authorization["from"].lower():
+            raise AuthorizationError("Signature does not match the payer")
+
+        reason = self.store.accept_authorization(
+            buyer, authorization["nonce"], order_id, value, int(authorization["validAfter"]),
+            int(authorization["validBefore"]), authorization["signature"],
+            FAST_CHECKOUT_BUYER_LIMIT, FAST_CHECKOUT_MAX_EXPOSURE)
+        if reason is not None:
+            raise AuthorizationError(reason)
+        FAST_CHECKOUT_AUTHORIZATIONS.inc("accepted")
+        return {"status": "success", "message": "Payment authorized ✅. Here are your goods!",
+                "order_id": order_id, "settlement": "pending"}
+
+
+class AuthorizationRelayer:
+    """Submits accepted authorizations on-chain in batches and settles them"""
+
+    def __init__(self, w3, token_address: str, merchant: str, store: MerchantStore, private_key: Optional[str],
+                 interval: float = FAST_CHECKOUT_SUBMIT_INTERVAL, timeout: float = FAST_CHECKOUT_SUBMIT_TIMEOUT,
+                 nonces: Optional[NonceAllocator] = None):
+        self.w3 = w3
+        self.token = w3.eth.contract(address=to_checksum_address(token_address), abi=TRANSFER_WITH_AUTHORIZATION_ABI)
+        self.merchant = to_checksum_address(merchant)
+        self.store = store
+        self.account = Account.from_key(private_key) if private_key else None
+        # Shared with every other sender of the merchant wallet in the process
+        self.nonces = nonces or (NonceAllocator(w3, self.account.address) if self.account else None)
+        self.interval = interval
+        self.timeout = timeout
+
+    def _sign(self, authorization: Dict[str, Any], nonce: int, gas_price: int, chain_id: int):
+        v, r, s = split_signature(authorization["signature"])
+        tx = self.token.functions.transferWithAuthorization(
+            to_checksum_address(authorization["buyer"]), self.merchant, authorization["value"],
+            authorization["valid_after"], authorization["valid_before"],
+            to_bytes(hexstr=authorization["nonce"]), v, r.to_bytes(32, "big"), s.to_bytes(32, "big"),
+        ).build_transaction({
+            "from": self.account.address,
+            "nonce": nonce,
+            "gas": FAST_CHECKOUT_GAS,
+            "gasPrice": gas_price,
+            "chainId": chain_id,
+        })
+        return self.account.sign_transaction(tx)
+
+    def _relay_by_other(self, authorization: Dict[str, Any]) -> Optional[str]:
+        """Hash of someone else's relay of ``authorization`` that paid the merchant its value, if any"""
+        buyer = authorization["buyer"]
+        head = self.w3.eth.block_number
+        uses = self.w3.eth.get_logs({
+            "address": self.token.address,
+            "fromBlock": max(0, head - FAST_CHECKOUT_RELAY_LOOKBACK),
+            "toBlock": head,
+            "topics": [AUTHORIZATION_USED_TOPIC, address_topic(buyer), authorization["nonce"]],
+        })
+        paid = [TRANSFER_TOPIC, address_topic(buyer), address_topic(self.merchant)]
+        for use in uses:
+            receipt = self.w3.eth.get_transaction_receipt(use["transactionHash"])
+            for log in receipt["logs"]:
+                if (log["address"].lower() == self.token.address.lower()
+                        and [to_hex(topic) for topic in log["topics"]] == paid
+                        and int.from_bytes(log["data"], "big") == authorization["value"]):
+                    return to_hex(use["transactionHash"])
+        return None
+
+    def _revert_cause(self, authorization: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """(cause, relay hash) of a reverted submission: relayed, nonce_used, insufficient_balance or relay_reverted"""
+        buyer = to_checksum_address(authorization["buyer"])
+        # Our reverted submission did not use the nonce, so someone else did
+        if self.token.functions.authorizationState(buyer, to_bytes(hexstr=authorization["nonce"])).call():
+            relay_hash = self._relay_by_other(authorization)
+            return ("relayed", relay_hash) if relay_hash is not None else ("nonce_used", None)
+        if self.token.functions.balanceOf(buyer).call() < authorization["value"]:
+            return "insufficient_balance", None
+        return "relay_reverted", None
+
+    def _fail(self, authorization: Dict[str, Any], reason: str):
+        self.store.fail_authorization(authorization["buyer"], authorization["nonce"])
+        FAST_CHECKOUT_AUTHORIZATIONS.inc("failed")
+        logger.warning("Authorization failed on-chain; goods were released unpaid", extra={
+            "buyer": authorization["buyer"], "order_id": authorization["order_id"],
+            "value": authorization["value"], "reason": reason,
+        })
+
+    def _drop(self, authorization: Dict[str, Any], outcome: str):
+        """Give up on an authorization without holding it against the buyer"""
+        self.store.drop_authorization(authorization["buyer"], authorization["nonce"], outcome)
+        FAST_CHECKOUT_AUTHORIZATIONS.inc(outcome)
+        logger.warning("Authorization not relayed; goods were released unpaid", extra={
+            "buyer": authorization["buyer"], "order_id": authorization["order_id"],
+            "value": authorization["value"], "reason": outcome,
+        })
+
+    def submit_once(self) -> int:
+        """Settle mined submissions and submit the rest; returns the number settled this round"""
+        now = time.time()
+        settled = 0
+        pending = []
+        for authorization in self.store.authorizations_to_submit():
+            key = (authorization["buyer"], authorization["nonce"])
+            state, reverts = "new", authorization["reverts"]
+            if authorization["status"] == "submitted":
+                state, mined_hash = tx_state(self.w3, authorization["attempts"], authorization["sent_at"],
+                                             self.timeout, now)
+                if state == "mined":
+                    self.store.settle_authorization(*key, mined_hash)
+                    FAST_CHECKOUT_AUTHORIZATIONS.inc("settled")
+                    settled += 1
+                    continue
+                if state == "reverted":
+                    try:
+                        cause, relay_hash = self._revert_cause(authorization)
+                    except Exception as e:
+                        # Unknown cause: neither blame the buyer nor pay for another submission yet
+                        logger.warning("Could not check a reverted authorization", extra={
+                            "order_id": authorization["order_id"], "error": str(e)})
+                        continue
+                    if cause == "relayed" and self.store.settle_authorization(*key, relay_hash):
+                        FAST_CHECKOUT_AUTHORIZATIONS.inc("settled")
+                        settled += 1
+                        continue
+                    if cause != "relay_reverted":
+                        self._fail(authorization, "nonce_used" if cause == "relayed" else cause)
+                        continue
+                    reverts += 1
+                    if reverts >= FAST_CHECKOUT_MAX_REVERTS:
+                        self._drop(authorization, "relay_reverted")
+                        continue
+            if authorization["valid_before"] <= now:
+                self._drop(authorization, "expired")
+            elif state != "waiting":
+                pending.append((authorization, state, reverts))
+        FAST_CHECKOUT_EXPOSURE.set(self.store.authorization_exposure() / 10**18)
+        if not pending:
+            return settled
+        if self.account is None:
+            logger.warning("Authorizations waiting for MERCHANT_WALLET_KEY", extra={"authorizations": len(pending)})
+            return settled
+
+        gas_price = self.w3.eth.gas_price
+        chain_id = self.w3.eth.chain_id
+        # Only a replacement keeps its nonce; a reverted submission spent it
+        fresh = sum(1 for _, state, _ in pending if state != "replace")
+        nonce = self.nonces.allocate(fresh) if fresh else None
+        batch = []
+        for authorization, state, reverts in pending:
+            if state == "replace":
+                # Same nonce, so at most one submission per authorization can be mined
+                tx_nonce, attempts = authorization["tx_nonce"], authorization["attempts"]
+                price = replacement_gas_price(gas_price, authorization["gas_price"])
+            else:
+                tx_nonce, attempts, price = nonce, [], gas_price
+                nonce += 1
+            signed = self._sign(authorization, tx_nonce, price, chain_id)
+            batch.append((authorization, signed, attempts + [to_hex(signed.hash)], tx_nonce, price, reverts))
+
+        # Recorded before sending: a crash between the two resends with the same nonce
+        self.store.mark_authorizations_submitted(
+            [(a["buyer"], a["nonce"], attempts[-1], attempts, tx_nonce, price, reverts, now)
+             for a, _, attempts, tx_nonce, price, reverts in batch])
+        for authorization, signed, _, _, _, _ in batch:
+            try:
+                self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            except Exception as e:
+                logger.warning("Authorization not submitted", extra={
+                    "order_id": authorization["order_id"], "error": str(e)})
+        logger.info("Authorizations submitted", extra={"authorizations": len(batch)})
+        return settled
+
+    async def run(self):
+        """Submit forever on the running loop; RPC work happens in a worker thread"""
+        while True:
+            try:
+                settled = await asyncio.to_thread(self.submit_once)
+                if settled:
+                    logger.info("Authorizations settled", extra={"authorizations": settled})
+            except Exception as e:
+                logger.warning("Authorization relayer error", extra={"error": str(e)})
+            await asyncio.sleep(self.interval)
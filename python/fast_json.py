@@ -0,0 +1,66 @@
+"""
+JSON responses for the agent HTTP APIs without FastAPI's generic encoder.
+
+A dict returned from an endpoint goes through ``jsonable_encoder`` (a
+recursive walk that copies every container) and then ``json.dumps``.
+Endpoints here return a ``FastJSONResponse`` instead: FastAPI passes
+Response objects through untouched, and the content is rendered in one
+orjson call (or ``json.dumps`` when orjson is not installed). Payloads that
+never change are rendered once with ``StaticJSON`` and served as bytes.
+
+Measure with ``python bench_serialization.py``.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+from uuid import UUID
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder gives the same output, slower
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON; datetimes as ISO 8601 and UUIDs as strings"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass  # e.g. a cart total in wei beyond orjson's 64-bit integers
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with ``dumps``; return it to skip ``jsonable_encoder``"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class StaticJSON:
+    """A payload that never changes: rendered on first call, then served as bytes"""
+
+    def __init__(self, build: Callable[[], Any]):
+        self.build = build
+        self.body: Optional[bytes] = None
+
+    def __call__(self) -> Response:
+        if self.body is None:
+            self.body = dumps(self.build())
+        return Response(self.body, media_type="application/json")
+
+    def reset(self):
+        """Render again on the next call, after whatever the payload is built from changed"""
+        self.body = None
@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+"""
+Deterministic local stand-in for Rootstock testnet, for offline payment tests
+and benchmarks.
+
+LocalChain answers the JSON-RPC calls the buyer, merchant and transfer indexer
+make. An rUSDT-compatible ERC-20 is modelled natively at a fixed address
+(no EVM): balanceOf/decimals/symbol calls, transfer and EIP-3009
+transferWithAuthorization transactions with Transfer logs, receipts and
+eth_getLogs. Signed raw transactions are decoded and their
+sender recovered, and nonces, chain ID and gas funds are checked as a node
+would check them. Out-of-order nonces wait in a queue until the gap is filled.
+Dev keys are derived from fixed names, so addresses, the token and balances are
+the same on every run.
+
+Faults can be injected for resilience testing, using a seeded RNG:
+
+    latency      fixed delay (plus jitter) before every HTTP response
+    error_rate   fraction of calls answered with a JSON-RPC error
+    reorg_every  every N blocks, the last reorg_depth blocks are replaced.
+                 Their transactions are re-mined into blocks with new hashes,
+                 or dropped when reorg_drop is set.
+
+Run it standalone and point the agents at it:
+
+    python local_chain.py --port 8545 --latency-ms 20 --error-rate 0.01
+    # prints RPC_URL, RUSDT_CONTRACT, BUYER_PRIVATE_KEY, MERCHANT_ADDRESS and MERCHANT_WALLET_KEY exports
+
+or in-process:
+
+    with LocalChainServer(LocalChain(Faults(latency=0.005))) as server:
+        os.environ.update(server.env())
+
+Admin methods: local_mine(n), local_reorg(depth, drop), local_fund(address,
+tokens, native), local_setFaults({...}).
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import rlp
+from eth_abi import decode as abi_decode, encode as abi_encode
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import big_endian_to_int, keccak, to_checksum_address
+
+CHAIN_ID = 31  # Rootstock testnet
+GAS_PRICE = 60_000_000  # 0.06 gwei
+TRANSFER_GAS = 52_000
+BASE_GAS = 21_000
+GENESIS_TIMESTAMP = 1_700_000_000
+BLOCK_INTERVAL = 30  # seconds between block timestamps
+
+TOKEN_DECIMALS = 18
+TOKEN_SYMBOL = "rUSDT"
+TOKEN_NAME = "Rootstock USDT"
+BUYER_TOKENS = 1_000_000 * 10**TOKEN_DECIMALS
+BUYER_NATIVE = 10**18
+# Gas for the merchant's own transactions (payment-channel refunds, settlement payouts)
+MERCHANT_NATIVE = 10**18
+
+TRANSFER_TOPIC = "0x" + keccak(text="Transfer(address,address,uint256)").hex()
+AUTHORIZATION_USED_TOPIC = "0x" + keccak(text="AuthorizationUsed(address,bytes32)").hex()
+SELECTORS = {
+    keccak(text=signature)[:4]: name
+    for name, signature in {
+        "transfer": "transfer(address,uint256)",
+        "transferWithAuthorization":
+            "transferWithAuthorization(address,address,uint256,uint256,uint256,bytes32,uint8,bytes32,bytes32)",
+        "authorizationState": "authorizationState(address,bytes32)",
+        "balanceOf": "balanceOf(address)",
+        "decimals": "decimals()",
+        "symbol": "symbol()",
+        "name": "name()",
+        "totalSupply": "totalSupply()",
+    }.items()
+}
+
+
+def dev_key(name: str) -> str:
+    """Deterministic private key for a named dev account"""
+    return "0x" + keccak(text=f"local-chain:{name}").hex()
+
+
+def dev_address(name: str) -> str:
+    return Account.from_key(dev_key(name)).address
+
+
+def create_address(deployer: str, nonce: int) -> str:
+    return to_checksum_address(keccak(rlp.encode([bytes.fromhex(deployer[2:]), nonce]))[12:])
+
+
+TOKEN_ADDRESS = create_address(dev_address("deployer"), 0)
+
+
+class RPCError(Exception):
+    def __init__(self, message: str, code: int = -32000):
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass
+class Faults:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    # Methods the error rate applies to (None: every non-admin method)
+    error_methods: Optional[List[str]] = None
+    reorg_every: int = 0
+    reorg_depth: int = 1
+    reorg_drop: bool = False
+    seed: int = 0
+
+
+@dataclass
+class _Tx:
+    hash: str
+    sender: str
+    to: Optional[str]
+    nonce: int
+    gas: int
+    gas_price: int
+    value: int
+    data: bytes
+
+
+@dataclass
+class _Block:
+    number: int
+    hash: str
+    parent_hash: str
+    timestamp: int
+    txs: List[_Tx]
+    state: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+
+def _hex(value: int) -> str:
+    return hex(value)
+
+
+def _word(value: int) -> str:
+    return "0x" + f"{value:064x}"
+
+
+def _address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address.lower()[2:]
+
+
+def _topics_match(topics: List[str], wanted: List[Any]) -> bool:
+    """eth_getLogs topic filter: None matches anything, a list matches any of its entries"""
+    if len(wanted) > len(topics):
+        return False
+    for topic, allowed in zip(topics, wanted):
+        if allowed is None:
+            continue
+        if isinstance(allowed, list):
+            if topic not in [value.lower() for value in allowed]:
+                return False
+        elif topic != allowed.lower():
+            return False
+    return True
+
+
+class LocalChain:
+    """In-memory chain state and JSON-RPC dispatch; thread-safe"""
+
+    def __init__(self, faults: Optional[Faults] = None, block_time: float = 0.0,
+                 chain_id: int = CHAIN_ID, gas_price: int = GAS_PRICE):
+        self.faults = faults or Faults()
+        self.block_time = block_time
+        self.chain_id = chain_id
+        self.gas_price = gas_price
+        self.calls = 0
+        self.reorgs = 0
+
+        self._lock = threading.RLock()
+        self._rng = random.Random(self.faults.seed)
+        # authorizations: used EIP-3009 nonces, keyed "<from>:<nonce>"
+        self._state: Dict[str, Dict[str, int]] = {"native": {}, "tokens": {}, "nonces": {}, "authorizations": {}}
+        self._blocks: List[_Block] = []
+        self._pending: List[_Tx] = []
+        self._queued: Dict[str, Dict[int, _Tx]] = {}
+        self._known: Dict[str, _Tx] = {}
+        self._receipts: Dict[str, Dict[str, Any]] = {}
+
+        # Genesis: the deployer's rUSDT deployment, with the buyer and the merchant's gas funded
+        self._state["nonces"][dev_address("deployer").lower()] = 1
+        self.fund(dev_address("buyer"), BUYER_TOKENS, BUYER_NATIVE)
+        self.fund(dev_address("merchant"), 0, MERCHANT_NATIVE)
+        self._blocks.append(self._seal(0, "0x" + "00" * 32, []))
+
+        self._miner: Optional[threading.Thread] = None
+        if block_time > 0:
+            self._miner = threading.Thread(target=self._mine_loop, name="local-chain-miner", daemon=True)
+            self._miner.start()
+
+    # State
+
+    def fund(self, address: str, tokens: int = 0, native: int = 0):
+        with self._lock:
+            key = address.lower()
+            self._state["tokens"][key] = self._state["tokens"].get(key, 0) + tokens
+            self._state["native"][key] = self._state["native"].get(key, 0) + native
+
+    def token_balance(self, address: str) -> int:
+        with self._lock:
+            return self._state["tokens"].get(address.lower(), 0)
+
+    @property
+    def head(self) -> _Block:
+        return self._blocks[-1]
+
+    def _snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(values) for name, values in self._state.items()}
+
+    def _seal(self, number: int, parent_hash: str, txs: List[_Tx]) -> _Block:
+        salt = f"{number}:{parent_hash}:{self.reorgs}:" + ",".join(tx.hash for tx in txs)
+        block = _Block(number, "0x" + keccak(text=salt).hex(), parent_hash,
+                       GENESIS_TIMESTAMP + number * BLOCK_INTERVAL, txs, self._snapshot())
+        for index, tx in enumerate(txs):
+            self._receipts[tx.hash].update(blockNumber=number, blockHash=block.hash, transactionIndex=index)
+        return block
+
+    # Transactions
+
+    def _decode(self, raw: bytes) -> Tuple[_Tx, Optional[int]]:
+        try:
+            sender = Account.recover_transaction(raw)
+            if raw[0] <= 0x7F:
+                fields = TypedTransaction.from_bytes(raw).as_dict()
+                chain_id = fields["chainId"]
+                gas_price = fields.get("gasPrice", fields.get("maxFeePerGas", 0))
+                to = fields["to"]
+                nonce, gas, value, data = fields["nonce"], fields["gas"], fields["value"], bytes(fields["data"])
+            else:
+                nonce, gas_price, gas, to, value, data, v, _, _ = rlp.decode(raw)
+                v = big_endian_to_int(v)
+                chain_id = (v - 35) // 2 if v >= 35 else None
+                nonce, gas_price, gas, value = map(big_endian_to_int, (nonce, gas_price, gas, value))
+        except Exception as e:
+            raise RPCError(f"invalid transaction: {e}")
+        to_address = to_checksum_address(to) if to else None
+        tx = _Tx("0x" + keccak(raw).hex(), sender.lower(), to_address, nonce, gas, gas_price, value, data)
+        return tx, chain_id
+
+    def send_raw_transaction(self, raw: bytes) -> str:
+        tx, chain_id = self._decode(raw)
+        with self._lock:
+            if chain_id is not None and chain_id != self.chain_id:
+                raise RPCError(f"invalid chain id {chain_id}")
+            if tx.hash in self._known:
+                raise RPCError("already known")
+            expected = self._next_nonce(tx.sender)
+            if tx.nonce < expected:
+                raise RPCError("nonce too low")
+            if self._state["native"].get(tx.sender, 0) < tx.gas * tx.gas_price + tx.value:
+                raise RPCError("insufficient funds for gas * price + value")
+            self._known[tx.hash] = tx
+            self._queued.setdefault(tx.sender, {})[tx.nonce] = tx
+            self._promote(tx.sender)
+            if self.block_time <= 0:
+                self.mine()
+        return tx.hash
+
+    def preload_transfers(self, transfers: List[Tuple[str, str, int]], per_block: int = 100) -> List[str]:
+        """Mine (sender, recipient, amount) token transfers without signing them, for bulk fixtures.
+
+        Transactions are built directly, ``per_block`` to a block, so 100k transfers
+        take seconds instead of an ECDSA signature and recovery each. Senders must
+        hold the tokens (see ``fund``); gas is free. Returns the transaction hashes.
+        """
+        selector = keccak(text="transfer(address,uint256)")[:4]
+        hashes = []
+        nonces: Dict[str, int] = {}
+        with self._lock:
+            for start in range(0, len(transfers), per_block):
+                for sender, recipient, amount in transfers[start:start + per_block]:
+                    sender = sender.lower()
+                    nonce = nonces[sender] if sender in nonces else self._next_nonce(sender)
+                    nonces[sender] = nonce + 1
+                    data = selector + abi_encode(["address", "uint256"], [to_checksum_address(recipient), amount])
+                    tx_hash = "0x" + keccak(text=f"preload:{sender}:{nonce}").hex()
+                    tx = _Tx(tx_hash, sender, TOKEN_ADDRESS, nonce, TRANSFER_GAS, 0, 0, data)
+                    self._known[tx_hash] = tx
+                    self._pending.append(tx)
+                    hashes.append(tx_hash)
+                self.mine()
+        return hashes
+
+    def _next_nonce(self, sender: str) -> int:
+        nonce = self._state["nonces"].get(sender, 0)
+        return nonce + sum(1 for tx in self._pending if tx.sender == sender)
+
+    def _promote(self, sender: str):
+        """Move queued transactions whose nonce gap has been filled into the pending pool"""
+        queued = self._queued.get(sender, {})
+        nonce = self._next_nonce(sender)
+        while nonce in queued:
+            self._pending.append(queued.pop(nonce))
+            nonce += 1
+
+    def _apply(self, tx: _Tx) -> Dict[str, Any]:
+        state = self._state
+        state["nonces"][tx.sender] = tx.nonce + 1
+        logs: List[Dict[str, Any]] = []
+        status = 1
+        gas_used = BASE_GAS
+
+        if tx.to is not None and tx.to.lower() == TOKEN_ADDRESS.lower():
+            gas_used = TRANSFER_GAS
+            name = SELECTORS.get(tx.data[:4])
+            transfer = None
+            if tx.gas < gas_used:
+                pass
+            elif name == "transfer":
+                recipient, amount = abi_decode(["address", "uint256"], tx.data[4:])
+                transfer = tx.sender, recipient.lower(), amount, None
+            elif name == "transferWithAuthorization":
+                transfer = self._authorization(tx.data[4:])
+            if transfer is None or state["tokens"].get(transfer[0], 0) < transfer[2]:
+                status = 0
+            else:
+                sender, recipient, amount, authorization = transfer
+                if authorization is not None:
+                    state["authorizations"][authorization] = 1
+                    logs.append({
+                        "address": TOKEN_ADDRESS,
+                        "topics": [AUTHORIZATION_USED_TOPIC, _address_topic(sender), authorization.split(":")[1]],
+                        "data": "0x",
+                        "removed": False,
+                    })
+                state["tokens"][sender] -= amount
+                state["tokens"][recipient] = state["tokens"].get(recipient, 0) + amount
+                logs.append({
+                    "address": TOKEN_ADDRESS,
+                    "topics": [TRANSFER_TOPIC, _address_topic(sender), _address_topic(recipient)],
+                    "data": _word(amount),
+                    "removed": False,
+                })
+        elif tx.to is not None and tx.value:
+            to = tx.to.lower()
+            state["native"][to] = state["native"].get(to, 0) + tx.value
+            state["native"][tx.sender] -= tx.value
+
+        gas_used = min(gas_used, tx.gas)
+        state["native"][tx.sender] -= gas_used * tx.gas_price
+        return {"status": status, "gasUsed": gas_used, "logs": logs}
+
+    def _authorization(self, args: bytes) -> Optional[Tuple[str, str, int, str]]:
+        """(from, to, value, nonce key) of a transferWithAuthorization that is signed, unused and in its window"""
+        try:
+            sender, recipient, value, valid_after, valid_before, nonce, v, r, s = abi_decode(
+                ["address", "address", "uint256", "uint256", "uint256", "bytes32", "uint8", "bytes32", "bytes32"],
+                args)
+            key = f"{sender.lower()}:0x{nonce.hex()}"
+            timestamp = GENESIS_TIMESTAMP + len(self._blocks) * BLOCK_INTERVAL
+            if key in self._state["authorizations"] or not valid_after < timestamp < valid_before:
+                return None
+            message = encode_typed_data(full_message={
+                "types": {
+                    "EIP712Domain": [
+                        {"name": "name", "type": "string"},
+                        {"name": "version", "type": "string"},
+                        {"name": "chainId", "type": "uint256"},
+                        {"name": "verifyingContract", "type": "address"},
+                    ],
+                    "TransferWithAuthorization": [
+                        {"name": "from", "type": "address"},
+                        {"name": "to", "type": "address"},
+                        {"name": "value", "type": "uint256"},
+                        {"name": "validAfter", "type": "uint256"},
+                        {"name": "validBefore", "type": "uint256"},
+                        {"name": "nonce", "type": "bytes32"},
+                    ],
+                },
+                "primaryType": "TransferWithAuthorization",
+                "domain": {"name": TOKEN_NAME, "version": "1", "chainId": self.chain_id,
+                           "verifyingContract": TOKEN_ADDRESS},
+                "message": {"from": sender, "to": recipient, "value": value, "validAfter": valid_after,
+                            "validBefore": valid_before, "nonce": nonce},
+            })
+            signer = Account.recover_message(message, vrs=(v, int.from_bytes(r, "big"), int.from_bytes(s, "big")))
+        except Exception:
+            return None
+        if signer.lower() != sender.lower():
+            return None
+        return sender.lower(), recipient.lower(), value, key
+
+    def mine(self, blocks: int = 1) -> int:
+        """Seal ``blocks`` blocks, the first holding every pending transaction"""
+        with self._lock:
+            for _ in range(blocks):
+                txs, self._pending = self._pending, []
+                for tx in txs:
+                    self._receipts[tx.hash] = self._apply(tx)
+                self._blocks.append(self._seal(len(self._blocks), self.head.hash, txs))
+                faults = self.faults
+                if faults.reorg_every and self.head.number % faults.reorg_every == 0:
+                    self.reorg(faults.reorg_depth, faults.reorg_drop)
+            return self.head.number
+
+    def _mine_loop(self):
+        while True:
+            time.sleep(self.block_time)
+            with self._lock:
+                if self._pending:
+                    self.mine()
+
+    def reorg(self, depth: int, drop: bool = False):
+        """Replace the last ``depth`` blocks; their transactions are re-mined unless ``drop``"""
+        with self._lock:
+            depth = min(depth, len(self._blocks) - 1)
+            if depth <= 0:
+                return
+            removed = self._blocks[-depth:]
+            del self._blocks[-depth:]
+            self._state = {name: dict(values) for name, values in self.head.state.items()}
+            self.reorgs += 1
+            for block in removed:
+                for tx in block.txs:
+                    del self._receipts[tx.hash]
+                    if drop:
+                        del self._known[tx.hash]
+            if drop:
+                # The chain stays as long: empty blocks take the place of the removed ones
+                for _ in removed:
+                    self._blocks.append(self._seal(len(self._blocks), self.head.hash, []))
+                return
+            for block in removed:
+                for tx in block.txs:
+                    self._receipts[tx.hash] = self._apply(tx)
+                self._blocks.append(self._seal(len(self._blocks), self.head.hash, block.txs))
+
+    # JSON-RPC
+
+    def _block_number(self, tag) -> int:
+        if tag in (None, "latest", "pending", "safe", "finalized"):
+            return self.head.number
+        if tag == "earliest":
+            return 0
+        return int(tag, 16) if isinstance(tag, str) else int(tag)
+
+    def _receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        receipt = self._receipts.get(tx_hash.lower())
+        if receipt is None or "blockHash" not in receipt:
+            return None
+        tx = self._known[tx_hash.lower()]
+        common = {
+            "transactionHash": tx.hash,
+            "transactionIndex": _hex(receipt["transactionIndex"]),
+            "blockHash": receipt["blockHash"],
+            "blockNumber": _hex(receipt["blockNumber"]),
+        }
+        return {
+            **common,
+            "from": to_checksum_address(tx.sender),
+            "to": tx.to,
+            "cumulativeGasUsed": _hex(receipt["gasUsed"]),
+            "gasUsed": _hex(receipt["gasUsed"]),
+            "effectiveGasPrice": _hex(tx.gas_price),
+            "contractAddress": None,
+            "logsBloom": "0x" + "00" * 256,
+            "status": _hex(receipt["status"]),
+            "type": "0x0",
+            "logs": [{**log, **common, "logIndex": _hex(i)} for i, log in enumerate(receipt["logs"])],
+        }
+
+    def _get_logs(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        start = self._block_number(query.get("fromBlock", "latest"))
+        end = self._block_number(query.get("toBlock", "latest"))
+        addresses = query.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {address.lower() for address in addresses} if addresses else None
+        topics = query.get("topics") or []
+
+        matches = []
+        for block in self._blocks[start:end + 1]:
+            for tx in block.txs:
+                for log in self._receipt(tx.hash)["logs"]:
+                    if addresses is not None and log["address"].lower() not in addresses:
+                        continue
+                    if _topics_match(log["topics"], topics):
+                        matches.append(log)
+        return matches
+
+    def _call(self, call: Dict[str, Any]) -> str:
+        to = (call.get("to") or "").lower()
+        data = bytes.fromhex((call.get("data") or call.get("input") or "0x")[2:])
+        if to != TOKEN_ADDRESS.lower():
+            return "0x"
+        name = SELECTORS.get(data[:4])
+        if name == "balanceOf":
+            (owner,) = abi_decode(["address"], data[4:])
+            return "0x" + abi_encode(["uint256"], [self._state["tokens"].get(owner.lower(), 0)]).hex()
+        if name == "authorizationState":
+            authorizer, nonce = abi_decode(["address", "bytes32"], data[4:])
+            used = f"{authorizer.lower()}:0x{nonce.hex()}" in self._state["authorizations"]
+            return "0x" + abi_encode(["bool"], [used]).hex()
+        if name == "decimals":
+            return "0x" + abi_encode(["uint8"], [TOKEN_DECIMALS]).hex()
+        if name in ("symbol", "name"):
+            return "0x" + abi_encode(["string"], [TOKEN_SYMBOL if name == "symbol" else TOKEN_NAME]).hex()
+        if name == "totalSupply":
+            return "0x" + abi_encode(["uint256"], [sum(self._state["tokens"].values())]).hex()
+        if name == "transfer":
+            return "0x" + abi_encode(["bool"], [True]).hex()
+        if name == "transferWithAuthorization":
+            return "0x"
+        raise RPCError("execution reverted")
+
+    def _block(self, tag, full: bool) -> Optional[Dict[str, Any]]:
+        number = self._block_number(tag)
+        if number >= len(self._blocks):
+            return None
+        block = self._blocks[number]
+        return {
+            "number": _hex(block.number),
+            "hash": block.hash,
+            "parentHash": block.parent_hash,
+            "timestamp": _hex(block.timestamp),
+            "miner": "0x" + "00" * 20,
+            "gasLimit": _hex(6_800_000),
+            "gasUsed": _hex(sum(self._receipts[tx.hash]["gasUsed"] for tx in block.txs)),
+            "transactions": [self._tx(tx.hash) if full else tx.hash for tx in block.txs],
+            "uncles": [],
+        }
+
+    def _tx(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        tx = self._known.get(tx_hash.lower())
+        if tx is None:
+            return None
+        receipt = self._receipts.get(tx.hash, {})
+        return {
+            "hash": tx.hash,
+            "from": to_checksum_address(tx.sender),
+            "to": tx.to,
+            "nonce": _hex(tx.nonce),
+            "gas": _hex(tx.gas),
+            "gasPrice": _hex(tx.gas_price),
+            "value": _hex(tx.value),
+            "input": "0x" + tx.data.hex(),
+            "blockHash": receipt.get("blockHash"),
+            "blockNumber": _hex(receipt["blockNumber"]) if "blockNumber" in receipt else None,
+            "transactionIndex": _hex(receipt["transactionIndex"]) if "transactionIndex" in receipt else None,
+        }
+
+    def _dispatch(self, method: str, params: List[Any]) -> Any:
+        if method == "eth_chainId":
+            return _hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "eth_gasPrice":
+            return _hex(self.gas_price)
+        if method == "eth_blockNumber":
+            return _hex(self.head.number)
+        if method == "eth_getTransactionCount":
+            address = params[0].lower()
+            if len(params) > 1 and params[1] == "pending":
+                return _hex(self._next_nonce(address))
+            return _hex(self._state["nonces"].get(address, 0))
+        if method == "eth_getBalance":
+            return _hex(self._state["native"].get(params[0].lower(), 0))
+        if method == "eth_estimateGas":
+            call = params[0]
+            return _hex(TRANSFER_GAS if (call.get("to") or "").lower() == TOKEN_ADDRESS.lower() else BASE_GAS)
+        if method == "eth_call":
+            return self._call(params[0])
+        if method == "eth_sendRawTransaction":
+            return self.send_raw_transaction(bytes.fromhex(params[0][2:]))
+        if method == "eth_getTransactionReceipt":
+            return self._receipt(params[0])
+        if method == "eth_getTransactionByHash":
+            return self._tx(params[0])
+        if method == "eth_getLogs":
+            return self._get_logs(params[0])
+        if method == "eth_getBlockByNumber":
+            return self._block(params[0], bool(params[1]) if len(params) > 1 else False)
+        if method == "eth_getBlockByHash":
+            for block in self._blocks:
+                if block.hash == params[0]:
+                    return self._block(block.number, bool(params[1]) if len(params) > 1 else False)
+            return None
+        if method in ("local_mine", "evm_mine"):
+            return _hex(self.mine(int(params[0]) if params else 1))
+        if method == "local_reorg":
+            self.reorg(int(params[0]) if params else 1, bool(params[1]) if len(params) > 1 else False)
+            return _hex(self.head.number)
+        if method == "local_fund":
+            self.fund(params[0], int(params[1]) if len(params) > 1 else 0, int(params[2]) if len(params) > 2 else 0)
+            return True
+        if method == "local_setFaults":
+            self.set_faults(**params[0])
+            return True
+        raise RPCError(f"the method {method} does not exist/is not available", -32601)
+
+    def set_faults(self, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                if not hasattr(self.faults, key):
+                    raise RPCError(f"unknown fault {key}", -32602)
+                setattr(self.faults, key, value)
+
+    def _injected_error(self, method: str) -> bool:
+        faults = self.faults
+        if not faults.error_rate or method.startswith(("local_", "evm_")):
+            return False
+        if faults.error_methods is not None and method not in faults.error_methods:
+            return False
+        return self._rng.random() < faults.error_rate
+
+    def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one JSON-RPC request object"""
+        request_id = payload.get("id")
+        method = payload.get("method", "")
+        with self._lock:
+            self.calls += 1
+            try:
+                if self._injected_error(method):
+                    raise RPCError("injected fault", -32603)
+                result = self._dispatch(method, payload.get("params") or [])
+            except RPCError as e:
+                return {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def delay(self) -> float:
+        faults = self.faults
+        if not faults.latency and not faults.jitter:
+            return 0.0
+        with self._lock:
+            return faults.latency + self._rng.uniform(0, faults.jitter)
+
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    chain: LocalChain
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.send_error(400)
+            return
+        delay = self.chain.delay()
+        if delay:
+            time.sleep(delay)
+        if isinstance(payload, list):
+            response = [self.chain.request(item) for item in payload]
+        else:
+            response = self.chain.request(payload)
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalChainServer:
+    """Serves a LocalChain over HTTP JSON-RPC from a daemon thread"""
+
+    def __init__(self, chain: Optional[LocalChain] = None, host: str = "127.0.0.1", port: int = 0):
+        self.chain = chain or LocalChain()
+        handler = type("RPCHandler", (_RPCHandler,), {"chain": self.chain})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """Settings that point the buyer and merchant at this chain"""
+        return {
+            "RPC_URL": self.url,
+            "RUSDT_CONTRACT": TOKEN_ADDRESS,
+            "BUYER_PRIVATE_KEY": dev_key("buyer"),
+            "MERCHANT_ADDRESS": dev_address("merchant"),
+            "MERCHANT_WALLET_KEY": dev_key("merchant"),
+        }
+
+    def start(self) -> "LocalChainServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="local-chain-rpc", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "LocalChainServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--block-time", type=float, default=0.0, help="seconds per block (0: mine on every tx)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--reorg-every", type=int, default=0)
+    parser.add_argument("--reorg-depth", type=int, default=1)
+    parser.add_argument("--reorg-drop", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    faults = Faults(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                    reorg_every=args.reorg_every, reorg_depth=args.reorg_depth,
+                    reorg_drop=args.reorg_drop, seed=args.seed)
+    server = LocalChainServer(LocalChain(faults, block_time=args.block_time), args.host, args.port)
+    print(f"⛓️ Local chain (id {CHAIN_ID}) on {server.url}")
+    for key, value in server.env().items():
+        print(f"export {key}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
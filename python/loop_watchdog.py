@@ -0,0 +1,120 @@
+"""
+Opt-in event-loop blocking detector (LOOP_WATCHDOG=1).
+
+A heartbeat coroutine on the watched loop sleeps for a fixed interval and
+records how late it wakes up. That lateness is the loop lag. A watchdog thread
+checks the last heartbeat. When the loop has not come back for longer than the
+threshold, it logs the loop thread's current stack, which is the callback
+holding the loop. Lag percentiles over a recent window go to /metrics.
+
+    LOOP_WATCHDOG_INTERVAL_MS=50     heartbeat period
+    LOOP_WATCHDOG_THRESHOLD_MS=100   stall that triggers a stack dump
+    LOOP_WATCHDOG_WINDOW=600         heartbeats kept for percentiles
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG, EVENT_LOOP_LAG_QUANTILES
+
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "0") == "1"
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "50")) / 1000
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100")) / 1000
+LOOP_WATCHDOG_WINDOW = int(os.getenv("LOOP_WATCHDOG_WINDOW", "600"))
+
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+logger = logging.getLogger("loop_watchdog")
+
+
+class LoopWatchdog:
+    """Measures lag on one event loop and reports callbacks that block it"""
+
+    def __init__(self, name: str, interval: float = LOOP_WATCHDOG_INTERVAL,
+                 threshold: float = LOOP_WATCHDOG_THRESHOLD, window: int = LOOP_WATCHDOG_WINDOW):
+        self.name = name
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=window)
+        self.blocks = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stalled_since: Optional[float] = None
+        self._stop = threading.Event()
+        # Held so the heartbeat cannot be garbage-collected while it runs
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def heartbeat(self):
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        while not self._stop.is_set():
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._last_beat = now
+            self.lags.append(lag)
+            EVENT_LOOP_LAG.observe(lag, self.name)
+
+    def _watch(self):
+        next_publish = time.monotonic() + 1.0
+        while not self._stop.wait(self.interval / 2):
+            now = time.monotonic()
+            stalled = now - self._last_beat - self.interval
+            if stalled > self.threshold and self._loop_thread is not None:
+                if self._stalled_since is None:
+                    self._stalled_since = self._last_beat
+                    self._report(stalled)
+            elif self._stalled_since is not None:
+                blocked_ms = (self._last_beat - self._stalled_since - self.interval) * 1000
+                logger.warning("Event loop unblocked", extra={"loop": self.name, "blocked_ms": round(blocked_ms)})
+                self._stalled_since = None
+            if now >= next_publish:
+                self._publish()
+                next_publish = now + 1.0
+
+    def _report(self, stalled: float):
+        self.blocks += 1
+        EVENT_LOOP_BLOCKS.inc(self.name)
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>\n"
+        logger.warning("Event loop blocked", extra={
+            "loop": self.name, "stalled_ms": round(stalled * 1000), "stack": stack,
+        })
+
+    def _publish(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return
+        for q in QUANTILES:
+            EVENT_LOOP_LAG_QUANTILES.set(lags[min(int(q * len(lags)), len(lags) - 1)], self.name, str(q))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Schedule the heartbeat on ``loop`` (running or not) and start the watchdog thread"""
+        self._heartbeat = loop.create_task(self.heartbeat())
+        threading.Thread(target=self._watch, name=f"loop-watchdog-{self.name}", daemon=True).start()
+
+    def stop(self):
+        """Stop the watchdog thread and cancel the heartbeat; callable from any thread"""
+        self._stop.set()
+        heartbeat, self._heartbeat = self._heartbeat, None
+        if heartbeat is not None and not heartbeat.done():
+            loop = heartbeat.get_loop()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(heartbeat.cancel)
+
+
+def watch_loop(name: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[LoopWatchdog]:
+    """Watch ``loop`` (default: the running loop) when LOOP_WATCHDOG=1"""
+    if not LOOP_WATCHDOG:
+        return None
+    watchdog = LoopWatchdog(name)
+    watchdog.start(loop or asyncio.get_running_loop())
+    return watchdog
@@ -1,55 +1,153 @@
+from __future__ import annotations
+
 import os
-import threading
+import time
+import asyncio
+import logging
 from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
 from uuid import uuid4
 from fastapi import FastAPI, HTTPException
-from web3 import Web3
-from dotenv import load_dotenv
-import uvicorn
-from uagents import Agent, Context, Protocol
-from typing import Dict, Any, List
+from fast_json import FastJSONResponse, StaticJSON
+from merchant_store import MerchantStore
+from merchant_wallet import NonceAllocator
+from profiling import install_profiling
+from response_cache import ResponseCache
+from metrics import CHAT_ROUTING_SECONDS, PAYMENT_VERIFICATIONS, instrument_app, send_chat
+from structured_logging import CorrelationIdMiddleware, adopt_loggers, configure_logging, correlation_id
+from traffic_capture import install_capture
+from tracing import chat_parent, install_tracing, is_trace_metadata, span
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 import json
 
-# Import Agent Chat Protocol components
-from uagents_core.contrib.protocols.chat import (
-    ChatMessage,
-    ChatAcknowledgement,
-    TextContent,
-    ResourceContent,
-    Resource,
-    MetadataContent,
-    StartSessionContent,
-    EndSessionContent,
-    chat_protocol_spec
-)
-
-load_dotenv()
-
-# Create uagents merchant agent using private key
-MERCHANT_PRIVATE_KEY = os.getenv("MERCHANT_PRIVATE_KEY")
-merchant_agent = Agent(
-    name="merchant",
-    seed=MERCHANT_PRIVATE_KEY,
-    port=8003,
-    endpoint=["http://localhost:8003/submit"],
-    publish_agent_details=True
-)
-
-# Initialize the chat protocol
-chat_proto = Protocol(spec=chat_protocol_spec)
+# web3, uagents and the eth_* signing stack (payment channels, fast checkout,
+# settlement) are imported on first use: the HTTP workers only need the agent's
+# address, never the agent itself, and most requests never touch RPC
+if TYPE_CHECKING:
+    from fast_checkout import FastCheckout
+    from payment_channels import ChannelBook
+    from uagents import Agent, Context
+    from uagents_core.contrib.protocols.chat import ChatMessage, ChatAcknowledgement
+    from web3 import Web3
+
+MERCHANT_AGENT_NAME = "merchant"
+
+http_logger = logging.getLogger("merchant.http")
+payments_logger = logging.getLogger("merchant.payments")
+
+
+@lru_cache(maxsize=None)
+def settings() -> SimpleNamespace:
+    """Merchant configuration, read from the environment (and .env) on first use"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    return SimpleNamespace(
+        private_key=os.getenv("MERCHANT_PRIVATE_KEY"),
+        # Same port as the HTTP API unless the HTTP tier runs in separate workers
+        agent_port=int(os.getenv("MERCHANT_AGENT_PORT", "8003")),
+        rpc_url=os.getenv("RPC_URL"),
+        merchant_address=os.getenv("MERCHANT_ADDRESS"),
+        rusdt_contract=os.getenv("RUSDT_CONTRACT"),
+        # Key of the merchant address; only needed to refund payment channels, send settlement payouts
+        # and submit fast-checkout authorizations
+        wallet_key=os.getenv("MERCHANT_WALLET_KEY"),
+        fast_checkout=os.getenv("FAST_CHECKOUT", "0") == "1",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_merchant_agent() -> Agent:
+    """Create the uagents merchant agent (using the private key) with the chat protocol"""
+    from uagents import Agent, Protocol
+    from uagents_core.contrib.protocols.chat import (
+        ChatMessage,
+        ChatAcknowledgement,
+        chat_protocol_spec
+    )
+    from agent_storage import use_agent_storage
+
+    config = settings()
+    merchant_agent = Agent(
+        name=MERCHANT_AGENT_NAME,
+        seed=config.private_key,
+        port=config.agent_port,
+        endpoint=[f"http://localhost:{config.agent_port}/submit"],
+        publish_agent_details=True
+    )
+    adopt_loggers(merchant_agent._logger)
+    use_agent_storage(merchant_agent)
+    merchant_agent.on_event("startup")(startup_function)
+
+    # Initialize the chat protocol and include it in the merchant agent
+    chat_proto = Protocol(spec=chat_protocol_spec)
+    chat_proto.on_message(ChatMessage)(handle_chat_message)
+    chat_proto.on_message(ChatAcknowledgement)(handle_acknowledgement)
+    merchant_agent.include(chat_proto, publish_manifest=True)
+    return merchant_agent
+
+
+@lru_cache(maxsize=None)
+def merchant_agent_address() -> str:
+    """The agent address, derived from the seed without building the Agent"""
+    seed = settings().private_key
+    if not seed:
+        return get_merchant_agent().address
+    from uagents_core.identity import Identity
+    return Identity.from_seed(seed, 0).address
 
 # startup handler
-@merchant_agent.on_event("startup")
 async def startup_function(ctx: Context):
+    merchant_agent = get_merchant_agent()
     ctx.logger.info(f"Hello, I'm merchant agent {merchant_agent.name} and my address is {merchant_agent.address}.")
     ctx.logger.info("Merchant agent is ready to handle chat protocol messages and e-commerce operations.")
+    # The process that owns the agent also owns the chain indexer
+    config = settings()
+    if config.rusdt_contract and config.merchant_address:
+        from fast_checkout import AuthorizationRelayer
+        from payment_channels import ChannelSettler
+        from settlement import SETTLEMENT_INTERVAL, Settlement
+        from transfer_indexer import TransferIndexer
+        indexer = TransferIndexer(get_web3(), get_token(), config.merchant_address, get_store())
+        asyncio.create_task(indexer.run())
+        # Refunds, payouts and submissions all spend nonces of the merchant wallet
+        nonces = get_wallet_nonces()
+        settler = ChannelSettler(get_web3(), get_token(), get_store(), config.wallet_key, nonces=nonces)
+        asyncio.create_task(settler.run())
+        if SETTLEMENT_INTERVAL > 0:
+            settlement = Settlement(get_web3(), get_token(), get_store(), config.merchant_address, config.wallet_key,
+                                    nonces=nonces)
+            asyncio.create_task(settlement.run())
+        if fast_checkout_enabled():
+            relayer = AuthorizationRelayer(get_web3(), config.rusdt_contract, config.merchant_address, get_store(),
+                                           config.wallet_key, nonces=nonces)
+            asyncio.create_task(relayer.run())
+        elif config.fast_checkout:
+            ctx.logger.warning("FAST_CHECKOUT=1 ignored: MERCHANT_WALLET_KEY is not set")
 
 # Chat Protocol Message Handler
-@chat_proto.on_message(ChatMessage)
 async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     """Handle incoming chat messages using the standardized chat protocol"""
-    ctx.logger.info(f"Received chat message from {sender} with msg_id: {msg.msg_id}")
-    
+    token = correlation_id.set(str(msg.msg_id))
+    try:
+        ctx.logger.info(f"Received chat message from {sender} with msg_id: {msg.msg_id}")
+
+        with span("chat.receive", service="merchant", parent=chat_parent(msg), sender=sender):
+            await _handle_chat_content(ctx, sender, msg)
+    finally:
+        correlation_id.reset(token)
+
+
+async def _handle_chat_content(ctx: Context, sender: str, msg: ChatMessage):
+    from uagents_core.contrib.protocols.chat import (
+        ChatMessage,
+        ChatAcknowledgement,
+        TextContent,
+        ResourceContent,
+        MetadataContent,
+    )
+
     # Process each content item in the message
     for item in msg.content:
         if isinstance(item, TextContent):
@@ -60,7 +158,7 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
                 timestamp=datetime.utcnow(),
                 acknowledged_msg_id=msg.msg_id
             )
-            await ctx.send(sender, ack)
+            await send_chat(ctx, "merchant", sender, ack)
             
             # Process the message and generate response
             response_text = await process_merchant_message(item.text)
@@ -71,28 +169,63 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
                 msg_id=uuid4(),
                 content=[TextContent(type="text", text=response_text)]
             )
-            await ctx.send(sender, response)
+            await send_chat(ctx, "merchant", sender, response)
             
         elif isinstance(item, ResourceContent):
             ctx.logger.info(f"Resource content from {sender}: {item.resource_id}")
             # Handle resource content if needed
             
-        elif isinstance(item, MetadataContent):
+        elif isinstance(item, MetadataContent) and "channel" in item.metadata:
+            await send_chat(ctx, "merchant", sender,
+                            ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id))
+            # Off the loop: opening verifies the deposit over RPC, and an update walks
+            # up to a whole order's worth of hash-chain words
+            reply = await asyncio.to_thread(handle_channel_message, item.metadata)
+            response = ChatMessage(
+                timestamp=datetime.utcnow(),
+                msg_id=uuid4(),
+                content=[MetadataContent(type="metadata", metadata=reply)]
+            )
+            await send_chat(ctx, "merchant", sender, response)
+
+        elif isinstance(item, MetadataContent) and not is_trace_metadata(item):
             ctx.logger.info(f"Metadata content from {sender}: {item.metadata}")
             # Handle metadata content if needed
 
 # Chat Protocol Acknowledgement Handler
-@chat_proto.on_message(ChatAcknowledgement)
 async def handle_acknowledgement(ctx: Context, sender: str, msg: ChatAcknowledgement):
     """Handle chat acknowledgements"""
     ctx.logger.info(f"Received acknowledgement from {sender} for message: {msg.acknowledged_msg_id}")
 
+# Chat intents in match order, each with its trigger keywords
+MERCHANT_INTENTS = [
+    ("greeting", ["hello", "hi", "greetings"]),
+    ("catalog", ["products", "inventory", "catalog", "goods"]),
+    ("purchase", ["buy", "purchase", "order"]),
+    ("payment", ["payment", "transaction", "verify"]),
+    ("help", ["help", "support"]),
+]
+
+
+def merchant_intent(message: str) -> str:
+    message_lower = message.lower()
+    for intent, keywords in MERCHANT_INTENTS:
+        if any(keyword in message_lower for keyword in keywords):
+            return intent
+    return "unknown"
+
+
 async def process_merchant_message(message: str) -> str:
     """Process incoming chat messages and generate merchant-specific responses"""
-    message_lower = message.lower()
-    
+    start = time.perf_counter()
+    intent, response = MERCHANT_REPLIES.lookup(message)
+    CHAT_ROUTING_SECONDS.observe(time.perf_counter() - start, "merchant", intent)
+    return response
+
+
+def merchant_reply(intent: str) -> str:
     # Handle different types of merchant inquiries
-    if any(keyword in message_lower for keyword in ["hello", "hi", "greetings"]):
+    if intent == "greeting":
         return """🛍️ **Welcome to the Merchant Agent!**
 
 I'm your blockchain e-commerce assistant. I can help you with:
@@ -104,7 +237,7 @@ I'm your blockchain e-commerce assistant. I can help you with:
 
 What would you like to do today?"""
 
-    elif any(keyword in message_lower for keyword in ["products", "inventory", "catalog", "goods"]):
+    elif intent == "catalog":
         return """📦 **Available Products:**
 
 **Token-Priced Items:**
@@ -123,7 +256,7 @@ What would you like to do today?"""
 
 To purchase an item, let me know the item ID or name!"""
 
-    elif any(keyword in message_lower for keyword in ["buy", "purchase", "order"]):
+    elif intent == "purchase":
         return """💳 **Ready to Make a Purchase!**
 
 To buy an item, please specify:
@@ -133,7 +266,7 @@ To buy an item, please specify:
 
 Which item would you like to purchase?"""
 
-    elif any(keyword in message_lower for keyword in ["payment", "transaction", "verify"]):
+    elif intent == "payment":
         return """🔍 **Payment Verification**
 
 I can help you verify payments by:
@@ -143,7 +276,7 @@ I can help you verify payments by:
 
 To verify a payment, please provide the transaction hash."""
 
-    elif any(keyword in message_lower for keyword in ["help", "support"]):
+    elif intent == "help":
         return """❓ **Merchant Agent Help**
 
 I'm a blockchain-enabled merchant agent that can:
@@ -180,13 +313,15 @@ I specialize in blockchain e-commerce operations. You can ask me about:
 
 What would you like to do?"""
 
-app = FastAPI(title="Merchant Agent")
 
-RPC_URL = os.getenv("RPC_URL")
-MERCHANT_ADDRESS = os.getenv("MERCHANT_ADDRESS")
-RUSDT_CONTRACT = os.getenv("RUSDT_CONTRACT")
+MERCHANT_REPLIES = ResponseCache("merchant", merchant_intent, merchant_reply)
 
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+app = FastAPI(title="Merchant Agent", default_response_class=FastJSONResponse)
+instrument_app(app, "merchant")
+app.add_middleware(CorrelationIdMiddleware)
+install_profiling(app)
+install_tracing(app, "merchant")
+install_capture(app, "merchant")
 
 ERC20_ABI = [
     {
@@ -198,69 +333,234 @@ ERC20_ABI = [
         ],
         "name": "Transfer",
         "type": "event",
-    }
+    },
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "_to", "type": "address"},
+            {"name": "_value", "type": "uint256"},
+        ],
+        "name": "transfer",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function",
+    },
 ]
 
-token = w3.eth.contract(address=RUSDT_CONTRACT, abi=ERC20_ABI)
 
+@lru_cache(maxsize=None)
+def get_web3() -> Web3:
+    from web3 import Web3
+    from rpc import InstrumentedHTTPProvider
+    return Web3(InstrumentedHTTPProvider(settings().rpc_url))
+
+
+@lru_cache(maxsize=None)
+def get_token():
+    return get_web3().eth.contract(address=settings().rusdt_contract, abi=ERC20_ABI)
+
+
+@lru_cache(maxsize=None)
+def get_wallet_nonces() -> Optional[NonceAllocator]:
+    """The one nonce allocator for MERCHANT_WALLET_KEY in this process (None without the key)"""
+    wallet_key = settings().wallet_key
+    if not wallet_key:
+        return None
+    from eth_account import Account
+    return NonceAllocator(get_web3(), Account.from_key(wallet_key).address)
 
-def verify_payment(tx_hash: str, expected_to: str, expected_amount: int) -> bool:
+
+def fast_checkout_enabled() -> bool:
+    """FAST_CHECKOUT=1 with a relayer key; without one, released goods would never be paid for"""
+    config = settings()
+    return config.fast_checkout and bool(config.wallet_key)
+
+
+def token_transfers(receipt) -> List[Dict[str, Any]]:
+    """rUSDT Transfer events in ``receipt``; process_receipt decodes a Transfer from any contract"""
+    token = settings().rusdt_contract.lower()
+    return [log for log in get_token().events.Transfer().process_receipt(receipt) if log["address"].lower() == token]
+
+
+def verify_deposit(tx_hash: str, buyer: str, amount: int) -> bool:
+    """A payment-channel deposit: ``amount`` rUSDT from ``buyer`` to the merchant in ``tx_hash``"""
+    merchant_address = settings().merchant_address
+    sender = get_store().transfer_sender(tx_hash, merchant_address, amount)
+    if sender is not None:
+        return sender == buyer.lower()
     try:
-        receipt = w3.eth.get_transaction_receipt(tx_hash)
-        logs = token.events.Transfer().process_receipt(receipt)
-        for log in logs:
-            if (
-                log["args"]["to"].lower() == expected_to.lower()
-                and log["args"]["value"] == expected_amount
-            ):
-                return True
-        return False
+        receipt = get_web3().eth.get_transaction_receipt(tx_hash)
     except Exception as e:
-        print(f"❌ Verification error: {e}")
+        payments_logger.warning("Deposit verification error", extra={"tx_hash": tx_hash, "error": str(e)})
         return False
+    return any(
+        log["args"]["from"].lower() == buyer.lower()
+        and log["args"]["to"].lower() == merchant_address.lower()
+        and log["args"]["value"] == amount
+        for log in token_transfers(receipt)
+    )
+
+
+def verify_payment(tx_hash: str, expected_to: str, expected_amount: int, order_id: Optional[str] = None) -> bool:
+    with span("verify_payment", tx_hash=tx_hash) as verify_span:
+        # Already verified, or seen by the transfer indexer: no RPC needed
+        store = get_store()
+        payment = store.verified_payment(tx_hash)
+        if payment is not None:
+            # A recorded transaction only ever pays the order it was recorded for
+            verified = (order_id is not None and payment["order_id"] == order_id
+                        and payment["amount"] == expected_amount)
+            verify_span.set(source="ledger", verified=verified)
+            PAYMENT_VERIFICATIONS.inc("ledger", "verified" if verified else "rejected")
+            return verified
+        if store.tx_claim(tx_hash) is not None:
+            # A channel deposit or a fast-checkout submission: a transfer to us, but not a payment
+            verify_span.set(source="ledger", verified=False)
+            PAYMENT_VERIFICATIONS.inc("ledger", "rejected")
+            return False
+        if store.find_transfer(tx_hash, expected_to, expected_amount):
+            verify_span.set(source="indexer", verified=True)
+            PAYMENT_VERIFICATIONS.inc("indexer", "verified")
+            return True
+
+        verify_span.set(source="receipt", verified=False)
+        try:
+            receipt = get_web3().eth.get_transaction_receipt(tx_hash)
+            for log in token_transfers(receipt):
+                if (
+                    log["args"]["to"].lower() == expected_to.lower()
+                    and log["args"]["value"] == expected_amount
+                ):
+                    verify_span.set(verified=True)
+                    PAYMENT_VERIFICATIONS.inc("receipt", "verified")
+                    return True
+            PAYMENT_VERIFICATIONS.inc("receipt", "rejected")
+            return False
+        except Exception as e:
+            verify_span.set(error=str(e))
+            PAYMENT_VERIFICATIONS.inc("receipt", "error")
+            payments_logger.warning("Verification error", extra={"tx_hash": tx_hash, "error": str(e)})
+            return False
+
+
+GOODS = [
+    {"id": 1, "name": "Crypto Hoodie", "price_tokens": 5},
+    {"id": 2, "name": "NFT Poster", "price_tokens": 3},
+    {"id": "g3", "name": "AI Sticker Pack", "price_usd": 1.25},
+    {"id": "g4", "name": "Fetch.ai Merch Pack", "price_usd": 10.00},
+    {"id": "g5", "name": "Game console", "price_usd": 10.00},
+    {"id": "g6", "name": "Smartphone", "price_usd": 50.00},
+    {"id": "g7", "name": "Laptop", "price_usd": 100.00},
+    {"id": "g8", "name": "Tablet", "price_usd": 80.00},
+    {"id": "g9", "name": "Smartwatch", "price_usd": 30.00},
+    {"id": "g10", "name": "Smart home device", "price_usd": 97.00},
+]
+
+@lru_cache(maxsize=None)
+def get_store() -> MerchantStore:
+    """Catalog, orders and verified payments live in SQLite so HTTP workers share them"""
+    store = MerchantStore()
+    store.seed_catalog(GOODS)
+    return store
 
 
 @app.get("/goods")
 def list_goods():
-    return {
-        "items": [
-            {"id": 1, "name": "Crypto Hoodie", "price_tokens": 5},
-            {"id": 2, "name": "NFT Poster", "price_tokens": 3},
-            {"id": "g3", "name": "AI Sticker Pack", "price_usd": 1.25},
-            {"id": "g4", "name": "Fetch.ai Merch Pack", "price_usd": 10.00},
-            {"id": "g5", "name": "Game console", "price_usd": 10.00},
-            {"id": "g6", "name": "Smartphone", "price_usd": 50.00},
-            {"id": "g7", "name": "Laptop", "price_usd": 100.00},
-            {"id": "g8", "name": "Tablet", "price_usd": 80.00},
-            {"id": "g9", "name": "Smartwatch", "price_usd": 30.00},
-            {"id": "g10", "name": "Smart home device", "price_usd": 97.00},
-        ]
-    }
+    return FastJSONResponse({"items": get_store().catalog()})
 
 
-@app.post("/purchase")
-def purchase(request: dict):
-    item_id = request.get("item_id")
-    if not item_id:
-        raise HTTPException(status_code=400, detail="Item ID required")
+MAX_CART_ITEMS = 50
 
-    if item_id == 1:
-        amount = 5
-    elif item_id == 2:
-        amount = 3
-    else:
+
+def _token_price(item_id) -> int:
+    # Only items priced in tokens can be paid for on-chain
+    price = get_store().token_price(item_id)
+    if price is None:
         raise HTTPException(status_code=404, detail="Item not found")
+    return price
 
+
+def _payment_required(amount: int, lines: List[Dict[str, Any]], **extra) -> Dict[str, Any]:
+    config = settings()
     return {
         "status": "402 Payment Required",
-        "token_address": RUSDT_CONTRACT,
-        "recipient_address": MERCHANT_ADDRESS,
-        "amount": amount * 10**18,
+        "order_id": get_store().create_order(amount, lines),
+        "token_address": config.rusdt_contract,
+        "recipient_address": config.merchant_address,
+        "amount": amount,
         "currency": "rUSDT",
         "chain": "rootstock_testnet",
+        # Only advertised when enabled, so quotes are unchanged otherwise
+        **({"fast_checkout": True} if fast_checkout_enabled() else {}),
+        **extra,
     }
 
 
+def price_cart(items: List[Any]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Total in wei and order lines for a cart of item IDs or {item_id, quantity} entries"""
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items must be a non-empty list")
+    if len(items) > MAX_CART_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CART_ITEMS} items per cart")
+
+    lines = []
+    total = 0
+    for entry in items:
+        if isinstance(entry, dict):
+            item_id = entry.get("item_id")
+            quantity = entry.get("quantity", 1)
+        else:
+            item_id, quantity = entry, 1
+        if not isinstance(quantity, int) or quantity < 1:
+            raise HTTPException(status_code=400, detail="quantity must be a positive integer")
+
+        unit_amount = _token_price(item_id) * 10**18
+        lines.append({"item_id": item_id, "quantity": quantity, "unit_amount": unit_amount})
+        total += unit_amount * quantity
+
+    return total, lines
+
+
+def quote_cart(items: List[Any]) -> Dict[str, Any]:
+    """Aggregate a cart into a single quote so it can be paid with one transfer"""
+    total, lines = price_cart(items)
+    return _payment_required(total, lines, items=lines)
+
+
+def _channel_price(items: List[Any]):
+    from payment_channels import ChannelError
+    try:
+        return price_cart(items)
+    except HTTPException as e:
+        raise ChannelError(e.detail)
+
+
+@lru_cache(maxsize=None)
+def get_channel_book() -> ChannelBook:
+    from payment_channels import ChannelBook
+    config = settings()
+    return ChannelBook(get_store(), config.merchant_address, config.rusdt_contract, get_web3().eth.chain_id,
+                       verify_deposit, _channel_price)
+
+
+def handle_channel_message(metadata: Dict[str, str]) -> Dict[str, str]:
+    """Blocking: the first call fetches the chain ID, and payments hash; run it in a worker thread"""
+    return get_channel_book().handle(metadata)
+
+
+@app.post("/purchase")
+def purchase(request: dict):
+    items = request.get("items")
+    if items is not None:
+        return FastJSONResponse(quote_cart(items))
+
+    item_id = request.get("item_id")
+    if not item_id:
+        raise HTTPException(status_code=400, detail="Item ID required")
+
+    amount = _token_price(item_id) * 10**18
+    return FastJSONResponse(_payment_required(amount, [{"item_id": item_id, "quantity": 1, "unit_amount": amount}]))
+
+
 @app.post("/retry_purchase")
 def retry_purchase(request: dict):
     tx_hash = request.get("tx_hash")
@@ -268,12 +568,48 @@ def retry_purchase(request: dict):
     if not tx_hash or not amount:
         raise HTTPException(status_code=400, detail="tx_hash and amount required")
 
-    if verify_payment(tx_hash, MERCHANT_ADDRESS, int(amount)):
+    store = get_store()
+    order_id = request.get("order_id")
+    if order_id is not None:
+        order = store.get_order(order_id)
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if order["status"] != "pending":
+            return {"status": "failed", "message": "Order is not awaiting payment ❌"}
+        if order["amount"] != int(amount):
+            return {"status": "failed", "message": "Amount does not match the order ❌"}
+
+    if verify_payment(tx_hash, settings().merchant_address, int(amount), order_id):
+        if not store.record_payment(tx_hash, int(amount), order_id):
+            return {"status": "failed", "message": "Payment already used or order no longer pending ❌"}
         return {"status": "success", "message": "Payment verified ✅. Here are your goods!"}
     else:
         return {"status": "failed", "message": "Payment not found or incorrect ❌"}
 
 
+@lru_cache(maxsize=None)
+def get_fast_checkout() -> FastCheckout:
+    from fast_checkout import FastCheckout
+    config = settings()
+    return FastCheckout(get_store(), config.merchant_address, config.rusdt_contract, get_web3().eth.chain_id)
+
+
+@app.post("/fast_purchase")
+def fast_purchase(request: dict):
+    """Release an order against a signed transferWithAuthorization, before it is mined"""
+    if not fast_checkout_enabled():
+        raise HTTPException(status_code=404, detail="Fast checkout is not enabled")
+    order_id = request.get("order_id")
+    authorization = request.get("authorization")
+    if not order_id or not isinstance(authorization, dict):
+        raise HTTPException(status_code=400, detail="order_id and authorization required")
+    from fast_checkout import AuthorizationError
+    try:
+        return FastJSONResponse(get_fast_checkout().accept(order_id, authorization))
+    except AuthorizationError as e:
+        return FastJSONResponse({"status": "failed", "message": f"{e} ❌"})
+
+
 # Chat Protocol HTTP Endpoints
 @app.post("/api/chat")
 async def chat_endpoint(request: dict):
@@ -285,26 +621,23 @@ async def chat_endpoint(request: dict):
         if not message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        print(f"📨 HTTP: Received message from {user_id}: {message}")
+        http_logger.info("Chat message received", extra={"user_id": user_id, "chars": len(message)})
         
         # Process message using the same logic as chat protocol
         response_content = await process_merchant_message(message)
         
-        print(f"📤 HTTP: Sending response: {response_content[:100]}...")
+        http_logger.info("Chat response sent", extra={"chars": len(response_content)})
         
-        return {
+        return FastJSONResponse({
             "response": response_content,
-            "agent_id": merchant_agent.address,
-            "agent_name": merchant_agent.name,
-            "timestamp": datetime.utcnow().isoformat(),
+            "agent_id": merchant_agent_address(),
+            "agent_name": MERCHANT_AGENT_NAME,
+            "timestamp": datetime.utcnow(),
             "protocol": "chat_protocol_v1"
-        }
+        })
         
     except Exception as e:
-        print(f"❌ HTTP Error: {e}")
-        print(f"❌ Request data: {request}")
-        import traceback
-        traceback.print_exc()
+        http_logger.exception("Chat request failed", extra={"request": request})
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/chat-protocol")
@@ -317,22 +650,17 @@ async def chat_protocol_endpoint(request: dict):
         if not message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        print(f"📨 HTTP Chat Protocol: Received message from {user_id}: {message}")
+        http_logger.info("Chat protocol message received", extra={"user_id": user_id, "chars": len(message)})
         
         # Process message using chat protocol logic
         response_content = await process_merchant_message(message)
         
-        # Return response in chat protocol format
-        response_message = ChatMessage(
-            timestamp=datetime.utcnow(),
-            msg_id=uuid4(),
-            content=[TextContent(type="text", text=response_content)]
-        )
-        
-        return {
+        # Return response in chat protocol format; the dict is what a ChatMessage
+        # with one TextContent serializes to, without building the model
+        return FastJSONResponse({
             "chat_message": {
-                "timestamp": response_message.timestamp.isoformat(),
-                "msg_id": str(response_message.msg_id),
+                "timestamp": datetime.utcnow(),
+                "msg_id": uuid4(),
                 "content": [
                     {
                         "type": "text",
@@ -340,22 +668,20 @@ async def chat_protocol_endpoint(request: dict):
                     }
                 ]
             },
-            "agent_id": merchant_agent.address,
-            "agent_name": merchant_agent.name,
+            "agent_id": merchant_agent_address(),
+            "agent_name": MERCHANT_AGENT_NAME,
             "protocol_version": "chat_protocol_v1"
-        }
+        })
         
     except Exception as e:
-        print(f"❌ HTTP Chat Protocol Error: {e}")
+        http_logger.exception("Chat protocol request failed")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/status")
-async def get_status():
-    """Get agent status with chat protocol information"""
+def _status() -> Dict[str, Any]:
     return {
         "status": "online",
-        "agent_id": merchant_agent.address,
-        "agent_name": merchant_agent.name,
+        "agent_id": merchant_agent_address(),
+        "agent_name": MERCHANT_AGENT_NAME,
         "port": 8003,
         "protocols": ["chat_protocol_v1", "http_api"],
         "capabilities": [
@@ -364,9 +690,16 @@ async def get_status():
             "chat_protocol_messaging",
             "payment_verification"
         ],
-        "message": f"Merchant agent {merchant_agent.name} is ready for e-commerce and chat operations"
+        "message": f"Merchant agent {MERCHANT_AGENT_NAME} is ready for e-commerce and chat operations"
     }
 
+_status_response = StaticJSON(_status)
+
+@app.get("/api/status")
+async def get_status():
+    """Get agent status with chat protocol information"""
+    return _status_response()
+
 # Fallback chat endpoint for compatibility
 @app.post("/chat")
 async def fallback_chat_endpoint(request: dict):
@@ -378,25 +711,23 @@ async def fallback_chat_endpoint(request: dict):
         if not message:
             return {"response": "Please provide a message.", "status": "error"}
         
-        print(f"📨 Fallback: Received message from {user_id}: {message}")
+        http_logger.info("Fallback chat message received", extra={"user_id": user_id, "chars": len(message)})
         
         # Process message using the same logic as chat protocol
         response_content = await process_merchant_message(message)
         
-        print(f"📤 Fallback: Sending response: {response_content[:100]}...")
+        http_logger.info("Fallback chat response sent", extra={"chars": len(response_content)})
         
-        return {
+        return FastJSONResponse({
             "response": response_content,
-            "agent_id": merchant_agent.address,
-            "agent_name": merchant_agent.name,
-            "timestamp": datetime.utcnow().isoformat(),
+            "agent_id": merchant_agent_address(),
+            "agent_name": MERCHANT_AGENT_NAME,
+            "timestamp": datetime.utcnow(),
             "status": "success"
-        }
+        })
         
     except Exception as e:
-        print(f"❌ Fallback Error: {e}")
-        import traceback
-        traceback.print_exc()
+        http_logger.exception("Fallback chat request failed")
         return {
             "response": "I'm sorry, I'm experiencing technical difficulties. Please try again later.",
             "status": "error",
@@ -404,24 +735,21 @@ async def fallback_chat_endpoint(request: dict):
         }
 
 
-# Include the chat protocol in the merchant agent
-merchant_agent.include(chat_proto, publish_manifest=True)
-
 def run_merchant_and_api():
-    """Run both the merchant agent and the HTTP API"""
-    # Start the merchant agent in a separate thread
-    agent_thread = threading.Thread(target=lambda: merchant_agent.run())
-    agent_thread.daemon = True
-    agent_thread.start()
-    
-    # Start the HTTP API server in the main thread
-    uvicorn.run(app, host="127.0.0.1", port=8003, log_level="info")
+    """Run both the merchant agent and the HTTP API on one event loop and one port"""
+    from asgi_host import serve_agent_with_api
+
+    # Structured logging is set up by the entry point, not on import
+    configure_logging()
+    # /submit goes to the agent, every other path to the FastAPI app
+    serve_agent_with_api(get_merchant_agent(), app, host="127.0.0.1", port=settings().agent_port)
 
 if __name__ == "__main__":
+    merchant_agent = get_merchant_agent()
     print("🚀 Starting Merchant Agent with uagents and Chat Protocol...")
     print(f"📍 Agent Name: {merchant_agent.name}")
     print(f"🔗 Agent Address: {merchant_agent.address}")
-    print(f"⚡ Agent Port: 8003")
+    print(f"⚡ Agent Port: {settings().agent_port}")
     print(f"🌐 API will be available at: http://127.0.0.1:8003")
     print(f"💬 Chat Protocol: Enabled")
     print(f"🛍️ E-commerce: Ready")
@@ -0,0 +1,645 @@
+"""
+Shared merchant state backed by SQLite.
+
+Holds the catalog, purchase orders, indexed rUSDT transfers, the ledger of
+verified payments, payment channels, fast-checkout authorizations and
+settlements, so several HTTP worker processes can serve the same state.
+WAL mode lets readers in every worker proceed while one writer commits.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import uuid4
+
+MERCHANT_DB = os.getenv(
+    "MERCHANT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "merchant_state.db"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    id TEXT PRIMARY KEY,          -- JSON-encoded item id (int or str)
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    price_tokens INTEGER
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    amount TEXT NOT NULL,
+    items TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tx_hash TEXT,
+    created_at REAL NOT NULL,
+    paid_at REAL
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    value TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS transfers_block ON transfers (block_number);
+CREATE TABLE IF NOT EXISTS payments (
+    tx_hash TEXT PRIMARY KEY,
+    amount TEXT NOT NULL,
+    order_id TEXT,
+    verified_at REAL NOT NULL
+);
+-- Every transfer to the merchant pays for one thing only: an order, a channel
+-- deposit or a fast-checkout authorization. The primary key enforces that.
+CREATE TABLE IF NOT EXISTS claimed_txs (
+    tx_hash TEXT PRIMARY KEY,
+    claimed_by TEXT NOT NULL      -- payment, channel, authorization
+);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id TEXT PRIMARY KEY,  -- the deposit transaction hash
+    buyer TEXT NOT NULL,
+    deposit TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    units INTEGER NOT NULL,       -- cumulative units paid
+    word TEXT NOT NULL,           -- hash-chain word proving ``units``
+    status TEXT NOT NULL,         -- open, closing, settling, settled
+    expires_at REAL NOT NULL,
+    opened_at REAL NOT NULL,
+    refund_tx TEXT,
+    refund_nonce INTEGER,
+    refund_gas_price TEXT,
+    refund_sent_at REAL,
+    settled_at REAL,
+    refund_attempts TEXT          -- JSON list of every refund hash sent with ``refund_nonce``
+);
+CREATE INDEX IF NOT EXISTS channels_status ON channels (status, expires_at);
+CREATE TABLE IF NOT EXISTS authorizations (
+    buyer TEXT NOT NULL,
+    nonce TEXT NOT NULL,          -- bytes32 authorization nonce, single use per buyer
+    order_id TEXT NOT NULL,
+    value TEXT NOT NULL,
+    valid_after INTEGER NOT NULL,
+    valid_before INTEGER NOT NULL,
+    signature TEXT NOT NULL,
+    status TEXT NOT NULL,         -- accepted, submitted, settled, failed (buyer's fault), expired, relay_reverted
+    accepted_at REAL NOT NULL,
+    tx_hash TEXT,
+    tx_nonce INTEGER,
+    gas_price TEXT,
+    sent_at REAL,
+    settled_at REAL,
+    attempts TEXT,                -- JSON list of every hash sent with ``tx_nonce``
+    reverts INTEGER NOT NULL DEFAULT 0,  -- mined submissions that reverted through no fault of the buyer
+    PRIMARY KEY (buyer, nonce)
+);
+CREATE INDEX IF NOT EXISTS authorizations_status ON authorizations (status);
+CREATE TABLE IF NOT EXISTS settlements (
+    settlement_id TEXT PRIMARY KEY,
+    from_block INTEGER NOT NULL,
+    to_block INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    payable TEXT NOT NULL,        -- wei owed to the payout address by this settlement
+    payout_tx TEXT,               -- the mined payout transaction
+    report TEXT NOT NULL,
+    payout_id TEXT                -- the payout covering it, once one was sent
+);
+CREATE TABLE IF NOT EXISTS payouts (
+    payout_id TEXT PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    status TEXT NOT NULL,         -- sent, paid
+    nonce INTEGER NOT NULL,
+    gas_price TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,        -- the version sent last
+    attempts TEXT NOT NULL,       -- JSON list of every hash sent with ``nonce``
+    sent_at REAL NOT NULL,
+    paid_at REAL
+);
+CREATE INDEX IF NOT EXISTS payouts_status ON payouts (status);
+CREATE TABLE IF NOT EXISTS settled_payments (
+    tx_hash TEXT PRIMARY KEY,
+    settlement_id TEXT NOT NULL,
+    status TEXT NOT NULL          -- matched, mismatch
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- Claims of stores created before claimed_txs existed
+INSERT OR IGNORE INTO claimed_txs SELECT tx_hash, 'payment' FROM payments;
+INSERT OR IGNORE INTO claimed_txs SELECT channel_id, 'channel' FROM channels;
+INSERT OR IGNORE INTO claimed_txs SELECT tx_hash, 'authorization' FROM authorizations WHERE tx_hash IS NOT NULL;
+"""
+
+# Columns added to a table after it was first released, with their declarations
+MIGRATIONS = {
+    "channels": {"refund_attempts": "TEXT"},
+    "authorizations": {"attempts": "TEXT", "reverts": "INTEGER NOT NULL DEFAULT 0"},
+    "settlements": {"payout_id": "TEXT"},
+}
+
+
+class MerchantStore:
+    """Process- and thread-safe access to the shared merchant state"""
+
+    def __init__(self, path: str = MERCHANT_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Add the MIGRATIONS columns to tables created by an older release"""
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue  # created with every column by SCHEMA
+            for column, declaration in columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Catalog
+
+    def seed_catalog(self, items: List[Dict[str, Any]]):
+        """Insert catalog items that are not in the store yet"""
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO catalog (id, position, data, price_tokens) VALUES (?, ?, ?, ?)",
+                [
+                    (json.dumps(item["id"]), position, json.dumps(item), item.get("price_tokens"))
+                    for position, item in enumerate(items)
+                ],
+            )
+
+    def catalog(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM catalog ORDER BY position")
+        return [json.loads(row["data"]) for row in rows]
+
+    def token_price(self, item_id) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT price_tokens FROM catalog WHERE id = ?", (json.dumps(item_id),)
+        ).fetchone()
+        return None if row is None else row["price_tokens"]
+
+    # Orders
+
+    def create_order(self, amount: int, items: List[Dict[str, Any]]) -> str:
+        order_id = uuid4().hex
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO orders (order_id, amount, items, status, created_at) VALUES (?, ?, ?, 'pending', ?)",
+                (order_id, str(amount), json.dumps(items), time.time()),
+            )
+        return order_id
+
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM orders WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        order = dict(row)
+        order["amount"] = int(order["amount"])
+        order["items"] = json.loads(order["items"])
+        return order
+
+    # Indexed transfers
+
+    def last_indexed_block(self) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT value FROM meta WHERE key = 'last_indexed_block'"
+        ).fetchone()
+        return None if row is None else int(row["value"])
+
+    def record_transfers(self, transfers: Iterable[tuple], last_block: int):
+        """Store (tx_hash, log_index, sender, recipient, value, block) rows and advance the cursor"""
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (tx_hash.lower(), log_index, sender.lower(), recipient.lower(), str(value), block)
+                    for tx_hash, log_index, sender, recipient, value, block in transfers
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_indexed_block', ?)",
+                (str(last_block),),
+            )
+
+    def refresh_transfers(self, transfers: Iterable[tuple], from_block: int, to_block: int):
+        """Replace the indexed transfers of a block range with a fresh scan, dropping reorged ones"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM transfers WHERE block_number BETWEEN ? AND ?", (from_block, to_block))
+            conn.executemany(
+                "INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (tx_hash.lower(), log_index, sender.lower(), recipient.lower(), str(value), block)
+                    for tx_hash, log_index, sender, recipient, value, block in transfers
+                ],
+            )
+
+    def first_indexed_block(self) -> Optional[int]:
+        return self._conn().execute("SELECT MIN(block_number) FROM transfers").fetchone()[0]
+
+    def find_transfer(self, tx_hash: str, recipient: str, amount: int) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM transfers WHERE tx_hash = ? AND recipient = ? AND value = ?",
+            (tx_hash.lower(), recipient.lower(), str(amount)),
+        ).fetchone()
+        return row is not None
+
+    def transfer_sender(self, tx_hash: str, recipient: str, amount: int) -> Optional[str]:
+        """Sender of an indexed transfer, if the indexer has seen it"""
+        row = self._conn().execute(
+            "SELECT sender FROM transfers WHERE tx_hash = ? AND recipient = ? AND value = ?",
+            (tx_hash.lower(), recipient.lower(), str(amount)),
+        ).fetchone()
+        return None if row is None else row["sender"]
+
+    # Claimed transactions
+
+    @staticmethod
+    def _claim(conn: sqlite3.Connection, tx_hash: str, claimed_by: str) -> bool:
+        """Claim a transaction inside the caller's transaction; False if something already claimed it"""
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO claimed_txs (tx_hash, claimed_by) VALUES (?, ?)", (tx_hash.lower(), claimed_by)
+        )
+        return cursor.rowcount == 1
+
+    def tx_claim(self, tx_hash: str) -> Optional[str]:
+        """What a transaction was used for (payment, channel, authorization), if anything"""
+        row = self._conn().execute(
+            "SELECT claimed_by FROM claimed_txs WHERE tx_hash = ?", (tx_hash.lower(),)
+        ).fetchone()
+        return None if row is None else row["claimed_by"]
+
+    # Verified payment ledger
+
+    def verified_payment(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM payments WHERE tx_hash = ?", (tx_hash.lower(),)
+        ).fetchone()
+        if row is None:
+            return None
+        payment = dict(row)
+        payment["amount"] = int(payment["amount"])
+        return payment
+
+    def record_payment(self, tx_hash: str, amount: int, order_id: Optional[str] = None) -> bool:
+        """Record a verified payment and mark its order as paid.
+
+        False, with nothing written, when the transaction was already claimed
+        (by a payment, a channel deposit or an authorization) or the order is no
+        longer pending: one transfer pays one order.
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            # Taken before reading, so two workers cannot both claim the order or the transaction
+            conn.execute("BEGIN IMMEDIATE")
+            if order_id is not None:
+                order = conn.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+                if order is None or order["status"] != "pending":
+                    return False
+            if not self._claim(conn, tx_hash, "payment"):
+                return False
+            conn.execute(
+                "INSERT INTO payments (tx_hash, amount, order_id, verified_at) VALUES (?, ?, ?, ?)",
+                (tx_hash.lower(), str(amount), order_id, now),
+            )
+            if order_id is not None:
+                conn.execute(
+                    "UPDATE orders SET status = 'paid', tx_hash = ?, paid_at = ? WHERE order_id = ?",
+                    (tx_hash.lower(), now, order_id),
+                )
+        return True
+
+    # Payment channels
+
+    @staticmethod
+    def _channel(row) -> Dict[str, Any]:
+        channel = dict(row)
+        channel["deposit"] = int(channel["deposit"])
+        channel["unit"] = int(channel["unit"])
+        if channel["refund_gas_price"] is not None:
+            channel["refund_gas_price"] = int(channel["refund_gas_price"])
+        if channel["refund_attempts"] is not None:
+            channel["refund_attempts"] = json.loads(channel["refund_attempts"])
+        else:
+            channel["refund_attempts"] = [channel["refund_tx"]] if channel["refund_tx"] else []
+        return channel
+
+    def open_channel(self, channel_id: str, buyer: str, deposit: int, unit: int, length: int,
+                     root: str, expires_at: float) -> bool:
+        """Register a channel at zero units; False if its deposit was already claimed"""
+        with self._conn() as conn:
+            if not self._claim(conn, channel_id, "channel"):
+                return False
+            conn.execute(
+                "INSERT INTO channels (channel_id, buyer, deposit, unit, length, units, word, status,"
+                " expires_at, opened_at) VALUES (?, ?, ?, ?, ?, 0, ?, 'open', ?, ?)",
+                (channel_id.lower(), buyer.lower(), str(deposit), str(unit), length, root, expires_at, time.time()),
+            )
+        return True
+
+    def get_channel(self, channel_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM channels WHERE channel_id = ?", (channel_id.lower(),)
+        ).fetchone()
+        return None if row is None else self._channel(row)
+
+    def channel_payment(self, channel_id: str, previous_units: int, units: int, word: str, amount: int,
+                        items: List[Dict[str, Any]]) -> Optional[str]:
+        """Advance an open channel from ``previous_units`` and record a paid order; None if it moved meanwhile"""
+        order_id = uuid4().hex
+        now = time.time()
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "UPDATE channels SET units = ?, word = ? WHERE channel_id = ? AND units = ? AND status = 'open'",
+                (units, word, channel_id.lower(), previous_units),
+            )
+            if cursor.rowcount != 1:
+                return None
+            conn.execute(
+                "INSERT INTO orders (order_id, amount, items, status, tx_hash, created_at, paid_at)"
+                " VALUES (?, ?, ?, 'paid', ?, ?, ?)",
+                (order_id, str(amount), json.dumps(items), f"channel:{channel_id.lower()}", now, now),
+            )
+        return order_id
+
+    def close_channel(self, channel_id: str):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE channels SET status = 'closing' WHERE channel_id = ? AND status = 'open'",
+                (channel_id.lower(),),
+            )
+
+    def channels_to_settle(self, now: float) -> List[Dict[str, Any]]:
+        """Closed, expired and in-flight channels"""
+        rows = self._conn().execute(
+            "SELECT * FROM channels WHERE status IN ('closing', 'settling')"
+            " OR (status = 'open' AND expires_at <= ?)",
+            (now,),
+        )
+        return [self._channel(row) for row in rows]
+
+    def mark_channels_settling(self, refunds: Iterable[tuple]):
+        """Record (channel_id, refund_tx, attempts, nonce, gas_price, sent_at) before the refunds are sent"""
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE channels SET status = 'settling', refund_tx = ?, refund_attempts = ?, refund_nonce = ?,"
+                " refund_gas_price = ?, refund_sent_at = ? WHERE channel_id = ?",
+                [(tx_hash, json.dumps(attempts), nonce, str(gas_price), sent_at, channel_id.lower())
+                 for channel_id, tx_hash, attempts, nonce, gas_price, sent_at in refunds],
+            )
+
+    def mark_channel_settled(self, channel_id: str, refund_tx: Optional[str]):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE channels SET status = 'settled', refund_tx = ?, settled_at = ? WHERE channel_id = ?",
+                (refund_tx, time.time(), channel_id.lower()),
+            )
+
+    # Fast-checkout authorizations
+
+    def accept_authorization(self, buyer: str, nonce: str, order_id: str, value: int, valid_after: int,
+                             valid_before: int, signature: str, buyer_limit: int, exposure_limit: int) -> Optional[str]:
+        """Record a verified authorization and mark its order paid; the reason when the risk policy refuses it"""
+        buyer, nonce = buyer.lower(), nonce.lower()
+        conn = self._conn()
+        with conn:
+            # Taken before reading, so concurrent workers cannot both fit under the limits
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(
+                "SELECT 1 FROM authorizations WHERE buyer = ? AND status = 'failed'", (buyer,)
+            ).fetchone() is not None:
+                return "Buyer has an authorization that failed on-chain"
+            order = conn.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+            if order is None or order["status"] != "pending":
+                return "Order is not awaiting payment"
+            outstanding = conn.execute(
+                "SELECT buyer, value FROM authorizations WHERE status IN ('accepted', 'submitted')"
+            ).fetchall()
+            if sum(int(row["value"]) for row in outstanding if row["buyer"] == buyer) + value > buyer_limit:
+                return "Buyer's unsettled authorizations are at the fast-checkout limit"
+            if sum(int(row["value"]) for row in outstanding) + value > exposure_limit:
+                return "Fast checkout is at its risk limit; pay on-chain"
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO authorizations (buyer, nonce, order_id, value, valid_after, valid_before,"
+                " signature, status, accepted_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'accepted', ?)",
+                (buyer, nonce, order_id, str(value), valid_after, valid_before, signature, now),
+            )
+            if cursor.rowcount != 1:
+                return "Authorization nonce already used"
+            conn.execute(
+                "UPDATE orders SET status = 'paid', tx_hash = ?, paid_at = ? WHERE order_id = ?",
+                (f"auth:{nonce}", now, order_id),
+            )
+        return None
+
+    def authorizations_to_submit(self) -> List[Dict[str, Any]]:
+        """Accepted and in-flight authorizations"""
+        rows = self._conn().execute(
+            "SELECT * FROM authorizations WHERE status IN ('accepted', 'submitted')"
+        )
+        authorizations = []
+        for row in rows:
+            authorization = dict(row)
+            authorization["value"] = int(authorization["value"])
+            if authorization["gas_price"] is not None:
+                authorization["gas_price"] = int(authorization["gas_price"])
+            if authorization["attempts"] is not None:
+                authorization["attempts"] = json.loads(authorization["attempts"])
+            else:
+                authorization["attempts"] = [authorization["tx_hash"]] if authorization["tx_hash"] else []
+            authorizations.append(authorization)
+        return authorizations
+
+    def authorization_exposure(self) -> int:
+        """Wei released for authorizations that are not settled yet"""
+        rows = self._conn().execute(
+            "SELECT value FROM authorizations WHERE status IN ('accepted', 'submitted')"
+        )
+        return sum(int(row["value"]) for row in rows)
+
+    def mark_authorizations_submitted(self, submissions: Iterable[tuple]):
+        """Record (buyer, nonce, tx_hash, attempts, tx_nonce, gas_price, reverts, sent_at) before the transactions are sent"""
+        submissions = list(submissions)
+        with self._conn() as conn:
+            # Claimed up front, so a mined submission cannot also be presented as a payment
+            conn.executemany(
+                "INSERT OR IGNORE INTO claimed_txs (tx_hash, claimed_by) VALUES (?, 'authorization')",
+                [(submission[2].lower(),) for submission in submissions],
+            )
+            conn.executemany(
+                "UPDATE authorizations SET status = 'submitted', tx_hash = ?, attempts = ?, tx_nonce = ?,"
+                " gas_price = ?, reverts = ?, sent_at = ? WHERE buyer = ? AND nonce = ?",
+                [(tx_hash, json.dumps(attempts), tx_nonce, str(gas_price), reverts, sent_at, buyer, nonce)
+                 for buyer, nonce, tx_hash, attempts, tx_nonce, gas_price, reverts, sent_at in submissions],
+            )
+
+    def settle_authorization(self, buyer: str, nonce: str, tx_hash: str) -> bool:
+        """An authorization mined as ``tx_hash``: into the payment ledger like any verified transfer
+
+        False if ``tx_hash`` was someone else's relay that already paid for something else.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            # Our own submissions were claimed when they were sent; a relay by someone else is claimed here
+            if not self._claim(conn, tx_hash, "authorization") and conn.execute(
+                "SELECT claimed_by FROM claimed_txs WHERE tx_hash = ?", (tx_hash.lower(),)
+            ).fetchone()["claimed_by"] != "authorization":
+                return False
+            row = conn.execute(
+                "SELECT order_id, value FROM authorizations WHERE buyer = ? AND nonce = ?", (buyer, nonce)
+            ).fetchone()
+            conn.execute(
+                "UPDATE authorizations SET status = 'settled', tx_hash = ?, settled_at = ? WHERE buyer = ? AND nonce = ?",
+                (tx_hash, now, buyer, nonce),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO payments (tx_hash, amount, order_id, verified_at) VALUES (?, ?, ?, ?)",
+                (tx_hash.lower(), row["value"], row["order_id"], now),
+            )
+            conn.execute("UPDATE orders SET tx_hash = ? WHERE order_id = ?", (tx_hash.lower(), row["order_id"]))
+        return True
+
+    def fail_authorization(self, buyer: str, nonce: str):
+        """An authorization the buyer made unpayable; the buyer is refused fast checkout from now on"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE authorizations SET status = 'failed' WHERE buyer = ? AND nonce = ?", (buyer, nonce)
+            )
+
+    def drop_authorization(self, buyer: str, nonce: str, status: str):
+        """An authorization the relayer gave up on (expired, relay_reverted); not held against the buyer"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE authorizations SET status = ? WHERE buyer = ? AND nonce = ?", (status, buyer, nonce)
+            )
+
+    # Settlements
+
+    def last_settlement(self) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM settlements ORDER BY to_block DESC, created_at DESC LIMIT 1"
+        ).fetchone()
+        return None if row is None else dict(row)
+
+    def unsettled_payments(self, recipient: str, verified_before: float) -> List[tuple]:
+        """(tx_hash, amount, order_id, transfer value, transfer block) for every payment not settled yet.
+
+        A payment has one row per indexed transfer to ``recipient`` in its transaction,
+        or a single row with a NULL value and block when none is indexed.
+        """
+        return self._conn().execute(
+            "SELECT p.tx_hash, p.amount, p.order_id, t.value, t.block_number FROM payments p"
+            " LEFT JOIN settled_payments s ON s.tx_hash = p.tx_hash"
+            " LEFT JOIN transfers t ON t.tx_hash = p.tx_hash AND t.recipient = ?"
+            " WHERE s.tx_hash IS NULL AND p.verified_at < ?",
+            (recipient.lower(), verified_before),
+        ).fetchall()
+
+    def unclaimed_transfers(self, recipient: str, from_block: int, to_block: int) -> List[tuple]:
+        """(tx_hash, sender, value, block) of transfers in a range that no payment, channel or authorization claims"""
+        return self._conn().execute(
+            "SELECT t.tx_hash, t.sender, t.value, t.block_number FROM transfers t"
+            " LEFT JOIN claimed_txs c ON c.tx_hash = t.tx_hash"
+            " WHERE t.recipient = ? AND t.block_number BETWEEN ? AND ?"
+            " AND c.tx_hash IS NULL",
+            (recipient.lower(), from_block, to_block),
+        ).fetchall()
+
+    def channel_revenue(self, settled_after: float, settled_before: float) -> List[tuple]:
+        """(channel_id, spent wei) of channels whose refund was settled in a time window"""
+        rows = self._conn().execute(
+            "SELECT channel_id, units, unit FROM channels"
+            " WHERE status = 'settled' AND settled_at > ? AND settled_at <= ?",
+            (settled_after, settled_before),
+        )
+        return [(row["channel_id"], row["units"] * int(row["unit"])) for row in rows]
+
+    def unpaid_settlements(self) -> List[tuple]:
+        """(settlement_id, payable) of settlements whose payout has not been sent"""
+        rows = self._conn().execute(
+            "SELECT settlement_id, payable FROM settlements"
+            " WHERE payout_id IS NULL AND payout_tx IS NULL AND payable != '0'"
+        )
+        return [(row["settlement_id"], int(row["payable"])) for row in rows]
+
+    def record_settlement(self, settlement_id: str, from_block: int, to_block: int, payable: int,
+                          report: Dict[str, Any], settled: Iterable[tuple]):
+        """Store a settlement with its report and mark (tx_hash, status) payments as settled by it"""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO settlements (settlement_id, from_block, to_block, created_at, payable, report)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (settlement_id, from_block, to_block, time.time(), str(payable), json.dumps(report)),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO settled_payments (tx_hash, settlement_id, status) VALUES (?, ?, ?)",
+                [(tx_hash, settlement_id, status) for tx_hash, status in settled],
+            )
+
+    # Settlement payouts
+
+    def record_payout(self, payout_id: str, settlement_ids: List[str], recipient: str, amount: int,
+                      tx_hash: str, nonce: int, gas_price: int, sent_at: float):
+        """Record a payout as sent, covering some settlements; before the transaction is broadcast"""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO payouts (payout_id, recipient, amount, status, nonce, gas_price, tx_hash, attempts,"
+                " sent_at) VALUES (?, ?, ?, 'sent', ?, ?, ?, ?, ?)",
+                (payout_id, recipient, str(amount), nonce, str(gas_price), tx_hash, json.dumps([tx_hash]), sent_at),
+            )
+            conn.executemany(
+                "UPDATE settlements SET payout_id = ? WHERE settlement_id = ?",
+                [(payout_id, settlement_id) for settlement_id in settlement_ids],
+            )
+
+    def payouts_in_flight(self) -> List[Dict[str, Any]]:
+        """Payouts sent but not mined successfully yet"""
+        payouts = []
+        for row in self._conn().execute("SELECT * FROM payouts WHERE status = 'sent'"):
+            payout = dict(row)
+            payout["amount"] = int(payout["amount"])
+            payout["gas_price"] = int(payout["gas_price"])
+            payout["attempts"] = json.loads(payout["attempts"])
+            payouts.append(payout)
+        return payouts
+
+    def resend_payout(self, payout_id: str, tx_hash: str, attempts: List[str], nonce: int, gas_price: int,
+                      sent_at: float):
+        """Record a new version of a payout, and every hash sent with its nonce, before broadcasting it"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE payouts SET tx_hash = ?, attempts = ?, nonce = ?, gas_price = ?, sent_at = ?"
+                " WHERE payout_id = ?",
+                (tx_hash, json.dumps(attempts), nonce, str(gas_price), sent_at, payout_id),
+            )
+
+    def mark_payout_paid(self, payout_id: str, tx_hash: str):
+        """A payout mined successfully as ``tx_hash``: its settlements are paid out"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE payouts SET status = 'paid', tx_hash = ?, paid_at = ? WHERE payout_id = ?",
+                (tx_hash, time.time(), payout_id),
+            )
+            conn.execute("UPDATE settlements SET payout_tx = ? WHERE payout_id = ?", (tx_hash, payout_id))
@@ -0,0 +1,58 @@
+"""
+Transactions sent from the merchant wallet (MERCHANT_WALLET_KEY).
+
+Payment-channel refunds, settlement payouts and fast-checkout submissions are
+all signed with the merchant's key, each from its own worker thread. If each of
+them took ``eth_getTransactionCount(..., "pending")`` on its own, two could get
+the same nonce and one transaction would be lost. Instead, every sender in the
+process gets its nonces from one NonceAllocator.
+
+A transaction is tracked by its nonce and by every hash sent with that nonce.
+A replacement at a higher gas price has a new hash, and any one version may be
+the one that is mined. ``tx_state`` tells the sender what to do next:
+
+    mined     one version succeeded
+    reverted  one version was mined and failed. The nonce is spent; retry with a new one
+    waiting   nothing mined yet, within the timeout
+    replace   nothing mined after the timeout. Re-sign with the same nonce and a
+              higher gas price, so that at most one version can ever be mined
+"""
+
+import threading
+from typing import List, Optional, Tuple
+
+
+class NonceAllocator:
+    """Consecutive nonces for one account, shared by every sender in the process"""
+
+    def __init__(self, w3, address: str):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next: Optional[int] = None
+
+    def allocate(self, count: int = 1) -> int:
+        """First of ``count`` consecutive nonces that no other sender in the process will get"""
+        with self._lock:
+            pending = self.w3.eth.get_transaction_count(self.address, "pending")
+            # Ahead of the node while our latest transactions have not reached it
+            nonce = pending if self._next is None else max(self._next, pending)
+            self._next = nonce + count
+            return nonce
+
+
+def replacement_gas_price(gas_price: int, previous: int) -> int:
+    """Gas price for a replacement; nodes only accept one that pays at least 10% more"""
+    return max(gas_price, previous * 9 // 8 + 1)
+
+
+def tx_state(w3, tx_hashes: List[str], sent_at: float, timeout: float, now: float) -> Tuple[str, Optional[str]]:
+    """(state, hash of the mined version) of a transaction sent as any of ``tx_hashes``"""
+    for tx_hash in tx_hashes:
+        try:
+            receipt = w3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            receipt = None
+        if receipt is not None:
+            return ("mined" if receipt["status"] == 1 else "reverted"), tx_hash
+    return ("replace" if now - sent_at > timeout else "waiting"), None
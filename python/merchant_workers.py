@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Multi-worker merchant deployment.
+
+Pre-forks N uvicorn workers for the merchant HTTP API (/goods, /purchase,
+/retry_purchase, /api/chat, ...) on port 8003. They share the catalog, orders
+and verified-payment ledger through the SQLite MerchantStore. This process
+is the only owner of the uagents identity and the chain transfer indexer. It
+serves the agent endpoint on MERCHANT_AGENT_PORT (default 8013).
+
+Each worker has its own in-process metrics and response cache. So that a
+scrape of /metrics on :8003 covers the whole deployment and not whichever
+worker answered, every worker and this process share their metrics through a
+temporary directory (see ``metrics.share_metrics``). Counters and histograms
+are summed over all of them; gauges carry a ``process`` label. The response
+caches stay per worker: they only hold replies that do not depend on shared
+state.
+
+    python merchant_workers.py --workers 4
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Must be set before merchant.py reads its settings, and is inherited by the workers
+os.environ.setdefault("MERCHANT_AGENT_PORT", "8013")
+
+import merchant  # noqa: E402
+from metrics import share_metrics  # noqa: E402
+from structured_logging import configure_logging  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_app():
+    """uvicorn app factory run in each HTTP worker, so logging is set up there and not on import"""
+    configure_logging()
+    share_metrics(os.environ["MERCHANT_METRICS_DIR"])
+    return merchant.app
+
+
+def start_http_workers(workers: int, host: str = "127.0.0.1", port: int = 8003) -> subprocess.Popen:
+    """Start the pre-forked HTTP tier; uvicorn's supervisor shares one listening socket"""
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "merchant_workers:worker_app", "--factory",
+            "--host", host,
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ],
+        cwd=HERE,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the merchant with N HTTP workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8003)
+    args = parser.parse_args()
+
+    agent_port = merchant.settings().agent_port
+    if agent_port == args.port:
+        sys.exit("MERCHANT_AGENT_PORT must differ from the HTTP port in worker mode")
+
+    print(f"🚀 Starting merchant with {args.workers} HTTP workers on :{args.port}")
+    print(f"🔗 Agent + transfer indexer on :{agent_port} ({merchant.merchant_agent_address()})")
+    print(f"🗄️ Shared state: {merchant.get_store().path}")
+
+    # Inherited by the workers
+    metrics_dir = os.environ["MERCHANT_METRICS_DIR"] = tempfile.mkdtemp(prefix="merchant_metrics_")
+    share_metrics(metrics_dir)
+    http_tier = start_http_workers(args.workers, port=args.port)
+    try:
+        merchant.run_merchant_and_api()
+    finally:
+        http_tier.terminate()
+        http_tier.wait()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
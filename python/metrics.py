@@ -0,0 +1,394 @@
+"""
+In-process counters and histograms with a Prometheus text endpoint.
+
+Every thread records into its own shard (a plain dict keyed by label values),
+so the hot path is a dict lookup and an add with no lock. Shards are only
+summed when /metrics is scraped. Metrics are process-wide: when several agents
+share a process (run_bureau.py) one scrape covers all of them.
+
+Processes that serve one deployment (merchant_workers.py) call
+``share_metrics(directory)``: each then writes its totals to
+``<directory>/<pid>.json`` every METRICS_SHARE_INTERVAL seconds, and a scrape
+of any of them adds up every process's counters and histograms (a few seconds
+stale for the others). Gauges are not summed; each process's values are shown
+with a ``process`` label, and only while that process keeps writing.
+
+    instrument_app(app, "merchant")   # /metrics + per-endpoint latency on a FastAPI app
+    start_metrics_server(8010)        # /metrics for processes without an HTTP API
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tracing import inject_chat, span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY: List["_Metric"] = []
+
+METRICS_SHARE_INTERVAL = float(os.getenv("METRICS_SHARE_INTERVAL", "2"))
+# Set by share_metrics: where every process of the deployment writes its totals
+_shared_dir: Optional[str] = None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], object]] = []
+        self._shards_lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            # First record from this thread: the only time a lock is taken
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshot(self) -> List[Dict[Tuple[str, ...], object]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter: ``REQUESTS.inc("merchant", "/goods")``"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return sum(shard.get(labels, 0.0) for shard in self._snapshot())
+
+    def _totals(self) -> Dict[Tuple[str, ...], float]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0.0) + value
+        return totals
+
+    def export(self) -> list:
+        return [[list(labels), value] for labels, value in self._totals().items()]
+
+    def render(self, others: Sequence[Tuple[str, list, bool]] = ()) -> List[str]:
+        totals = self._totals()
+        for _, exported, _ in others:
+            for labels, value in exported:
+                totals[tuple(labels)] = totals.get(tuple(labels), 0.0) + value
+        lines = super().render()
+        for labels, value in sorted(totals.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Bucketed latency histogram: ``RPC_SECONDS.observe(0.12, "eth_call", "host")``"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # One slot per bucket, one for +Inf, then sum and count
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _merged(self) -> Dict[Tuple[str, ...], list]:
+        merged: Dict[Tuple[str, ...], list] = {}
+        for shard in self._snapshot():
+            for labels, state in shard.items():
+                total = merged.setdefault(labels, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+        return merged
+
+    def count(self, *labels: str) -> int:
+        state = self._merged().get(labels)
+        return 0 if state is None else state[-1]
+
+    def export(self) -> list:
+        return [[list(labels), state] for labels, state in self._merged().items()]
+
+    def render(self, others: Sequence[Tuple[str, list, bool]] = ()) -> List[str]:
+        merged = self._merged()
+        for _, exported, _ in others:
+            for labels, state in exported:
+                total = merged.setdefault(tuple(labels), [0] * len(state))
+                for i, value in enumerate(state):
+                    total[i] += value
+        lines = super().render()
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        for labels, state in sorted(merged.items()):
+            cumulative = 0
+            for bound, hits in zip(bounds, state):
+                cumulative += hits
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {state[-2]}")
+            lines.append(f"{self.name}_count{label_text} {state[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Last value set, for values computed off the hot path: ``LAG.set(0.02, "merchant")``"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def export(self) -> list:
+        return [[list(labels), value] for labels, value in dict(self._values).items()]
+
+    def render(self, others: Sequence[Tuple[str, list, bool]] = ()) -> List[str]:
+        lines = super().render()
+        if _shared_dir is None:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+            return lines
+        # Last values of different processes do not add up: one series per process
+        names = self.labelnames + ("process",)
+        processes = [(str(os.getpid()), self.export(), True)] + list(others)
+        for process, exported, live in processes:
+            if live:
+                for labels, value in sorted((tuple(labels), value) for labels, value in exported):
+                    lines.append(f"{self.name}{_format_labels(names, labels + (process,))} {value}")
+        return lines
+
+
+def export_metrics() -> Dict[str, list]:
+    """This process's totals, in the form share_metrics writes them"""
+    return {metric.name: metric.export() for metric in REGISTRY}
+
+
+def _write_shared():
+    path = os.path.join(_shared_dir, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(export_metrics(), f)
+    os.replace(path + ".tmp", path)
+
+
+def _flush_shared():
+    try:
+        _write_shared()
+    except OSError:
+        pass  # the deployment removed the directory on shutdown
+
+
+def _share_forever():
+    while True:
+        time.sleep(METRICS_SHARE_INTERVAL)
+        _flush_shared()
+
+
+def share_metrics(directory: str):
+    """Add this process's metrics to every scrape of the processes sharing ``directory``"""
+    global _shared_dir
+    _shared_dir = directory
+    os.makedirs(directory, exist_ok=True)
+    _write_shared()
+    atexit.register(_flush_shared)
+    threading.Thread(target=_share_forever, name="metrics-share", daemon=True).start()
+
+
+def _shared_processes() -> List[Tuple[str, Dict[str, list], bool]]:
+    """(pid, totals, still writing) of the other processes sharing this one's directory"""
+    if _shared_dir is None:
+        return []
+    processes = []
+    me, now = str(os.getpid()), time.time()
+    for name in os.listdir(_shared_dir):
+        pid, ext = os.path.splitext(name)
+        if ext != ".json" or pid == me:
+            continue
+        path = os.path.join(_shared_dir, name)
+        try:
+            with open(path) as f:
+                totals = json.load(f)
+            # A process that stopped writing has exited: its counts stay, its gauges go
+            live = now - os.path.getmtime(path) < 3 * METRICS_SHARE_INTERVAL
+        except (OSError, ValueError):
+            continue
+        processes.append((pid, totals, live))
+    return processes
+
+
+def render_metrics() -> str:
+    others = _shared_processes()
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render([(pid, totals.get(metric.name, []), live) for pid, totals, live in others]))
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the agents
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ("service", "method", "route", "status"))
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("service", "method", "route"))
+CHAT_ROUTING_SECONDS = Histogram(
+    "chat_routing_duration_seconds", "Time to route a chat message and build the reply", ("agent", "intent"))
+CHAT_CACHE_LOOKUPS = Counter(
+    "chat_response_cache_total", "Chat reply cache lookups", ("agent", "result"))
+CHAT_CACHE_EVICTIONS = Counter(
+    "chat_response_cache_evictions_total", "Phrasings dropped from a full chat reply cache", ("agent",))
+CHAT_SENDS = Counter(
+    "chat_messages_sent_total", "Outbound chat-protocol messages", ("agent", "message"))
+CHAT_SEND_SECONDS = Histogram(
+    "chat_send_duration_seconds", "Time spent in ctx.send for outbound chat messages", ("agent", "message"))
+RPC_CALLS = Counter(
+    "rpc_requests_total", "JSON-RPC calls", ("method", "endpoint", "outcome"))
+RPC_SECONDS = Histogram(
+    "rpc_request_duration_seconds", "JSON-RPC call latency", ("method", "endpoint"))
+PAYMENT_VERIFICATIONS = Counter(
+    "payment_verifications_total", "Merchant payment verifications", ("source", "outcome"))
+FAST_CHECKOUT_AUTHORIZATIONS = Counter(
+    "fast_checkout_authorizations_total", "Signed payment authorizations by outcome", ("outcome",))
+FAST_CHECKOUT_EXPOSURE = Gauge(
+    "fast_checkout_exposure_tokens", "rUSDT released for authorizations not yet settled on-chain")
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay of the watchdog heartbeat on the event loop", ("loop",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+EVENT_LOOP_LAG_QUANTILES = Gauge(
+    "event_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent window", ("loop", "quantile"))
+EVENT_LOOP_BLOCKS = Counter(
+    "event_loop_blocked_total", "Times a callback held the event loop past the threshold", ("loop",))
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records not written (sampled out or queue full)", ("reason",))
+
+
+async def send_chat(ctx, agent: str, destination: str, message):
+    """``ctx.send`` that records the outbound message and carries the trace context"""
+    kind = type(message).__name__
+    start = time.perf_counter()
+    try:
+        with span(f"chat.send {kind}", agent=agent):
+            await ctx.send(destination, inject_chat(message))
+    finally:
+        CHAT_SEND_SECONDS.observe(time.perf_counter() - start, agent, kind)
+        CHAT_SENDS.inc(agent, kind)
+
+
+# HTTP exposition
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency per route template"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The template (e.g. /goods), not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, self.service, method, route)
+            HTTP_REQUESTS.inc(self.service, method, route, str(status))
+
+
+def instrument_app(app, service: str):
+    """Add request metrics and a /metrics endpoint to a FastAPI app"""
+    from fastapi.responses import Response
+
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; port 0 disables it"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
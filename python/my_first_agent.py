@@ -9,13 +9,19 @@ with proper configuration, startup behavior, and message handling.
 import asyncio
 import json
 import logging
+import time
 from typing import Dict, Any
 from uagents import Agent, Context, Model
 from uagents.network import wait_for_tx_to_complete
 from uagents.setup import fund_agent_if_low
+from agent_storage import use_agent_storage
+from profiling import install_profiling
+from response_cache import ResponseCache
+from metrics import CHAT_ROUTING_SECONDS, instrument_app, send_chat
+from structured_logging import CorrelationIdMiddleware, adopt_loggers, configure_logging
+from traffic_capture import install_capture
+from tracing import install_tracing
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Message models for communication
@@ -45,9 +51,12 @@ class AgentStatus(Model):
 agent = Agent(
     name="alice",  # Agent identifier
     seed="my_first_agent_seed_phrase_12345",  # Deterministic seed for fixed addresses
-    endpoint="127.0.0.1:8002",  # Agent endpoint
+    endpoint="http://127.0.0.1:8002/submit",  # Agent endpoint (served with the HTTP API)
     port=8002  # Port where agent will be available
 )
+# ctx.storage is backed by SQLite (see agent_storage.py) instead of a JSON file
+use_agent_storage(agent)
+adopt_loggers(agent._logger)
 
 # Agent capabilities
 AGENT_CAPABILITIES = [
@@ -126,7 +135,7 @@ async def handle_chat_message(ctx: Context, msg: ChatMessage):
         )
         
         # Send response back
-        await ctx.send(ctx.message.sender, response)
+        await send_chat(ctx, "alice", ctx.message.sender, response)
         logger.info(f"📤 Sent response: {response_content[:100]}...")
         
     except Exception as e:
@@ -137,14 +146,37 @@ async def handle_chat_message(ctx: Context, msg: ChatMessage):
             timestamp=ctx.message.timestamp,
             agent_id=agent.address
         )
-        await ctx.send(ctx.message.sender, error_response)
+        await send_chat(ctx, "alice", ctx.message.sender, error_response)
+
+# Chat intents in match order, each with its trigger keywords
+ALICE_INTENTS = [
+    ("blockchain", ["blockchain", "crypto", "bitcoin"]),
+    ("defi", ["defi", "yield", "farming", "liquidity"]),
+    ("trading", ["trade", "trading", "market", "price"]),
+    ("nft", ["nft", "non-fungible", "collection"]),
+    ("smart_contract", ["smart contract", "contract", "dapp"]),
+    ("greeting", ["hello", "hi", "greetings"]),
+    ("portfolio", ["portfolio", "analytics", "balance"]),
+    ("help", ["help", "what can you do"]),
+]
+
+def message_intent(message: str) -> str:
+    message_lower = message.lower()
+    for intent, keywords in ALICE_INTENTS:
+        if any(keyword in message_lower for keyword in keywords):
+            return intent
+    return "unknown"
 
 async def process_message(message: str) -> str:
     """Process incoming message and generate appropriate response"""
-    message_lower = message.lower()
-    
+    start = time.perf_counter()
+    intent, response = ALICE_REPLIES.lookup(message)
+    CHAT_ROUTING_SECONDS.observe(time.perf_counter() - start, "alice", intent)
+    return response
+
+def reply_for_intent(intent: str) -> str:
     # Enhanced keyword-based responses with detailed information
-    if any(keyword in message_lower for keyword in ["blockchain", "crypto", "bitcoin"]):
+    if intent == "blockchain":
         kb = KNOWLEDGE_BASE["blockchain"]
         return f"""🔗 **Blockchain Technology**
         
@@ -158,7 +190,7 @@ async def process_message(message: str) -> str:
 
 Would you like me to explain any specific aspect of blockchain technology?"""
     
-    elif any(keyword in message_lower for keyword in ["defi", "yield", "farming", "liquidity"]):
+    elif intent == "defi":
         kb = KNOWLEDGE_BASE["defi"]
         return f"""🏦 **DeFi (Decentralized Finance)**
         
@@ -172,7 +204,7 @@ Would you like me to explain any specific aspect of blockchain technology?"""
 
 I can help you understand specific DeFi protocols or strategies. What would you like to know?"""
     
-    elif any(keyword in message_lower for keyword in ["trade", "trading", "market", "price"]):
+    elif intent == "trading":
         kb = KNOWLEDGE_BASE["trading"]
         return f"""📈 **Trading & Markets**
         
@@ -186,7 +218,7 @@ I can help you understand specific DeFi protocols or strategies. What would you
 
 Remember: Always do your own research and never invest more than you can afford to lose!"""
     
-    elif any(keyword in message_lower for keyword in ["nft", "non-fungible", "collection"]):
+    elif intent == "nft":
         kb = KNOWLEDGE_BASE["nft"]
         return f"""🎨 **NFTs (Non-Fungible Tokens)**
         
@@ -200,7 +232,7 @@ Remember: Always do your own research and never invest more than you can afford
 
 NFTs are revolutionizing digital ownership. What aspect interests you most?"""
     
-    elif any(keyword in message_lower for keyword in ["smart contract", "contract", "dapp"]):
+    elif intent == "smart_contract":
         kb = KNOWLEDGE_BASE["smart_contract"]
         return f"""⚡ **Smart Contracts**
         
@@ -214,7 +246,7 @@ NFTs are revolutionizing digital ownership. What aspect interests you most?"""
 
 Smart contracts are the foundation of Web3 applications. Would you like to learn about specific use cases?"""
     
-    elif any(keyword in message_lower for keyword in ["hello", "hi", "greetings"]):
+    elif intent == "greeting":
         return f"""👋 **Hello! I'm {agent.name}, your blockchain assistant!**
 
 I'm here to help you understand:
@@ -227,7 +259,7 @@ I'm here to help you understand:
 
 What would you like to explore today? Just ask me about any blockchain topic!"""
     
-    elif any(keyword in message_lower for keyword in ["portfolio", "analytics", "balance"]):
+    elif intent == "portfolio":
         return """📊 **Portfolio Analysis**
 
 I can help you understand:
@@ -239,7 +271,7 @@ I can help you understand:
 
 Connect your wallet to the analytics dashboard to get started with comprehensive portfolio insights!"""
     
-    elif any(keyword in message_lower for keyword in ["help", "what can you do"]):
+    elif intent == "help":
         return f"""🤖 **I'm {agent.name}, your AI blockchain assistant!**
 
 **My Capabilities:**
@@ -269,12 +301,20 @@ I specialize in blockchain and Web3 topics. Here are some things you can ask me
 
 Feel free to ask me anything about cryptocurrencies, DeFi, NFTs, or blockchain technology!"""
 
+ALICE_REPLIES = ResponseCache("alice", message_intent, reply_for_intent)
+
 # HTTP API for web interface integration
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fast_json import FastJSONResponse, StaticJSON
+from asgi_host import serve_agent_with_api
 
-app = FastAPI(title="My First Fetch.ai Agent API")
+app = FastAPI(title="My First Fetch.ai Agent API", default_response_class=FastJSONResponse)
+instrument_app(app, "alice")
+app.add_middleware(CorrelationIdMiddleware)
+install_profiling(app)
+install_tracing(app, "alice")
+install_capture(app, "alice")
 
 # Enable CORS for web interface
 app.add_middleware(
@@ -285,17 +325,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Status, capabilities and root never change while the process runs
+_status_response = StaticJSON(lambda: {
+    "status": "online",
+    "agent_id": agent.address,
+    "agent_name": agent.name,
+    "capabilities": AGENT_CAPABILITIES,
+    "port": 8002,
+    "message": f"Agent {agent.name} is ready for blockchain assistance"
+})
+
+_capabilities_response = StaticJSON(lambda: {
+    "capabilities": AGENT_CAPABILITIES,
+    "agent_id": agent.address,
+    "agent_name": agent.name,
+    "knowledge_base": list(KNOWLEDGE_BASE.keys())
+})
+
+_root_response = StaticJSON(lambda: {
+    "message": f"Agent {agent.name} API is running",
+    "version": "1.0.0",
+    "agent_address": agent.address,
+    "endpoints": {
+        "status": "/api/status",
+        "chat": "/api/chat",
+        "capabilities": "/api/capabilities"
+    }
+})
+
+def update_knowledge_base(topics: Dict[str, Any]):
+    """Replace knowledge-base topics at runtime; replies built from the old entries are dropped"""
+    KNOWLEDGE_BASE.update(topics)
+    ALICE_REPLIES.clear()
+    _capabilities_response.reset()
+
 @app.get("/api/status")
 async def get_status():
     """Get agent status"""
-    return {
-        "status": "online",
-        "agent_id": agent.address,
-        "agent_name": agent.name,
-        "capabilities": AGENT_CAPABILITIES,
-        "port": 8002,
-        "message": f"Agent {agent.name} is ready for blockchain assistance"
-    }
+    return _status_response()
 
 @app.post("/api/chat")
 async def chat_endpoint(request: dict):
@@ -307,57 +374,38 @@ async def chat_endpoint(request: dict):
         if not message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        logger.info(f"📨 HTTP: Received message from {user_id}: {message}")
+        logger.info("Chat message received", extra={"user_id": user_id, "chars": len(message)})
         
         # Process message
         response_content = await process_message(message)
         
-        return {
+        return FastJSONResponse({
             "response": response_content,
             "agent_id": agent.address,
             "agent_name": agent.name,
             "timestamp": "2024-01-01T00:00:00Z"
-        }
+        })
         
     except Exception as e:
-        logger.error(f"❌ HTTP Error: {e}")
+        logger.exception("Chat request failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/capabilities")
 async def get_capabilities():
     """Get agent capabilities"""
-    return {
-        "capabilities": AGENT_CAPABILITIES,
-        "agent_id": agent.address,
-        "agent_name": agent.name,
-        "knowledge_base": list(KNOWLEDGE_BASE.keys())
-    }
+    return _capabilities_response()
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "message": f"Agent {agent.name} API is running",
-        "version": "1.0.0",
-        "agent_address": agent.address,
-        "endpoints": {
-            "status": "/api/status",
-            "chat": "/api/chat",
-            "capabilities": "/api/capabilities"
-        }
-    }
+    return _root_response()
 
 def run_agent_and_api():
-    """Run both the agent and the HTTP API"""
-    import threading
-    
-    # Start the agent in a separate thread
-    agent_thread = threading.Thread(target=lambda: agent.run())
-    agent_thread.daemon = True
-    agent_thread.start()
-    
-    # Start the HTTP API server in the main thread
-    uvicorn.run(app, host="127.0.0.1", port=8002, log_level="info")
+    """Run both the agent and the HTTP API on one event loop and one port"""
+    # Structured logging is set up by the entry point, not on import
+    configure_logging()
+    # /submit goes to the agent, every other path to the FastAPI app
+    serve_agent_with_api(agent, app, host="127.0.0.1", port=8002)
 
 if __name__ == "__main__":
     print("🚀 Starting My First Fetch.ai Agent...")
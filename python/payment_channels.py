@@ -0,0 +1,341 @@
+"""
+Hash-chain payment channels for high-frequency rUSDT micropayments.
+
+The buyer opens a channel with one on-chain rUSDT transfer to the merchant
+(the deposit) and a signed commitment. After that a payment is a chat-protocol
+message carrying the new cumulative total, checked by the merchant without
+touching the chain. The merchant settles in periodic batches: the unspent part
+of every closed or expired channel is refunded to its buyer, all refunds of a
+round signed with consecutive nonces and sent together.
+
+Updates are authenticated with a hash chain (PayWord) instead of one ECDSA
+signature each: recovering a signature in pure Python costs ~5 ms, checking an
+update costs a few keccak calls. The buyer draws a random seed, hashes it
+``length`` times and signs only the last value (the root), once:
+
+    w[length] = seed,  w[i - 1] = keccak(w[i]),  root = w[0]
+
+Paying a cumulative ``units`` reveals w[units]. The merchant hashes it
+(units - accepted) times and must arrive at the last word it accepted, so an
+update proves the buyer authorized ``units * unit`` in total, and the merchant
+cannot claim more than the buyer revealed.
+
+Channel messages are MetadataContent items keyed by ``channel``:
+
+    {"channel": "open", "commitment": <json>, "signature": <hex>}
+    {"channel": "pay", "channel_id": ..., "units": "12", "word": <hex>, "items": <json>}
+    {"channel": "close", "channel_id": ...}
+
+and the merchant answers with {"channel": "opened" | "accepted" | "closing" |
+"rejected", "channel_id": ..., "units": <accepted units>, "reason": ...}.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from eth_abi import encode
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from eth_utils import keccak, to_checksum_address, to_hex
+
+from merchant_store import MerchantStore
+from merchant_wallet import NonceAllocator, replacement_gas_price, tx_state
+
+CHANNEL_UNIT = int(os.getenv("CHANNEL_UNIT", str(10**17)))
+CHANNEL_TTL = float(os.getenv("CHANNEL_TTL", "86400"))
+CHANNEL_MAX_TTL = float(os.getenv("CHANNEL_MAX_TTL", str(7 * 86400)))
+CHANNEL_MAX_LENGTH = int(os.getenv("CHANNEL_MAX_LENGTH", "100000"))
+CHANNEL_SETTLE_INTERVAL = float(os.getenv("CHANNEL_SETTLE_INTERVAL", "60"))
+# A refund not mined after this long is re-signed with the same nonce and a higher gas price;
+# a reverted one is sent again with a new nonce
+CHANNEL_SETTLE_TIMEOUT = float(os.getenv("CHANNEL_SETTLE_TIMEOUT", "300"))
+CHANNEL_SETTLE_GAS = int(os.getenv("CHANNEL_SETTLE_GAS", "100000"))
+
+logger = logging.getLogger("merchant.channels")
+
+_COMMITMENT_TYPES = ["bytes32", "address", "address", "address", "uint256", "uint256", "uint256", "uint256",
+                     "bytes32", "uint256"]
+
+
+class ChannelError(Exception):
+    """A channel message the merchant refuses; the message is sent back as the reason"""
+
+
+def hash_chain(seed: bytes, length: int) -> List[bytes]:
+    """[w0 (root), w1, ..., w[length] (seed)]"""
+    words = [seed]
+    for _ in range(length):
+        words.append(keccak(words[-1]))
+    words.reverse()
+    return words
+
+
+def walk(word: bytes, steps: int) -> bytes:
+    for _ in range(steps):
+        word = keccak(word)
+    return word
+
+
+def commitment_digest(commitment: Dict[str, Any]) -> bytes:
+    return keccak(encode(_COMMITMENT_TYPES, [
+        bytes.fromhex(commitment["channel_id"][2:]),
+        commitment["buyer"],
+        commitment["merchant"],
+        commitment["token"],
+        commitment["chain_id"],
+        commitment["deposit"],
+        commitment["unit"],
+        commitment["length"],
+        bytes.fromhex(commitment["root"][2:]),
+        commitment["expires_at"],
+    ]))
+
+
+def commitment_signer(commitment: Dict[str, Any], signature: str) -> str:
+    return Account.recover_message(encode_defunct(primitive=commitment_digest(commitment)), signature=signature)
+
+
+class ChannelWallet:
+    """Buyer side of one channel: the hash chain and the running total"""
+
+    def __init__(self, private_key: str, channel_id: str, merchant: str, token: str, chain_id: int,
+                 deposit: int, unit: int = CHANNEL_UNIT, ttl: float = CHANNEL_TTL, seed: Optional[bytes] = None):
+        if deposit // unit > CHANNEL_MAX_LENGTH:
+            raise ValueError(f"Deposit needs more than {CHANNEL_MAX_LENGTH} units; use a larger unit")
+        account = Account.from_key(private_key)
+        length = deposit // unit
+        self.words = hash_chain(seed or os.urandom(32), length)
+        self.unit = unit
+        self.units = 0
+        self.commitment = {
+            "channel_id": channel_id.lower(),
+            "buyer": account.address,
+            "merchant": to_checksum_address(merchant),
+            "token": to_checksum_address(token),
+            "chain_id": chain_id,
+            "deposit": deposit,
+            "unit": unit,
+            "length": length,
+            "root": to_hex(self.words[0]),
+            "expires_at": int(time.time() + ttl),
+        }
+        signed = account.sign_message(encode_defunct(primitive=commitment_digest(self.commitment)))
+        self.signature = to_hex(signed.signature)
+
+    @property
+    def channel_id(self) -> str:
+        return self.commitment["channel_id"]
+
+    @property
+    def remaining(self) -> int:
+        return (self.commitment["length"] - self.units) * self.unit
+
+    def open_metadata(self) -> Dict[str, str]:
+        return {"channel": "open", "commitment": json.dumps(self.commitment), "signature": self.signature}
+
+    def pay_metadata(self, amount: int, items: List[Any]) -> Dict[str, str]:
+        """The update paying ``amount`` more; the running total advances immediately"""
+        if amount <= 0 or amount % self.unit:
+            raise ValueError(f"Amount must be a positive multiple of the channel unit ({self.unit})")
+        units = self.units + amount // self.unit
+        if units > self.commitment["length"]:
+            raise ValueError("Channel deposit exhausted")
+        self.units = units
+        return {"channel": "pay", "channel_id": self.channel_id, "units": str(units),
+                "word": to_hex(self.words[units]), "items": json.dumps(items)}
+
+    def close_metadata(self) -> Dict[str, str]:
+        return {"channel": "close", "channel_id": self.channel_id}
+
+    def sync(self, reply: Dict[str, str]):
+        """Adopt the merchant's accepted total after a rejected or lost update"""
+        if reply.get("channel_id") == self.channel_id and reply.get("units", "").isdigit():
+            self.units = int(reply["units"])
+
+
+class ChannelBook:
+    """Merchant side: opens channels, checks updates and records them in the store"""
+
+    def __init__(self, store: MerchantStore, merchant: str, token: str, chain_id: int,
+                 verify_deposit: Callable[[str, str, int], bool],
+                 price: Callable[[List[Any]], Tuple[int, List[Dict[str, Any]]]]):
+        self.store = store
+        self.merchant = merchant.lower()
+        self.token = token.lower()
+        self.chain_id = chain_id
+        self.verify_deposit = verify_deposit
+        self.price = price
+
+    def handle(self, metadata: Dict[str, str]) -> Dict[str, str]:
+        """Reply metadata for one channel message; never raises for a bad message"""
+        kind = metadata.get("channel")
+        channel_id = metadata.get("channel_id", "")
+        try:
+            if kind == "open":
+                return self.open(json.loads(metadata["commitment"]), metadata["signature"])
+            if kind == "pay":
+                return self.pay(channel_id, int(metadata["units"]), metadata["word"],
+                                json.loads(metadata.get("items") or "[]"))
+            if kind == "close":
+                return self.close(channel_id)
+            raise ChannelError(f"Unknown channel message {kind!r}")
+        except (ChannelError, KeyError, ValueError, TypeError) as e:
+            channel = self.store.get_channel(channel_id) if channel_id else None
+            reply = {"channel": "rejected", "channel_id": channel_id, "reason": str(e) or type(e).__name__}
+            if channel is not None:
+                reply["units"] = str(channel["units"])
+            return reply
+
+    def open(self, commitment: Dict[str, Any], signature: str) -> Dict[str, str]:
+        channel_id = commitment["channel_id"].lower()
+        deposit, unit, length = int(commitment["deposit"]), int(commitment["unit"]), int(commitment["length"])
+        expires_at = int(commitment["expires_at"])
+        now = time.time()
+        if commitment["merchant"].lower() != self.merchant or commitment["token"].lower() != self.token:
+            raise ChannelError("Commitment is for another merchant or token")
+        if int(commitment["chain_id"]) != self.chain_id:
+            raise ChannelError("Commitment is for another chain")
+        if unit <= 0 or length != deposit // unit or length > CHANNEL_MAX_LENGTH:
+            raise ChannelError("Deposit, unit and chain length do not match")
+        if not now < expires_at <= now + CHANNEL_MAX_TTL:
+            raise ChannelError("Channel expiry out of range")
+        if commitment_signer(commitment, signature).lower() != commitment["buyer"].lower():
+            raise ChannelError("Commitment signature does not match the buyer")
+        # A transfer that already paid an order (or opened a channel) cannot be a deposit too
+        if self.store.tx_claim(channel_id) is not None:
+            raise ChannelError("Deposit already used")
+        if not self.verify_deposit(channel_id, commitment["buyer"], deposit):
+            raise ChannelError("Deposit transfer from the buyer not found")
+
+        if not self.store.open_channel(channel_id, commitment["buyer"], deposit, unit, length,
+                                       commitment["root"], expires_at):
+            raise ChannelError("Deposit already used")
+        logger.info("Channel opened", extra={"channel_id": channel_id, "deposit": deposit})
+        return {"channel": "opened", "channel_id": channel_id, "units": "0"}
+
+    def pay(self, channel_id: str, units: int, word: str, items: List[Any]) -> Dict[str, str]:
+        channel = self.store.get_channel(channel_id)
+        if channel is None or channel["status"] != "open":
+            raise ChannelError("Channel is not open")
+        if channel["expires_at"] <= time.time():
+            raise ChannelError("Channel expired")
+        if not channel["units"] < units <= channel["length"]:
+            raise ChannelError("Cumulative total must grow and stay within the deposit")
+
+        amount, lines = self.price(items)
+        if amount != (units - channel["units"]) * channel["unit"]:
+            raise ChannelError("Update does not match the price of the items")
+        # The cheap checks above bound the number of hashes to the price of the order
+        if walk(bytes.fromhex(word[2:]), units - channel["units"]) != bytes.fromhex(channel["word"][2:]):
+            raise ChannelError("Update does not extend the buyer's hash chain")
+
+        order_id = self.store.channel_payment(channel_id, channel["units"], units, word, amount, lines)
+        if order_id is None:
+            raise ChannelError("Concurrent update; retry with the accepted total")
+        return {"channel": "accepted", "channel_id": channel_id, "units": str(units), "order_id": order_id}
+
+    def close(self, channel_id: str) -> Dict[str, str]:
+        channel = self.store.get_channel(channel_id)
+        if channel is None:
+            raise ChannelError("Unknown channel")
+        self.store.close_channel(channel_id)
+        return {"channel": "closing", "channel_id": channel_id, "units": str(channel["units"])}
+
+
+class ChannelSettler:
+    """Refunds closed and expired channels on-chain in batches"""
+
+    def __init__(self, w3, token, store: MerchantStore, private_key: Optional[str],
+                 interval: float = CHANNEL_SETTLE_INTERVAL, timeout: float = CHANNEL_SETTLE_TIMEOUT,
+                 nonces: Optional[NonceAllocator] = None):
+        self.w3 = w3
+        self.token = token
+        self.store = store
+        self.account = Account.from_key(private_key) if private_key else None
+        # Shared with every other sender of the merchant wallet in the process
+        self.nonces = nonces or (NonceAllocator(w3, self.account.address) if self.account else None)
+        self.interval = interval
+        self.timeout = timeout
+
+    def _sign_refund(self, buyer: str, refund: int, nonce: int, gas_price: int, chain_id: int):
+        tx = self.token.functions.transfer(to_checksum_address(buyer), refund).build_transaction({
+            "from": self.account.address,
+            "nonce": nonce,
+            "gas": CHANNEL_SETTLE_GAS,
+            "gasPrice": gas_price,
+            "chainId": chain_id,
+        })
+        return self.account.sign_transaction(tx)
+
+    def settle_once(self) -> int:
+        """Send refunds for every closed or expired channel; returns the number settled this round"""
+        now = time.time()
+        settled = 0
+        pending = []
+        for channel in self.store.channels_to_settle(now):
+            refund = channel["deposit"] - channel["units"] * channel["unit"]
+            if channel["status"] == "settling":
+                state, mined = tx_state(self.w3, channel["refund_attempts"], channel["refund_sent_at"],
+                                        self.timeout, now)
+                if state == "mined":
+                    self.store.mark_channel_settled(channel["channel_id"], mined)
+                    settled += 1
+                elif state == "reverted":
+                    logger.warning("Channel refund reverted", extra={"channel_id": channel["channel_id"],
+                                                                      "tx_hash": mined})
+                if state in ("reverted", "replace"):
+                    pending.append((channel, refund, state))
+            elif refund == 0:
+                self.store.mark_channel_settled(channel["channel_id"], None)
+                settled += 1
+            else:
+                pending.append((channel, refund, "new"))
+        if not pending:
+            return settled
+        if self.account is None:
+            logger.warning("Channel refunds waiting for MERCHANT_WALLET_KEY", extra={"channels": len(pending)})
+            return settled
+
+        gas_price = self.w3.eth.gas_price
+        chain_id = self.w3.eth.chain_id
+        # A reverted refund spent its nonce, so it needs a new one like a first refund
+        fresh = sum(1 for _, _, state in pending if state != "replace")
+        nonce = self.nonces.allocate(fresh) if fresh else None
+        batch = []
+        for channel, refund, state in pending:
+            if state == "replace":
+                # Still unmined: same nonce, so at most one refund per channel can ever be mined
+                tx_nonce, attempts = channel["refund_nonce"], channel["refund_attempts"]
+                price = replacement_gas_price(gas_price, channel["refund_gas_price"])
+            else:
+                tx_nonce, attempts, price = nonce, [], gas_price
+                nonce += 1
+            signed = self._sign_refund(channel["buyer"], refund, tx_nonce, price, chain_id)
+            batch.append((channel["channel_id"], signed, attempts + [to_hex(signed.hash)], tx_nonce, price))
+
+        # Recorded before sending: a crash between the two resends with the same nonce
+        self.store.mark_channels_settling(
+            [(channel_id, to_hex(signed.hash), attempts, tx_nonce, price, now)
+             for channel_id, signed, attempts, tx_nonce, price in batch])
+        for channel_id, signed, _, _, _ in batch:
+            try:
+                self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            except Exception as e:
+                logger.warning("Channel refund not sent", extra={"channel_id": channel_id, "error": str(e)})
+        logger.info("Channel refunds sent", extra={"refunds": len(batch)})
+        return settled
+
+    async def run(self):
+        """Settle forever on the running loop; RPC work happens in a worker thread"""
+        while True:
+            try:
+                settled = await asyncio.to_thread(self.settle_once)
+                if settled:
+                    logger.info("Channels settled", extra={"channels": settled})
+            except Exception as e:
+                logger.warning("Channel settlement error", extra={"error": str(e)})
+            await asyncio.sleep(self.interval)
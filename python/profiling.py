@@ -0,0 +1,260 @@
+"""
+On-demand profiling for the agent HTTP servers. Everything is off by default.
+
+* Sampling profiler: samples every thread's stack with ``sys._current_frames``
+  for a time window and returns collapsed stacks, one ``frame;frame;... count``
+  line per stack, ready for flamegraph.pl or speedscope.
+    - ``POST /admin/profile?seconds=10`` with an ``X-Admin-Token`` header;
+      the route only exists when ADMIN_TOKEN is set
+    - ``kill -USR1 <pid>`` when PROFILE_ON_SIGNAL=1; the dump is written to
+      PROFILE_DIR/profile-<pid>-<time>.folded
+* ``Server-Timing`` response headers split into route, parse, handler, rpc and
+  serialize phases when SERVER_TIMING=1; rpc is the part of handler spent in
+  JSON-RPC calls.
+"""
+
+import contextvars
+import functools
+import hmac
+import inspect
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+PROFILE_ON_SIGNAL = os.getenv("PROFILE_ON_SIGNAL", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.dirname(os.path.abspath(__file__)))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "10"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = 60.0
+# Sampling interval bounds for /admin/profile, in milliseconds
+PROFILE_MIN_INTERVAL_MS = 1.0
+PROFILE_MAX_INTERVAL_MS = 1000.0
+
+logger = logging.getLogger("profiling")
+
+
+# Sampling profiler
+
+class SamplingProfiler:
+    """Samples every thread but its own at a fixed interval"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_for(seconds: float, interval: float = PROFILE_INTERVAL) -> str:
+    """Block for ``seconds`` while sampling; one profile runs at a time"""
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        time.sleep(min(seconds, PROFILE_MAX_SECONDS))
+        return profiler.stop()
+    finally:
+        _profile_lock.release()
+
+
+def _profile_to_file():
+    path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    try:
+        collapsed = profile_for(PROFILE_SIGNAL_SECONDS)
+    except RuntimeError as e:
+        logger.warning("Profile not started", extra={"error": str(e)})
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(collapsed)
+    logger.warning("Profile written", extra={"path": path})
+
+
+def install_signal_handler(signum: int = getattr(signal, "SIGUSR1", 0)) -> bool:
+    """Profile for PROFILE_SIGNAL_SECONDS on ``signum``; only from the main thread"""
+    if not signum or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, lambda *_: threading.Thread(target=_profile_to_file, daemon=True).start())
+    return True
+
+
+# Server-Timing
+
+class RequestTimings:
+    """Phase boundaries of one request, filled in as it moves through the app"""
+
+    __slots__ = ("start", "routed", "handler_start", "handler_end", "rpc")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.routed = self.handler_start = self.handler_end = None
+        self.rpc = 0.0
+
+    def header(self, now: float) -> str:
+        phases: Dict[str, float] = {}
+        if self.routed is not None:
+            phases["route"] = self.routed - self.start
+            if self.handler_start is not None:
+                phases["parse"] = self.handler_start - self.routed
+        if self.handler_start is not None and self.handler_end is not None:
+            phases["handler"] = self.handler_end - self.handler_start
+            phases["rpc"] = self.rpc
+            phases["serialize"] = now - self.handler_end
+        phases["total"] = now - self.start
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items())
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+def record_rpc(seconds: float):
+    """Attribute JSON-RPC time to the current request, if it is being timed"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.rpc += seconds
+
+
+def _timed_endpoint(endpoint):
+    # FastAPI unwraps __wrapped__ for the signature, so parameters are unchanged
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.handler_start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.handler_end = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            # Runs in the threadpool with a copy of the request's context
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.handler_start = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.handler_end = time.perf_counter()
+    return timed
+
+
+@functools.lru_cache(maxsize=None)
+def timed_route_class():
+    """APIRoute that marks when routing finished and when the endpoint ran"""
+    # Built on demand so rpc.py can import this module without FastAPI
+    from fastapi.routing import APIRoute
+
+    class TimedRoute(APIRoute):
+        def __init__(self, path: str, endpoint, **kwargs):
+            super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+        async def handle(self, scope, receive, send):
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.routed = time.perf_counter()
+            await super().handle(scope, receive, send)
+
+    return TimedRoute
+
+
+class ServerTimingMiddleware:
+    """Adds the Server-Timing header to every HTTP response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = timings.header(time.perf_counter()).encode()
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+
+
+def install_profiling(app):
+    """Wire up whichever profiling hooks are enabled; call before defining routes"""
+    if SERVER_TIMING:
+        app.router.route_class = timed_route_class()
+        app.add_middleware(ServerTimingMiddleware)
+
+    if ADMIN_TOKEN:
+        import asyncio
+        from fastapi import Header, HTTPException
+        from fastapi.responses import PlainTextResponse
+
+        @app.post("/admin/profile", include_in_schema=False)
+        async def admin_profile(seconds: float = 10.0, interval_ms: float = PROFILE_INTERVAL * 1000,
+                                x_admin_token: str = Header(default="")):
+            if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+                raise HTTPException(status_code=403, detail="Forbidden")
+            if not 0 < seconds <= PROFILE_MAX_SECONDS:
+                raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+            if not PROFILE_MIN_INTERVAL_MS <= interval_ms <= PROFILE_MAX_INTERVAL_MS:
+                raise HTTPException(status_code=400, detail=f"interval_ms must be in "
+                                    f"[{PROFILE_MIN_INTERVAL_MS:g}, {PROFILE_MAX_INTERVAL_MS:g}]")
+            try:
+                collapsed = await asyncio.to_thread(profile_for, seconds, interval_ms / 1000)
+            except RuntimeError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            return PlainTextResponse(collapsed)
+
+    if PROFILE_ON_SIGNAL:
+        install_signal_handler()
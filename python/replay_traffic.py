@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Replay traffic recorded with CAPTURE=1 against a build under test.
+
+    python replay_traffic.py traffic.capture.gz --target merchant=http://127.0.0.1:8001
+    python replay_traffic.py traffic.capture.gz --in-process --speedup 10
+    python replay_traffic.py traffic.capture.gz --in-process --speedup 0 --tolerance 0.2
+
+Requests are sent on the recorded schedule, compressed by --speedup (0 sends
+them back to back, bounded only by --concurrency). For each endpoint the
+recorded server-side latencies are compared with the replayed round-trip
+latencies. Responses are diffed after dropping fields that change on every
+call (timestamps, IDs; see --ignore). The exit status is 1 when any
+endpoint's p95 rose by more than --tolerance or a response changed.
+
+--in-process serves the merchant and alice apps from this checkout through
+ASGI, so there is no network or server overhead in the replayed numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from traffic_capture import CAPTURE_FILE, read_capture  # noqa: E402
+
+VOLATILE_FIELDS = ("timestamp", "msg_id", "order_id", "correlation_id", "trace_id", "expires_at", "time_taken")
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+
+def normalize(text: str, ignore: Tuple[str, ...]) -> Any:
+    """A response body with volatile fields removed, for comparison"""
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+
+    def strip(node):
+        if isinstance(node, dict):
+            return {key: strip(item) for key, item in node.items() if key not in ignore}
+        if isinstance(node, list):
+            return [strip(item) for item in node]
+        return node
+
+    return strip(value)
+
+
+def in_process_clients(concurrency: int) -> Dict[str, httpx.AsyncClient]:
+    import merchant
+    import my_first_agent
+
+    limits = httpx.Limits(max_connections=concurrency)
+    return {
+        service: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay",
+                                   limits=limits, timeout=60.0)
+        for service, app in (("merchant", merchant.app), ("alice", my_first_agent.app))
+    }
+
+
+async def replay(records: List[Dict[str, Any]], clients: Dict[str, httpx.AsyncClient], speedup: float,
+                 concurrency: int) -> List[Optional[Tuple[int, str, float]]]:
+    """Send every record on its (compressed) schedule; returns (status, body, latency) per record"""
+    results: List[Optional[Tuple[int, str, float]]] = [None] * len(records)
+    slots = asyncio.Semaphore(concurrency)
+    origin = records[0]["ts"]
+    start = time.perf_counter()
+
+    async def one(index: int, record: Dict[str, Any]):
+        if speedup > 0:
+            delay = (record["ts"] - origin) / speedup - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        client = clients[record["service"]]
+        url = record["path"] + (f"?{record['query']}" if record["query"] else "")
+        headers = {"content-type": record["content_type"]} if record["content_type"] else {}
+        async with slots:
+            sent = time.perf_counter()
+            try:
+                response = await client.request(record["method"], url, content=record["body"].encode(),
+                                                headers=headers)
+                results[index] = (response.status_code, response.text, time.perf_counter() - sent)
+            except httpx.HTTPError as e:
+                results[index] = (0, f"{type(e).__name__}: {e}", time.perf_counter() - sent)
+
+    await asyncio.gather(*(one(index, record) for index, record in enumerate(records)))
+    return results
+
+
+def report(records: List[Dict[str, Any]], results: List[Optional[Tuple[int, str, float]]],
+           ignore: Tuple[str, ...], tolerance: float, show_diffs: int) -> bool:
+    """Print the latency comparison and response diffs; returns True when the replay passed"""
+    recorded: Dict[str, List[float]] = defaultdict(list)
+    replayed: Dict[str, List[float]] = defaultdict(list)
+    mismatches: Dict[str, int] = defaultdict(int)
+    examples = []
+    for record, result in zip(records, results):
+        key = f"{record['service']} {record['method']} {record['path']}"
+        status, body, latency = result
+        recorded[key].append(record["duration"])
+        replayed[key].append(latency)
+        expected = (record["status"], normalize(record["response"], ignore))
+        actual = (status, normalize(body, ignore))
+        if expected != actual:
+            mismatches[key] += 1
+            if len(examples) < show_diffs:
+                examples.append((key, record["body"], expected, actual))
+
+    passed = True
+    print(f"{'endpoint':40} {'n':>6}  {'recorded p50/p95 ms':>20}  {'replayed p50/p95 ms':>20}  {'p95':>7}  diffs")
+    for key in sorted(recorded):
+        before, after = sorted(recorded[key]), sorted(replayed[key])
+        p95_before, p95_after = percentile(before, 0.95), percentile(after, 0.95)
+        change = p95_after / p95_before - 1 if p95_before else 0.0
+        flag = ""
+        if change > tolerance:
+            flag, passed = " ⚠️", False
+        if mismatches[key]:
+            passed = False
+        print(f"{key:40} {len(before):6}  {percentile(before, 0.5) * 1000:9.2f}/{p95_before * 1000:<9.2f}  "
+              f"{percentile(after, 0.5) * 1000:9.2f}/{p95_after * 1000:<9.2f}  {change:+7.1%}  "
+              f"{mismatches[key]}{flag}")
+
+    for key, body, expected, actual in examples:
+        print(f"\n❌ {key} {body[:200]}")
+        print(f"   recorded: {expected[0]} {json.dumps(expected[1], default=str)[:500]}")
+        print(f"   replayed: {actual[0]} {json.dumps(actual[1], default=str)[:500]}")
+    return passed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", nargs="?", default=CAPTURE_FILE)
+    parser.add_argument("--target", action="append", default=[], metavar="SERVICE=URL",
+                        help="base URL per service, e.g. merchant=http://127.0.0.1:8001")
+    parser.add_argument("--in-process", action="store_true", help="serve the apps from this checkout over ASGI")
+    parser.add_argument("--service", action="append", help="only replay these services")
+    parser.add_argument("--speedup", type=float, default=1.0, help="schedule compression; 0 = back to back")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--ignore", action="append", default=[], help="extra response field to ignore")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 increase per endpoint")
+    parser.add_argument("--show-diffs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    try:
+        records = [record for record in read_capture(args.capture)
+                   if not args.service or record["service"] in args.service]
+    except FileNotFoundError:
+        print(f"❌ No capture at {args.capture}; run the agents with CAPTURE=1", file=sys.stderr)
+        return 1
+    records.sort(key=lambda record: record["ts"])
+    records = records[:args.limit] if args.limit else records
+    if not records:
+        print("❌ Nothing to replay", file=sys.stderr)
+        return 1
+
+    if args.in_process:
+        clients = in_process_clients(args.concurrency)
+    else:
+        targets = dict(target.split("=", 1) for target in args.target)
+        missing = {record["service"] for record in records} - targets.keys()
+        if missing:
+            print(f"❌ No --target for {', '.join(sorted(missing))}", file=sys.stderr)
+            return 1
+        limits = httpx.Limits(max_connections=args.concurrency)
+        clients = {service: httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0)
+                   for service, url in targets.items()}
+
+    recorded_over = records[-1]["ts"] - records[0]["ts"]
+    print(f"🔁 Replaying {len(records)} requests recorded over {recorded_over:.1f}s"
+          + (f" at {args.speedup:g}x" if args.speedup > 0 else " back to back"))
+
+    async def run():
+        try:
+            return await replay(records, clients, args.speedup, args.concurrency)
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    print(f"⏱️ Replay took {time.perf_counter() - start:.1f}s\n")
+    passed = report(records, results, VOLATILE_FIELDS + tuple(args.ignore), args.tolerance, args.show_diffs)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
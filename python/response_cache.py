@@ -0,0 +1,85 @@
+"""
+Memoized chat replies for the keyword-routed agents.
+
+Routing (``merchant_intent``, ``buyer_intent``, ``message_intent``) and the
+reply builders are pure functions of the message text, so a reply never has
+to be built twice. ``ResponseCache`` keeps a bounded LRU from normalized text
+(lower case, whitespace collapsed) to the resolved intent, plus the reply for
+each intent. Only a handful of intents exist, so the second map stays small
+even when the first is full of distinct phrasings.
+
+Call ``clear()`` when whatever the replies are built from changes (alice's
+knowledge base; the merchant's replies are fixed text). Lookups are counted in ``chat_response_cache_total`` by
+agent and hit/miss; the hit rate is hits / (hits + misses).
+
+    RESPONSE_CACHE=0         route and build every reply (no caching)
+    RESPONSE_CACHE_SIZE=1024 phrasings kept per agent
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from metrics import CHAT_CACHE_EVICTIONS, CHAT_CACHE_LOOKUPS
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Longer messages are still answered from the per-intent replies, just not remembered
+RESPONSE_CACHE_MAX_KEY = int(os.getenv("RESPONSE_CACHE_MAX_KEY", "256"))
+
+
+def normalize(message: str) -> str:
+    return " ".join(message.lower().split())
+
+
+class ResponseCache:
+    """Bounded LRU of intents by normalized message, with one memoized reply per intent"""
+
+    def __init__(self, agent: str, route: Callable[[str], str], reply: Callable[[str], str],
+                 maxsize: int = RESPONSE_CACHE_SIZE):
+        self.agent = agent
+        self.route = route
+        self.reply = reply
+        self.maxsize = maxsize
+        self._intents: "OrderedDict[str, str]" = OrderedDict()
+        self._replies: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, message: str) -> Tuple[str, str]:
+        """(intent, reply) for a message"""
+        if not RESPONSE_CACHE:
+            intent = self.route(message)
+            return intent, self.reply(intent)
+
+        key = normalize(message)
+        with self._lock:
+            intent = self._intents.get(key)
+            if intent is not None:
+                self._intents.move_to_end(key)
+                reply = self._replies.get(intent)
+                if reply is not None:
+                    CHAT_CACHE_LOOKUPS.inc(self.agent, "hit")
+                    return intent, reply
+
+        CHAT_CACHE_LOOKUPS.inc(self.agent, "miss")
+        if intent is None:
+            intent = self.route(key)
+        reply = self.reply(intent)
+        with self._lock:
+            self._replies[intent] = reply
+            if len(key) <= RESPONSE_CACHE_MAX_KEY:
+                self._intents[key] = intent
+                if len(self._intents) > self.maxsize:
+                    self._intents.popitem(last=False)
+                    CHAT_CACHE_EVICTIONS.inc(self.agent)
+        return intent, reply
+
+    def clear(self):
+        """Forget every reply, e.g. after the catalog or knowledge base changed"""
+        with self._lock:
+            self._intents.clear()
+            self._replies.clear()
+
+    def __len__(self) -> int:
+        return len(self._intents)
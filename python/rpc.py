@@ -0,0 +1,62 @@
+"""
+Web3 HTTP providers that record JSON-RPC latency per method and endpoint.
+
+Only the endpoint's host is used as a label, so API keys embedded in RPC URLs
+never reach /metrics. Call time is also attributed to the current request's
+Server-Timing rpc phase when that is enabled, and each call is a trace span
+when TRACING=1.
+"""
+
+import time
+from typing import Any
+from urllib.parse import urlparse
+
+from web3 import AsyncWeb3, Web3
+
+from metrics import RPC_CALLS, RPC_SECONDS
+from profiling import record_rpc
+from tracing import span
+
+
+def endpoint_label(endpoint_uri) -> str:
+    return urlparse(str(endpoint_uri)).netloc or "unknown"
+
+
+def _outcome(response) -> str:
+    return "error" if isinstance(response, dict) and response.get("error") else "ok"
+
+
+class InstrumentedHTTPProvider(Web3.HTTPProvider):
+    def make_request(self, method, params: Any):
+        endpoint = endpoint_label(self.endpoint_uri)
+        outcome = "exception"
+        start = time.perf_counter()
+        try:
+            with span(f"rpc {method}", endpoint=endpoint) as rpc_span:
+                response = super().make_request(method, params)
+                outcome = _outcome(response)
+                rpc_span.set(outcome=outcome)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            record_rpc(elapsed)
+            RPC_SECONDS.observe(elapsed, method, endpoint)
+            RPC_CALLS.inc(method, endpoint, outcome)
+
+
+class InstrumentedAsyncHTTPProvider(AsyncWeb3.AsyncHTTPProvider):
+    async def make_request(self, method, params: Any):
+        endpoint = endpoint_label(self.endpoint_uri)
+        outcome = "exception"
+        start = time.perf_counter()
+        try:
+            with span(f"rpc {method}", endpoint=endpoint) as rpc_span:
+                response = await super().make_request(method, params)
+                outcome = _outcome(response)
+                rpc_span.set(outcome=outcome)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            record_rpc(elapsed)
+            RPC_SECONDS.observe(elapsed, method, endpoint)
+            RPC_CALLS.inc(method, endpoint, outcome)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Run the buyer, alice and merchant agents in one process under a uagents Bureau.
+
+Co-hosted agents exchange chat-protocol messages in memory through the uagents
+dispatcher instead of signed envelopes over localhost HTTP.
+
+    python run_bureau.py               # agents on :8000, merchant API :8003, alice API :8002
+    python run_bureau.py --front-door  # everything on :8000, APIs under /merchant and /alice
+
+With --front-door, point the buyer at the mounted API:
+MERCHANT_URL=http://127.0.0.1:8000/merchant
+"""
+
+import argparse
+import asyncio
+import os
+
+import uvicorn
+from fastapi import FastAPI
+from uagents import Bureau
+
+import buyer
+import merchant
+import my_first_agent
+from asgi_host import serve_bureau_async
+from loop_watchdog import watch_loop
+from structured_logging import UVICORN_LOGGERS, adopt_loggers, configure_logging
+
+BUREAU_PORT = int(os.getenv("BUREAU_PORT", "8000"))
+
+
+def build_bureau(port: int = BUREAU_PORT) -> Bureau:
+    """One Bureau owning all three agents; must be called inside the running loop"""
+    bureau = Bureau(port=port, endpoint=[f"http://127.0.0.1:{port}/submit"])
+    for agent in (buyer.get_buyer_agent(), merchant.get_merchant_agent(), my_first_agent.agent):
+        bureau.add(agent)
+        adopt_loggers(agent._logger)
+    return bureau
+
+
+def build_front_door() -> FastAPI:
+    """Single HTTP entry point for both agent APIs"""
+    front_door = FastAPI(title="Agent Bureau")
+    front_door.mount("/merchant", merchant.app)
+    front_door.mount("/alice", my_first_agent.app)
+    return front_door
+
+
+async def run_bureau(front_door: bool, host: str = "127.0.0.1", port: int = BUREAU_PORT):
+    bureau = build_bureau(port)
+    if front_door:
+        await serve_bureau_async(bureau, build_front_door(), host=host, port=port)
+        return
+
+    # Agents share the bureau endpoint; the HTTP APIs keep their usual ports
+    watch_loop("bureau")
+    api_servers = [
+        uvicorn.Server(uvicorn.Config(merchant.app, host=host, port=8003, log_level="info")),
+        uvicorn.Server(uvicorn.Config(my_first_agent.app, host=host, port=8002, log_level="info")),
+    ]
+    adopt_loggers(*UVICORN_LOGGERS)
+    await asyncio.gather(bureau.run_async(), *(server.serve() for server in api_servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--front-door", action="store_true",
+                        help="serve the agent endpoint and both HTTP APIs on one port")
+    parser.add_argument("--port", type=int, default=BUREAU_PORT)
+    args = parser.parse_args()
+    configure_logging()
+
+    print("🚀 Starting agent Bureau (buyer, alice, merchant)...")
+    print(f"🔗 Buyer: {buyer.get_buyer_agent().address}")
+    print(f"🔗 Alice: {my_first_agent.agent.address}")
+    print(f"🔗 Merchant: {merchant.merchant_agent_address()}")
+    print(f"⚡ Agent endpoint: http://127.0.0.1:{args.port}/submit")
+    if args.front_door:
+        print(f"🌐 Merchant API: http://127.0.0.1:{args.port}/merchant")
+        print(f"🌐 Alice API: http://127.0.0.1:{args.port}/alice")
+
+    asyncio.run(run_bureau(args.front_door, port=args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Batched settlement of merchant receivables.
+
+Payments are verified one at a time as buyers report them. Settlement
+reconciles everything verified since the last run against the chain in one
+pass instead of one receipt lookup per order:
+
+1. Scan the blocks after the last settled one for rUSDT transfers to the
+   merchant with ``eth_getLogs``, one call per SETTLEMENT_BLOCK_RANGE blocks,
+   and replace the Transfer index for that range with the result, so
+   transfers dropped by a reorg disappear from it. Only blocks up to the
+   confirmed head are settled; the rest are scanned again next time.
+2. Join every unsettled payment with the index in SQLite and classify it:
+   matched (the transfer is there with the verified amount), mismatch (the
+   amounts differ), pending (mined after the confirmed head) or missing (no
+   transfer to the merchant in that transaction).
+3. Record the settlement, its report and the settled payments together, add
+   the revenue of payment channels settled since the last run, and send one
+   rUSDT payout for everything payable to SETTLEMENT_PAYOUT_ADDRESS.
+   A payout is recorded as sent, and its settlements count as paid out only
+   once its receipt succeeds. Each run first re-checks the payouts in flight:
+   a reverted one is re-sent with a new nonce, one stuck for
+   SETTLEMENT_PAYOUT_TIMEOUT is replaced at the same nonce.
+
+Pending and missing payments stay unsettled and are looked at again next
+time; transfers in the range that no payment or channel claims are reported
+as unclaimed.
+
+    python settlement.py                    # settle now, print the report
+    python settlement.py --report eod.json  # and write it to a file
+    python settlement.py --no-payout
+
+    SETTLEMENT_INTERVAL=86400      seconds between runs inside the merchant (0: off)
+    SETTLEMENT_CONFIRMATIONS=12    blocks a transfer needs before it is settled
+    SETTLEMENT_PAYOUT_ADDRESS=0x.. where payouts go (unset: report only)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from eth_account import Account
+from eth_utils import to_checksum_address, to_hex
+
+from merchant_store import MerchantStore
+from merchant_wallet import NonceAllocator, replacement_gas_price, tx_state
+from token_events import TRANSFER_TOPIC, address_topic
+
+SETTLEMENT_INTERVAL = float(os.getenv("SETTLEMENT_INTERVAL", "0"))
+SETTLEMENT_CONFIRMATIONS = int(os.getenv("SETTLEMENT_CONFIRMATIONS", "12"))
+SETTLEMENT_BLOCK_RANGE = int(os.getenv("SETTLEMENT_BLOCK_RANGE", os.getenv("INDEXER_BLOCK_RANGE", "2000")))
+SETTLEMENT_PAYOUT_ADDRESS = os.getenv("SETTLEMENT_PAYOUT_ADDRESS")
+SETTLEMENT_PAYOUT_GAS = int(os.getenv("SETTLEMENT_PAYOUT_GAS", "100000"))
+# A payout not mined after this long is re-signed with the same nonce and a higher gas price
+SETTLEMENT_PAYOUT_TIMEOUT = float(os.getenv("SETTLEMENT_PAYOUT_TIMEOUT", "300"))
+# Exceptions listed one by one in a report; the totals always cover all of them
+SETTLEMENT_REPORT_LIMIT = int(os.getenv("SETTLEMENT_REPORT_LIMIT", "1000"))
+
+logger = logging.getLogger("merchant.settlement")
+
+
+class Settlement:
+    """Reconciles verified payments against the chain and pays out the merchant's receivables"""
+
+    def __init__(self, w3, token, store: MerchantStore, merchant: str, private_key: Optional[str] = None,
+                 payout_address: Optional[str] = SETTLEMENT_PAYOUT_ADDRESS,
+                 confirmations: int = SETTLEMENT_CONFIRMATIONS, block_range: int = SETTLEMENT_BLOCK_RANGE,
+                 start_block: Optional[int] = None, nonces: Optional[NonceAllocator] = None,
+                 payout_timeout: float = SETTLEMENT_PAYOUT_TIMEOUT):
+        self.w3 = w3
+        self.token = token
+        self.store = store
+        self.merchant = merchant.lower()
+        self.account = Account.from_key(private_key) if private_key else None
+        # Shared with every other sender of the merchant wallet in the process
+        self.nonces = nonces or (NonceAllocator(w3, self.account.address) if self.account else None)
+        self.payout_timeout = payout_timeout
+        self.payout_address = payout_address
+        self.confirmations = confirmations
+        self.block_range = block_range
+        self.start_block = start_block
+
+    def scan(self, from_block: int, to_block: int) -> int:
+        """Re-read the merchant's transfers in a block range into the index; returns how many there are.
+
+        Logs are requested raw: decoding the two fields needed here by hand is far
+        cheaper than web3's per-log formatting when a range holds 100k transfers.
+        """
+        count = 0
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.block_range - 1, to_block)
+            response = self.w3.provider.make_request("eth_getLogs", [{
+                "address": self.token.address,
+                "fromBlock": hex(start),
+                "toBlock": hex(end),
+                "topics": [TRANSFER_TOPIC, None, address_topic(self.merchant)],
+            }])
+            if "error" in response:
+                raise RuntimeError(f"eth_getLogs failed: {response['error']}")
+            rows = [
+                (log["transactionHash"], int(log["logIndex"], 16), "0x" + log["topics"][1][-40:],
+                 self.merchant, int(log["data"], 16), int(log["blockNumber"], 16))
+                for log in response["result"]
+            ]
+            self.store.refresh_transfers(rows, start, end)
+            count += len(rows)
+            start = end + 1
+        return count
+
+    def reconcile(self, to_block: int, verified_before: float) -> Dict[str, Any]:
+        """Classify every unsettled payment against the index"""
+        transfers: Dict[str, List[Any]] = {}
+        for tx_hash, amount, order_id, value, block in self.store.unsettled_payments(self.merchant, verified_before):
+            entry = transfers.setdefault(tx_hash, [int(amount), order_id, 0, None])
+            if value is not None:
+                entry[2] += int(value)
+                entry[3] = block if entry[3] is None else max(entry[3], block)
+
+        groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        totals: Dict[str, int] = defaultdict(int)
+        for tx_hash, (amount, order_id, received, block) in transfers.items():
+            if block is None:
+                status = "missing"
+            elif block > to_block:
+                status = "pending"
+            elif received != amount:
+                status = "mismatch"
+            else:
+                status = "matched"
+            groups[status].append({"tx_hash": tx_hash, "order_id": order_id, "amount": amount,
+                                   "received": received, "block": block})
+            totals[status] += received if status == "matched" else amount
+        return {"groups": groups, "totals": totals}
+
+    def _sign_payout(self, amount: int, nonce: int, gas_price: int):
+        tx = self.token.functions.transfer(to_checksum_address(self.payout_address), amount).build_transaction({
+            "from": self.account.address,
+            "nonce": nonce,
+            "gas": SETTLEMENT_PAYOUT_GAS,
+            "gasPrice": gas_price,
+            "chainId": self.w3.eth.chain_id,
+        })
+        return self.account.sign_transaction(tx)
+
+    def _send(self, signed, amount: int):
+        try:
+            self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            # Still recorded as sent: the next run replaces it with the same nonce
+            logger.warning("Settlement payout not sent", extra={"amount": amount, "error": str(e)})
+
+    def check_payouts(self) -> int:
+        """Settle mined payouts and retry failed or stuck ones; returns the number paid this round"""
+        now = time.time()
+        paid = 0
+        for payout in self.store.payouts_in_flight():
+            state, mined = tx_state(self.w3, payout["attempts"], payout["sent_at"], self.payout_timeout, now)
+            if state == "mined":
+                self.store.mark_payout_paid(payout["payout_id"], mined)
+                logger.info("Settlement payout mined", extra={"tx_hash": mined, "amount": payout["amount"]})
+                paid += 1
+                continue
+            if state == "waiting" or self.account is None:
+                continue
+            gas_price = self.w3.eth.gas_price
+            if state == "reverted":
+                # The nonce is spent: a retry needs a new one
+                logger.warning("Settlement payout reverted", extra={"tx_hash": mined, "amount": payout["amount"]})
+                nonce, attempts = self.nonces.allocate(), []
+            else:
+                nonce, attempts = payout["nonce"], payout["attempts"]
+                gas_price = replacement_gas_price(gas_price, payout["gas_price"])
+            signed = self._sign_payout(payout["amount"], nonce, gas_price)
+            tx_hash = to_hex(signed.hash)
+            self.store.resend_payout(payout["payout_id"], tx_hash, attempts + [tx_hash], nonce, gas_price, now)
+            self._send(signed, payout["amount"])
+        return paid
+
+    def payout(self) -> Optional[Dict[str, Any]]:
+        """One transfer for every settlement not paid out yet, this one included"""
+        self.check_payouts()
+        unpaid = self.store.unpaid_settlements()
+        amount = sum(payable for _, payable in unpaid)
+        if not amount or not self.payout_address:
+            return None
+        if self.account is None:
+            logger.warning("Settlement payout waiting for MERCHANT_WALLET_KEY", extra={"amount": amount})
+            return None
+
+        gas_price = self.w3.eth.gas_price
+        nonce = self.nonces.allocate()
+        signed = self._sign_payout(amount, nonce, gas_price)
+        payout_tx = to_hex(signed.hash)
+        # Recorded as sent before sending: the settlements are paid once its receipt says so,
+        # and a crash in between resends the same nonce instead of paying them twice
+        self.store.record_payout(uuid4().hex, [settlement_id for settlement_id, _ in unpaid], self.payout_address,
+                                 amount, payout_tx, nonce, gas_price, time.time())
+        self._send(signed, amount)
+        return {"to": self.payout_address, "amount": amount, "tx_hash": payout_tx, "status": "sent",
+                "settlements": len(unpaid)}
+
+    def settle(self, payout: bool = True) -> Optional[Dict[str, Any]]:
+        """Scan, reconcile, record and pay out; returns the settlement report (None: nothing confirmed yet)"""
+        started = time.perf_counter()
+        now = time.time()
+        head = self.w3.eth.block_number
+        to_block = head - self.confirmations
+        last = self.store.last_settlement()
+        if last is not None:
+            from_block = last["to_block"] + 1
+        elif self.start_block is not None:
+            from_block = self.start_block
+        else:
+            first = self.store.first_indexed_block()
+            from_block = first if first is not None else max(to_block - self.block_range + 1, 0)
+        from_block = max(from_block, 0)
+        if to_block < from_block:
+            # No new confirmed block since the last settlement, or a chain younger than the confirmations
+            logger.info("Nothing to settle", extra={"head": head, "from_block": from_block})
+            return None
+
+        scanned = self.scan(from_block, head)
+        result = self.reconcile(to_block, now)
+        groups, totals = result["groups"], result["totals"]
+        unclaimed = self.store.unclaimed_transfers(self.merchant, from_block, to_block)
+        channels = self.store.channel_revenue(last["created_at"] if last else 0.0, now)
+        channel_revenue = sum(spent for _, spent in channels)
+        payable = totals["matched"] + channel_revenue
+
+        settlement_id = uuid4().hex
+        report = {
+            "settlement_id": settlement_id,
+            "from_block": from_block,
+            "to_block": to_block,
+            "transfers_scanned": scanned,
+            "counts": {status: len(groups[status]) for status in ("matched", "mismatch", "pending", "missing")},
+            "totals": {status: totals[status] for status in ("matched", "mismatch", "pending", "missing")},
+            "channels": {"settled": len(channels), "revenue": channel_revenue},
+            "unclaimed": {"count": len(unclaimed), "total": sum(int(row[2]) for row in unclaimed)},
+            "payable": payable,
+            "exceptions": {
+                "mismatch": groups["mismatch"][:SETTLEMENT_REPORT_LIMIT],
+                "missing": groups["missing"][:SETTLEMENT_REPORT_LIMIT],
+                "unclaimed": [{"tx_hash": tx_hash, "sender": sender, "value": int(value), "block": block}
+                              for tx_hash, sender, value, block in unclaimed[:SETTLEMENT_REPORT_LIMIT]],
+            },
+        }
+        settled = [(entry["tx_hash"], status) for status in ("matched", "mismatch") for entry in groups[status]]
+        self.store.record_settlement(settlement_id, from_block, to_block, payable, report, settled)
+        report["payout"] = self.payout() if payout else None
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info("Settlement recorded", extra={
+            "settlement_id": settlement_id, "matched": report["counts"]["matched"],
+            "exceptions": report["counts"]["mismatch"] + report["counts"]["missing"] + len(unclaimed),
+            "payable": payable,
+        })
+        return report
+
+    async def run(self, interval: float = SETTLEMENT_INTERVAL):
+        """Settle every ``interval`` seconds on the running loop; the work happens in a worker thread"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.settle)
+            except Exception as e:
+                logger.warning("Settlement error", extra={"error": str(e)})
+
+
+def print_report(report: Dict[str, Any]):
+    counts, totals = report["counts"], report["totals"]
+    print(f"🧾 Settlement {report['settlement_id']} over blocks {report['from_block']}-{report['to_block']} "
+          f"({report['transfers_scanned']} transfers scanned, {report['seconds']}s)")
+    for status in ("matched", "mismatch", "pending", "missing"):
+        print(f"   {status:9} {counts[status]:8} payments {totals[status] / 10**18:14g} rUSDT")
+    print(f"   channels  {report['channels']['settled']:8} settled  {report['channels']['revenue'] / 10**18:14g} rUSDT")
+    print(f"   unclaimed {report['unclaimed']['count']:8} transfers {report['unclaimed']['total'] / 10**18:13g} rUSDT")
+    print(f"💰 payable {report['payable'] / 10**18:g} rUSDT")
+    payout = report.get("payout")
+    if payout:
+        print(f"💸 payout of {payout['amount'] / 10**18:g} rUSDT to {payout['to']}: {payout['tx_hash']} ({payout['status']})")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", help="also write the report as JSON to this file")
+    parser.add_argument("--no-payout", action="store_true", help="reconcile and record, but send nothing")
+    parser.add_argument("--start-block", type=int, help="first block of the very first settlement")
+    args = parser.parse_args(argv)
+
+    import merchant
+    from structured_logging import configure_logging
+
+    configure_logging()
+
+    config = merchant.settings()
+    if not (config.rusdt_contract and config.merchant_address and config.rpc_url):
+        sys.exit("❌ RPC_URL, RUSDT_CONTRACT and MERCHANT_ADDRESS must be set")
+    settlement = Settlement(merchant.get_web3(), merchant.get_token(), merchant.get_store(),
+                            config.merchant_address, config.wallet_key, start_block=args.start_block)
+    report = settlement.settle(payout=not args.no_payout)
+    if report is None:
+        print("🧾 Nothing to settle: no new blocks with enough confirmations")
+        return
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
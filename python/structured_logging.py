@@ -0,0 +1,198 @@
+"""
+Structured, non-blocking logging for the agents.
+
+Log calls only stamp the record and put it on a bounded in-memory queue. A
+QueueListener thread formats and writes it, so a slow stdout never stalls a
+request or the event loop. When the queue is full, records are dropped and
+counted instead of blocking. uagents' ctx.logger and uvicorn's loggers are
+re-routed through the same queue.
+
+    LOG_FORMAT=json|text            JSON lines (default) or human-readable text
+    LOG_LEVEL=INFO
+    LOG_QUEUE_SIZE=10000
+    LOG_SAMPLE_RATES=uvicorn.access=0.01,merchant.http=0.1
+                                    keep this fraction of INFO/DEBUG records per
+                                    logger prefix (warnings and errors are always kept)
+
+Every record carries the correlation ID of the request or chat message being
+handled: CorrelationIdMiddleware takes it from X-Request-ID (or makes one) and
+echoes it back; chat handlers use the message ID.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Union
+
+from metrics import LOG_RECORDS_DROPPED
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = entry.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+LOG_SAMPLE_RATES = _parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "correlation_id", "taskName", "color_message"}
+
+
+def _extras(record: logging.LogRecord) -> Dict[str, object]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        entry.update(_extras(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(name)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in _extras(record).items())
+        if getattr(record, "correlation_id", None):
+            fields = f"cid={record.correlation_id} {fields}"
+        if fields.strip():
+            first, newline, rest = line.partition("\n")
+            line = f"{first}  {fields.strip()}{newline}{rest}"
+        return line
+
+
+class ContextFilter(logging.Filter):
+    """Runs in the caller: per-logger sampling, then stamp the correlation ID"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._rate_cache: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rate_cache.get(name)
+        if rate is None:
+            # Longest matching logger prefix wins
+            matches = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + ".")]
+            rate = self.rates[max(matches, key=len)] if matches else 1.0
+            self._rate_cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and self.rates:
+            rate = self._rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                LOG_RECORDS_DROPPED.inc("sampled")
+                return False
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: records are dropped when the queue is full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread; the record stays in-process
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc("queue_full")
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Install the queue pipeline on the root logger; later calls are no-ops"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def adopt_loggers(*loggers: Union[str, logging.Logger]):
+    """Send loggers with their own handlers (uagents, uvicorn) through the pipeline"""
+    if _listener is None:
+        return
+    for logger in loggers:
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.propagate = True
+
+
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+class CorrelationIdMiddleware:
+    """Gives each HTTP request a correlation ID and returns it as X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        token = correlation_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
@@ -11,8 +11,10 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from buyer import buy_item
+from structured_logging import configure_logging
 
 load_dotenv()
+configure_logging()
 
 def test_purchase():
     """Test a simple purchase"""
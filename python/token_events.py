@@ -0,0 +1,15 @@
+"""
+Log filters for rUSDT Transfer events paid to the merchant.
+
+Shared by the transfer indexer and settlement. Kept free of web3, so importing
+settlement (or anything else that filters Transfer logs) does not load it.
+"""
+
+from eth_utils import keccak
+
+TRANSFER_TOPIC = "0x" + keccak(text="Transfer(address,address,uint256)").hex()
+
+
+def address_topic(address: str) -> str:
+    """An address as an indexed event topic"""
+    return "0x" + "0" * 24 + address.lower()[2:]
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Print one purchase trace from the TRACE_FILE written with TRACING=1.
+
+    python trace_report.py                 # latest purchase
+    python trace_report.py <trace id>      # a trace ID (or prefix) from a buy_item result
+    python trace_report.py --tx 0xabc...   # the purchase that paid with this transaction
+    python trace_report.py --list          # recent purchases
+
+Shows the span tree, the critical path (the chain of spans that the purchase
+actually waited on) and how much time each hop spent in its own code, as
+opposed to waiting on its children. For a client span such as
+merchant.quote, that self time is network plus queueing in front of the server.
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from tracing import TRACE_FILE
+
+# Spans from different processes on one host may disagree by a little
+CLOCK_SLACK = 0.001
+
+
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            traces[record["trace_id"]].append(record)
+    return traces
+
+
+def _end(span: Dict[str, Any]) -> float:
+    return span["start"] + span["duration"]
+
+
+def _roots(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    ids = {span["span_id"] for span in spans}
+    return sorted((span for span in spans if span["parent_id"] not in ids), key=lambda span: span["start"])
+
+
+def _children(spans: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    children: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for span in spans:
+        if span["parent_id"]:
+            children[span["parent_id"]].append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span["start"])
+    return children
+
+
+def purchases(traces: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Root ``purchase`` spans, oldest first"""
+    found = [root for spans in traces.values() for root in _roots(spans) if root["name"] == "purchase"]
+    return sorted(found, key=lambda span: span["start"])
+
+
+def find_trace(traces: Dict[str, List[Dict[str, Any]]], trace_id: Optional[str] = None,
+               tx_hash: Optional[str] = None) -> Optional[str]:
+    if trace_id:
+        matches = [tid for tid in traces if tid.startswith(trace_id)]
+        return matches[0] if len(matches) == 1 else None
+    if tx_hash:
+        for tid, spans in traces.items():
+            if any(str(span["attrs"].get("tx_hash", "")).lower() == tx_hash.lower() for span in spans):
+                return tid
+        return None
+    latest = purchases(traces)
+    return latest[-1]["trace_id"] if latest else None
+
+
+def self_times(spans: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Span duration minus the time covered by its children"""
+    children = _children(spans)
+    result = {}
+    for span in spans:
+        covered = 0.0
+        cursor = span["start"]
+        for child in children.get(span["span_id"], []):
+            start = max(child["start"], cursor)
+            end = min(_end(child), _end(span))
+            if end > start:
+                covered += end - start
+                cursor = end
+        result[span["span_id"]] = max(span["duration"] - covered, 0.0)
+    return result
+
+
+def critical_path(span: Dict[str, Any], children: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Walk back from the end of ``span`` through the last-finishing child at each point"""
+    path = [span]
+    cursor = _end(span) + CLOCK_SLACK
+    for child in sorted(children.get(span["span_id"], []), key=_end, reverse=True):
+        if _end(child) <= cursor:
+            path.extend(critical_path(child, children))
+            cursor = child["start"] + CLOCK_SLACK
+    return path
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:9.1f}ms"
+
+
+def _label(span: Dict[str, Any]) -> str:
+    status = "" if span["status"] == "ok" else f"  [{span['status']}]"
+    return f"{span['service']}: {span['name']}{status}"
+
+
+def print_report(spans: List[Dict[str, Any]], out=sys.stdout):
+    children = _children(spans)
+    roots = _roots(spans)
+    origin = roots[0]["start"]
+    own = self_times(spans)
+
+    root = roots[0]
+    print(f"🔎 Trace {root['trace_id']}  ({len(spans)} spans, {root['duration'] * 1000:.1f}ms)", file=out)
+    for key in ("tx_hash", "error"):
+        if root["attrs"].get(key):
+            print(f"   {key}: {root['attrs'][key]}", file=out)
+
+    print("\n🌳 Spans (offset, duration)", file=out)
+
+    def walk(span: Dict[str, Any], depth: int):
+        print(f"{_ms(span['start'] - origin)} {_ms(span['duration'])}  {'  ' * depth}{_label(span)}", file=out)
+        for child in children.get(span["span_id"], []):
+            walk(child, depth + 1)
+
+    for top in roots:
+        walk(top, 0)
+
+    print("\n🚦 Critical path (time on the path spent in each span itself)", file=out)
+    path = sorted(critical_path(root, children), key=lambda span: span["start"])
+    on_path = {span["span_id"] for span in path}
+    for span in path:
+        waited = sum(child["duration"] for child in children.get(span["span_id"], []) if child["span_id"] in on_path)
+        print(f"{_ms(max(span['duration'] - waited, 0.0))}  {_label(span)}", file=out)
+
+    print("\n📊 Per-hop breakdown (self time)", file=out)
+    totals: Dict[tuple, float] = defaultdict(float)
+    counts: Dict[tuple, int] = defaultdict(int)
+    for span in spans:
+        key = (span["service"], span["name"])
+        totals[key] += own[span["span_id"]]
+        counts[key] += 1
+    total = sum(totals.values()) or 1.0
+    for (service, name), seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        calls = f" x{counts[(service, name)]}" if counts[(service, name)] > 1 else ""
+        print(f"{_ms(seconds)} {seconds / total:6.1%}  {service}: {name}{calls}", file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_id", nargs="?", help="trace ID or unique prefix (default: latest purchase)")
+    parser.add_argument("--tx", help="find the purchase by payment transaction hash")
+    parser.add_argument("--file", default=TRACE_FILE, help=f"span file (default: {TRACE_FILE})")
+    parser.add_argument("--list", action="store_true", help="list recent purchases")
+    args = parser.parse_args(argv)
+
+    try:
+        traces = load_traces(args.file)
+    except FileNotFoundError:
+        print(f"❌ No spans at {args.file}; run the agents with TRACING=1", file=sys.stderr)
+        return 1
+
+    if args.list:
+        for span in purchases(traces)[-20:]:
+            outcome = "✅" if span["status"] == "ok" else "❌"
+            print(f"{outcome} {span['trace_id']} {span['duration'] * 1000:9.1f}ms  {span['attrs'].get('tx_hash') or ''}")
+        return 0
+
+    trace_id = find_trace(traces, args.trace_id, args.tx)
+    if trace_id is None:
+        print("❌ No matching trace", file=sys.stderr)
+        return 1
+    print_report(traces[trace_id])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
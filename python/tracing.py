@@ -0,0 +1,271 @@
+"""
+Lightweight distributed tracing for purchases (TRACING=1).
+
+A purchase crosses buy_item, the merchant's /purchase, the RPC send, the
+receipt wait, /retry_purchase and verify_payment. Each hop is a span, and the
+span context travels in a W3C ``traceparent`` header over HTTP and in a
+MetadataContent item over the chat protocol. RPC providers open a span around
+every Web3 call. Finished spans are appended as JSON lines to TRACE_FILE by a
+writer thread. Processes on the same host can share the file, and
+trace_report.py reads it back.
+
+    TRACING=1
+    TRACE_FILE=traces.jsonl
+    TRACE_SAMPLE_RATE=1.0     fraction of new traces that are recorded
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, NamedTuple, Optional
+
+TRACING = os.getenv("TRACING", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+TRACEPARENT = "traceparent"
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """``00-<trace id>-<span id>-<flags>`` to a SpanContext, or None when malformed"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+class Span:
+    """One timed operation; attributes can be added while it is open"""
+
+    __slots__ = ("context", "parent_id", "name", "service", "attrs", "status", "start", "_t0")
+
+    def __init__(self, name: str, service: str, context: SpanContext,
+                 parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.service = service
+        self.context = context
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.status = "ok"
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def trace_id(self) -> str:
+        return self.context.trace_id
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": round(self.start, 6),
+            "duration": round(duration, 6),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class FileExporter:
+    """Appends finished spans to a JSONL file from a writer thread"""
+
+    def __init__(self, path: str, maxsize: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._write_loop, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def export(self, record: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+            # One O_APPEND write per batch keeps lines from different processes intact
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines.encode())
+            finally:
+                os.close(fd)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+
+_exporter: Optional[FileExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> FileExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = FileExporter(TRACE_FILE)
+    return _exporter
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@contextmanager
+def span(name: str, service: Optional[str] = None, parent: Optional[SpanContext] = None, **attrs):
+    """Time a block as a child of the current span (or of ``parent`` from another process)"""
+    if not TRACING:
+        yield _NOOP
+        return
+
+    current = _current_span.get()
+    if parent is None and current is not None:
+        parent = current.context
+    if parent is None:
+        context = SpanContext(_new_id(128), _new_id(64), random.random() < TRACE_SAMPLE_RATE)
+    else:
+        context = SpanContext(parent.trace_id, _new_id(64), parent.sampled)
+    service = service or (current.service if current is not None else "unknown")
+
+    active = Span(name, service, context, parent.span_id if parent else None, attrs)
+    token = _current_span.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        active.status = "error"
+        active.attrs.setdefault("error", str(e) or type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        if context.sampled:
+            get_exporter().export(active.to_dict(time.perf_counter() - active._t0))
+
+
+def current_traceparent() -> Optional[str]:
+    current = _current_span.get()
+    return current.context.traceparent if current is not None else None
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Headers for an outgoing HTTP request, with ``traceparent`` when a span is open"""
+    headers = dict(headers or {})
+    traceparent = current_traceparent()
+    if traceparent:
+        headers[TRACEPARENT] = traceparent
+    return headers
+
+
+# Chat protocol propagation
+
+def inject_chat(message):
+    """Append the current span context to a ChatMessage as MetadataContent"""
+    traceparent = current_traceparent()
+    if traceparent and isinstance(getattr(message, "content", None), list):
+        from uagents_core.contrib.protocols.chat import MetadataContent
+        message.content.append(MetadataContent(metadata={TRACEPARENT: traceparent}))
+    return message
+
+
+def chat_parent(message) -> Optional[SpanContext]:
+    """The span context a ChatMessage was sent from, if it carries one"""
+    for item in getattr(message, "content", None) or ():
+        metadata = getattr(item, "metadata", None)
+        if isinstance(metadata, dict) and TRACEPARENT in metadata:
+            return parse_traceparent(metadata[TRACEPARENT])
+    return None
+
+
+def is_trace_metadata(item) -> bool:
+    metadata = getattr(item, "metadata", None)
+    return isinstance(metadata, dict) and set(metadata) == {TRACEPARENT}
+
+
+# HTTP server spans
+
+class TracingMiddleware:
+    """Pure ASGI middleware: one server span per request, parented by ``traceparent``"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = dict(scope["headers"]).get(TRACEPARENT.encode(), b"").decode("latin-1")
+        with span(f"{scope['method']} {scope['path']}", service=self.service,
+                  parent=parse_traceparent(traceparent), kind="server") as server_span:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    server_span.set(status_code=message["status"])
+                    if message["status"] >= 500:
+                        server_span.status = "error"
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    server_span.name = f"{scope['method']} {route}"
+
+
+def install_tracing(app, service: str):
+    """Add server spans to a FastAPI app when TRACING=1"""
+    if TRACING:
+        app.add_middleware(TracingMiddleware, service=service)
@@ -0,0 +1,153 @@
+"""
+Opt-in traffic capture for the merchant and alice HTTP APIs.
+
+With CAPTURE=1, every request to a captured path is appended to CAPTURE_FILE
+as one JSON record holding the request body, the response status and body,
+the arrival time and the server-side duration. A writer thread appends
+each batch as its own gzip member with one O_APPEND write, so the file stays
+compact, several processes can share it, and a crash loses at most the
+last batch. ``gzip.open`` reads the members back as one stream.
+
+replay_traffic.py drives a capture back at a build under test.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+CAPTURE = os.getenv("CAPTURE", "0") == "1"
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                      "traffic.capture.gz"))
+CAPTURE_PATHS = tuple(path for path in os.getenv(
+    "CAPTURE_PATHS", "/api/chat,/api/chat-protocol,/chat,/goods,/purchase,/retry_purchase").split(",") if path)
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_MAX_BODY = int(os.getenv("CAPTURE_MAX_BODY", "65536"))
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+
+
+def _text(body: bytes) -> str:
+    return body[:CAPTURE_MAX_BODY].decode("utf-8", errors="replace")
+
+
+class CaptureWriter:
+    """Appends captured exchanges to a gzip file from a writer thread"""
+
+    def __init__(self, path: str, maxsize: int = CAPTURE_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def write(self, record: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, gzip.compress(lines.encode(), compresslevel=6))
+            finally:
+                os.close(fd)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+
+_writer: Optional[CaptureWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> CaptureWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = CaptureWriter(CAPTURE_FILE)
+    return _writer
+
+
+class CaptureMiddleware:
+    """Pure ASGI middleware: records request and response bodies without buffering the app"""
+
+    def __init__(self, app, service: str, paths=CAPTURE_PATHS):
+        self.app = app
+        self.service = service
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or random.random() >= CAPTURE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        request_body = bytearray()
+        response_body = bytearray()
+        record: Dict[str, Any] = {
+            "ts": time.time(),
+            "service": self.service,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "content_type": dict(scope["headers"]).get(b"content-type", b"").decode("latin-1"),
+            "status": 500,
+        }
+
+        async def receive_and_record():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < CAPTURE_MAX_BODY:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+            elif message["type"] == "http.response.body" and len(response_body) < CAPTURE_MAX_BODY:
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_and_record, send_and_record)
+        finally:
+            record["duration"] = round(time.perf_counter() - start, 6)
+            record["body"] = _text(request_body)
+            record["response"] = _text(response_body)
+            get_writer().write(record)
+
+
+def install_capture(app, service: str):
+    """Record traffic to a FastAPI app when CAPTURE=1"""
+    if CAPTURE:
+        app.add_middleware(CaptureMiddleware, service=service)
+
+
+def read_capture(path: str) -> Iterator[Dict[str, Any]]:
+    """Captured records in file order; a member cut short by a crash ends the stream"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except (EOFError, gzip.BadGzipFile):
+            return
@@ -0,0 +1,89 @@
+"""
+Indexer for rUSDT Transfer events paid to the merchant.
+
+Walks the chain in block ranges with ``eth_getLogs`` (filtered on the Transfer
+topic and the merchant as recipient) and stores every match in the shared
+MerchantStore, so payment verification in any worker is a local lookup.
+Exactly one process should run it.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from web3 import Web3
+
+from merchant_store import MerchantStore
+from token_events import TRANSFER_TOPIC, address_topic
+
+INDEXER_POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", "5"))
+INDEXER_BLOCK_RANGE = int(os.getenv("INDEXER_BLOCK_RANGE", "2000"))
+INDEXER_CONFIRMATIONS = int(os.getenv("INDEXER_CONFIRMATIONS", "0"))
+
+logger = logging.getLogger("merchant.indexer")
+
+class TransferIndexer:
+    """Keeps the store's transfer table in sync with the chain"""
+
+    def __init__(self, w3: Web3, token, recipient: str, store: MerchantStore,
+                 poll_interval: float = INDEXER_POLL_INTERVAL,
+                 block_range: int = INDEXER_BLOCK_RANGE,
+                 confirmations: int = INDEXER_CONFIRMATIONS,
+                 start_block: Optional[int] = None):
+        self.w3 = w3
+        self.token = token
+        self.recipient = recipient
+        self.store = store
+        self.poll_interval = poll_interval
+        self.block_range = block_range
+        self.confirmations = confirmations
+        self.start_block = start_block
+
+    def sync_once(self) -> int:
+        """Index every block up to the confirmed head; returns the number of new transfers"""
+        head = self.w3.eth.block_number - self.confirmations
+        last = self.store.last_indexed_block()
+        if last is not None:
+            start = last + 1
+        elif self.start_block is not None:
+            start = self.start_block
+        else:
+            start = max(head - self.block_range + 1, 0)
+
+        indexed = 0
+        event = self.token.events.Transfer()
+        while start <= head:
+            end = min(start + self.block_range - 1, head)
+            logs = self.w3.eth.get_logs({
+                "address": self.token.address,
+                "fromBlock": start,
+                "toBlock": end,
+                "topics": [TRANSFER_TOPIC, None, address_topic(self.recipient)],
+            })
+            rows = []
+            for log in logs:
+                decoded = event.process_log(log)
+                rows.append((
+                    Web3.to_hex(log["transactionHash"]),
+                    log["logIndex"],
+                    decoded["args"]["from"],
+                    decoded["args"]["to"],
+                    decoded["args"]["value"],
+                    log["blockNumber"],
+                ))
+            self.store.record_transfers(rows, end)
+            indexed += len(rows)
+            start = end + 1
+        return indexed
+
+    async def run(self):
+        """Poll forever on the running loop; RPC work happens in a worker thread"""
+        while True:
+            try:
+                indexed = await asyncio.to_thread(self.sync_once)
+                if indexed:
+                    logger.info("Indexed new rUSDT transfers", extra={"transfers": indexed})
+            except Exception as e:
+                logger.warning("Transfer indexer error", extra={"error": str(e)})
+            await asyncio.sleep(self.poll_interval)